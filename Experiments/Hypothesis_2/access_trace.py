@@ -0,0 +1,184 @@
+import re
+import os
+import glob
+import json
+import mmap
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# Regular expression to extract key and address (hex digits only, parsed as 64-bit integers)
+KEY_PATTERN = re.compile(rb"Key: (\d+), address: 0x([0-9a-fA-F]+)")
+QUERY_PATTERN = b"/points/query"
+# One match per query boundary or key line; group 1 is an optional `docker logs -t` timestamp
+TRACE_PATTERN = re.compile(
+    rb"(?m)^(?:(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?)Z? )?[^\n]*?(?:(/points/query)|Key: (\d+), address: 0x([0-9a-fA-F]+))")
+
+TRACE_COLUMNS = ("query", "key", "address", "timestamp")
+TRACE_DTYPES = {"query": np.uint32, "key": np.uint64, "address": np.uint64, "timestamp": np.float64}
+
+
+def find_query_limit_offset(mm, query_limit):
+    """Return (end offset, query count) for the analysis window.
+
+    Like the line-by-line scan, analysis stops at the start of the line holding the
+    query_limit-th '/points/query'; if the limit is never reached the whole log is used.
+    """
+    pos = 0
+    query_count = 0
+    while query_count < query_limit:
+        pos = mm.find(QUERY_PATTERN, pos)
+        if pos < 0:
+            return len(mm), query_count
+        query_count += 1
+        pos += len(QUERY_PATTERN)
+        if query_count % 10000 == 0:
+            print(f"Found {query_count} '/points/query' lines so far...", flush=True)
+    print(f"Query limit of {query_limit} reached. Stopping analysis.", flush=True)
+    return mm.rfind(b"\n", 0, pos) + 1, query_count
+
+
+# Split [0, end) into ~chunk_size pieces that start and stop on line boundaries
+def split_chunks(mm, end, chunk_size):
+    chunks = []
+    start = 0
+    while start < end:
+        stop = min(start + chunk_size, end)
+        if stop < end:
+            newline = mm.find(b"\n", stop, end)
+            stop = end if newline < 0 else newline + 1
+        chunks.append((start, stop))
+        start = stop
+    return chunks
+
+
+def read_chunk(file_path, start, end):
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return mm[start:end]
+
+
+def reduce_counts(keys, addresses, counts, first):
+    """Sum counts of identical (key, address) pairs, keeping the earliest occurrence."""
+    order = np.argsort(first, kind="stable")
+    pairs = np.ascontiguousarray(np.column_stack((keys[order], addresses[order])))
+    _, index, inverse = np.unique(pairs.view(np.dtype((np.void, 16))).ravel(), return_index=True, return_inverse=True)
+    summed = np.bincount(inverse.ravel(), weights=counts[order], minlength=len(index)).astype(np.int64)
+    return pairs[index, 0], pairs[index, 1], summed, first[order][index]
+
+
+def parse_trace_chunk(file_path, start, end, with_timestamps=False):
+    """Parse one chunk into trace columns with the query index local to the chunk."""
+    data = read_chunk(file_path, start, end)
+    matches = TRACE_PATTERN.findall(data)
+    del data
+
+    is_query = np.fromiter((bool(marker) for _, marker, _, _ in matches), dtype=bool, count=len(matches))
+    local_query = np.cumsum(is_query, dtype=np.uint32)[~is_query]
+    accesses = [match for match, query in zip(matches, is_query) if not query]
+    columns = {
+        "query": local_query,
+        "key": np.array([key for _, _, key, _ in accesses], dtype=np.bytes_).astype(np.uint64),
+        "address": np.fromiter((int(address, 16) for _, _, _, address in accesses), dtype=np.uint64, count=len(accesses)),
+    }
+    if with_timestamps:
+        stamps = np.array([stamp.decode() or "NaT" for stamp, _, _, _ in accesses], dtype="datetime64[ns]")
+        columns["timestamp"] = np.where(np.isnat(stamps), np.nan, stamps.astype(np.int64) / 1e9)
+    return columns, int(is_query.sum())
+
+
+def convert_log(file_path, trace_dir, query_limit=10000, workers=None, chunk_size=64 << 20, with_timestamps=False):
+    """Convert a vectorDB container log into a columnar binary trace directory.
+
+    Each chunk becomes part-NNNNN.<column>.npy (query: uint32, key/address: uint64,
+    timestamp: float64 seconds when --timestamps is given). `query` is the number of
+    '/points/query' lines seen before the access, i.e. the query it belongs to.
+    """
+    workers = workers or os.cpu_count()
+    os.makedirs(trace_dir, exist_ok=True)
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        end, query_count = find_query_limit_offset(mm, query_limit)
+        chunks = split_chunks(mm, end, chunk_size)
+    print(f"Converting {end} bytes in {len(chunks)} chunks with {workers} workers", flush=True)
+
+    query_offset = 0
+    access_count = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(parse_trace_chunk, file_path, start, stop, with_timestamps) for start, stop in chunks]
+        # Results are consumed in file order, so the running query offset is known here
+        for part, future in enumerate(futures):
+            columns, chunk_queries = future.result()
+            columns["query"] = columns["query"] + np.uint32(query_offset)
+            for name, values in columns.items():
+                np.save(os.path.join(trace_dir, f"part-{part:05d}.{name}.npy"), values.astype(TRACE_DTYPES[name]))
+            query_offset += chunk_queries
+            access_count += len(columns["key"])
+            if (part + 1) % workers == 0:
+                print(f"Converted {part + 1}/{len(chunks)} chunks", flush=True)
+
+    meta = {
+        "source": os.path.abspath(file_path),
+        "parts": len(chunks),
+        "columns": [name for name in TRACE_COLUMNS if with_timestamps or name != "timestamp"],
+        "accesses": access_count,
+        "queries": query_count,
+    }
+    with open(os.path.join(trace_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    print(f"Trace with {access_count} accesses over {query_count} queries saved to {trace_dir}", flush=True)
+    return meta
+
+
+def load_trace(trace_dir, columns=("query", "key", "address"), mmap_mode="r"):
+    """Load trace columns as arrays (parts are memory-mapped, then concatenated)."""
+    trace = {}
+    for name in columns:
+        parts = sorted(glob.glob(os.path.join(trace_dir, f"part-*.{name}.npy")))
+        if not parts:
+            raise FileNotFoundError(f"No '{name}' column in trace {trace_dir}")
+        arrays = [np.load(part, mmap_mode=mmap_mode) for part in parts]
+        trace[name] = np.concatenate(arrays) if len(arrays) > 1 else np.asarray(arrays[0])
+    return trace
+
+
+# Access count per (key, address), sorted by count descending with first-seen tie-break
+def count_accesses(trace):
+    keys = np.asarray(trace["key"], dtype=np.uint64)
+    addresses = np.asarray(trace["address"], dtype=np.uint64)
+    keys, addresses, counts, first = reduce_counts(
+        keys, addresses, np.ones(len(keys), dtype=np.int64), np.arange(len(keys), dtype=np.uint64))
+    order = np.lexsort((first, -counts))
+    return keys[order], addresses[order], counts[order]
+
+
+def save_access_counts(path, keys, addresses, counts):
+    np.savez(path, keys=keys, addresses=addresses, counts=counts)
+
+
+def load_access_counts(path):
+    """Return (keys, addresses, counts) from a trace directory, a counts .npz or the legacy CSV."""
+    if os.path.isdir(path):
+        return count_accesses(load_trace(path, columns=("key", "address")))
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return data["keys"], data["addresses"], data["counts"]
+    df = pd.read_csv(path, usecols=["Key", "Address", "Access Count"], dtype={"Address": str})
+    addresses = np.fromiter((int(address, 16) for address in df["Address"]), dtype=np.uint64, count=len(df))
+    return df["Key"].to_numpy(dtype=np.uint64), addresses, df["Access Count"].to_numpy(dtype=np.int64)
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectordb-file-path", type=str, required=True, help="Path to the vectorDB log file")
+    parser.add_argument("--trace-dir", type=str, required=True, help="Output directory for the binary trace")
+    parser.add_argument("--query-limit", type=int, default=10000, help="Limit the trace to a certain number of queries")
+    parser.add_argument("--workers", type=int, default=None, help="Number of parser processes (default: all CPUs)")
+    parser.add_argument("--chunk-size-mb", type=int, default=64, help="Size of the log chunk handed to each parser task")
+    parser.add_argument("--timestamps", action="store_true", default=False, help="Keep `docker logs -t` timestamps as a column")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argument_parser()
+    convert_log(args.vectordb_file_path, args.trace_dir, args.query_limit, args.workers,
+                args.chunk_size_mb << 20, args.timestamps)
@@ -1,56 +1,89 @@
-import re
-from collections import defaultdict, Counter
-import csv
+import os
+import mmap
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from access_trace import (KEY_PATTERN, find_query_limit_offset, split_chunks, read_chunk, reduce_counts,
+                          load_trace, count_accesses, save_access_counts)
 
-def analyze_address_access(file_path, query_limit=10000):
-    # Regular expression to extract key and address
-    pattern = re.compile(r"Key: (\d+), address: (0x[0-9a-fA-F]+)")
-    query_pattern = "/points/query"
 
-    # Dictionary to store access counts per address
-    address_access_count = defaultdict(int)
+def parse_chunk(file_path, chunk_index, start, end):
+    data = read_chunk(file_path, start, end)
+    matches = KEY_PATTERN.findall(data)
+    line_count = data.count(b"\n")
+    del data
+
+    keys = np.array([key for key, _ in matches], dtype=np.bytes_).astype(np.uint64)
+    addresses = np.fromiter((int(address, 16) for _, address in matches), dtype=np.uint64, count=len(matches))
+    # Global occurrence order: chunks are in file order, matches in chunk order
+    first = (np.uint64(chunk_index) << np.uint64(32)) + np.arange(len(matches), dtype=np.uint64)
+    counts = np.ones(len(matches), dtype=np.int64)
+    return reduce_counts(keys, addresses, counts, first) + (line_count, len(matches))
+
+
+def analyze_address_access(file_path, query_limit=10000, workers=None, chunk_size=64 << 20):
+    workers = workers or os.cpu_count()
+
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        print(f"file opened")
+        end, query_count = find_query_limit_offset(mm, query_limit)
+        chunks = split_chunks(mm, end, chunk_size)
+    print(f"Parsing {end} bytes in {len(chunks)} chunks with {workers} workers", flush=True)
+
     total_lines = 0
     key_lines = 0
-    query_count = 0
+    pending = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(parse_chunk, file_path, i, start, stop) for i, (start, stop) in enumerate(chunks)]
+        for done, future in enumerate(futures, start=1):
+            keys, addresses, counts, first, line_count, match_count = future.result()
+            total_lines += line_count
+            key_lines += match_count
+            pending.append((keys, addresses, counts, first))
+            # Fold partial results regularly so memory stays bounded by the number of unique pairs
+            if len(pending) >= 2 * workers or done == len(futures):
+                pending = [reduce_counts(*(np.concatenate(column) for column in zip(*pending)))]
+            if done % workers == 0:
+                print(f"Parsed {done}/{len(chunks)} chunks", flush=True)
 
-    with open(file_path, 'r') as file:
-        print(f"file opened")
-        for line in file:
-            total_lines += 1
-
-            # Check for "/points/query"
-            if query_pattern in line:
-                query_count += 1
-                # Print progress every 10 queries
-                if query_count % 10 == 0:
-                    print(f"Processed {query_count} '/points/query' lines so far...")
-
-                if query_count >= query_limit:
-                    print(f"Query limit of {query_limit} reached. Stopping analysis.")
-                    break
-
-            # Check for key and address patterns
-            match = pattern.search(line)
-            if match:
-                key_lines += 1
-                key, address_hex = match.groups()
-                # Increment the count for the specific address
-                address_access_count[(key, address_hex)] += 1
-
-    # sort address_access_count by count value
-    sorted_address_access_count = dict(sorted(address_access_count.items(), key=lambda item: item[1], reverse=True))
+    if pending:
+        keys, addresses, counts, first = pending[0]
+    else:
+        keys = addresses = first = np.empty(0, dtype=np.uint64)
+        counts = np.empty(0, dtype=np.int64)
+
+    # sort by count value (descending), ties in order of first appearance
+    order = np.lexsort((first, -counts))
+    keys, addresses, counts = keys[order], addresses[order], counts[order]
 
     # Calculate the total number of unique addresses
-    total_unique_addresses = len(address_access_count)
+    total_unique_addresses = len(counts)
+
+    return (keys, addresses, counts), total_lines, key_lines, total_unique_addresses, query_count
+
+
+def write_access_count_csv(csv_output_file, keys, addresses, counts, block=1 << 20):
+    with open(csv_output_file, "w", newline='') as csvfile:
+        csvfile.write("Rank,Key,Address,Access Count\r\n")
+        for start in range(0, len(counts), block):
+            stop = min(start + block, len(counts))
+            csvfile.write("".join(
+                f"{rank},{key},{hex(address)},{count}\r\n"
+                for rank, key, address, count in zip(
+                    range(start + 1, stop + 1),
+                    keys[start:stop].tolist(), addresses[start:stop].tolist(), counts[start:stop].tolist())
+            ))
 
-    return sorted_address_access_count, total_lines, key_lines, total_unique_addresses, query_count
 
 def argument_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument("--vectordb-file-path", type=str, help="Path to the vectorDB log file")
+    parser.add_argument("--trace-dir", type=str, default=None, help="Read a binary trace from access_trace.py instead of the log")
+    parser.add_argument("--counts-output", type=str, default=None, help="Also save the sorted counts as a binary .npz")
     parser.add_argument("--query-limit", type=int, default=10000, help="Limit the analysis to a certain number of queries")
     parser.add_argument("--csv-output-file", type=str, default="access_count_sorted.csv", help="Output file for sorted address access count")
+    parser.add_argument("--workers", type=int, default=None, help="Number of parser processes (default: all CPUs)")
+    parser.add_argument("--chunk-size-mb", type=int, default=64, help="Size of the log chunk handed to each parser task")
     args = parser.parse_args()
     return args
 
@@ -61,15 +94,22 @@ if __name__ == "__main__":
 
     print(f"starting")
 
-    sorted_address_access_count, total_lines, key_lines, total_unique_addresses, query_count = analyze_address_access(vectordb_file_path, query_limit)
+    if args.trace_dir:
+        trace = load_trace(args.trace_dir, columns=("query", "key", "address"))
+        in_window = trace["query"] < query_limit
+        keys, addresses, counts = count_accesses({name: values[in_window] for name, values in trace.items()})
+        print(f"Accesses: {int(in_window.sum())}, unique addresses: {len(counts)}")
+    else:
+        (keys, addresses, counts), total_lines, key_lines, total_unique_addresses, query_count = analyze_address_access(
+            vectordb_file_path, query_limit, args.workers, args.chunk_size_mb << 20)
+        print(f"Lines: {total_lines}, key lines: {key_lines}, unique addresses: {total_unique_addresses}, queries: {query_count}")
 
     # Save the results to a CSV file
-    csv_output_file = "access_count_sorted.csv"
-    with open(csv_output_file, "w", newline='') as csvfile:
-        csv_writer = csv.writer(csvfile)
-        csv_writer.writerow(["Rank","Key", "Address", "Access Count"])
+    csv_output_file = args.csv_output_file
+    write_access_count_csv(csv_output_file, keys, addresses, counts)
+
+    print(f"Results saved to {csv_output_file}")
 
-        for rank, ((key, address), count) in enumerate(sorted_address_access_count.items(), start=1):
-            csv_writer.writerow([rank, key, address, count])
-    
-    print(f"Results saved to {csv_output_file}")
\ No newline at end of file
+    if args.counts_output:
+        save_access_counts(args.counts_output, keys, addresses, counts)
+        print(f"Binary counts saved to {args.counts_output}")
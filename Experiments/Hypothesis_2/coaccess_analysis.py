@@ -0,0 +1,273 @@
+import argparse
+import numpy as np
+from access_trace import load_trace
+from hot_page_analysis import PAGE_SIZE, VECTOR_DIM, ELEMENT_SIZE, split_vectors_over_pages
+
+
+class CountMinSketch:
+    """Count-min sketch over uint64 items (multiply-shift hashing, power-of-two width).
+
+    Estimates never undercount; with `width` counters per row the overcount is
+    at most ~e/width of the total with probability 1 - exp(-depth).
+    """
+
+    def __init__(self, width=1 << 22, depth=4, seed=0):
+        if width & (width - 1):
+            raise ValueError("Count-min sketch width must be a power of two")
+        rng = np.random.default_rng(seed)
+        self.shift = np.uint64(64 - int(np.log2(width)))
+        self.a = rng.integers(1, 1 << 63, depth, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 1 << 63, depth, dtype=np.uint64)
+        self.table = np.zeros((depth, width), dtype=np.uint32)
+
+    def _buckets(self, items):
+        items = np.asarray(items, dtype=np.uint64)
+        return ((self.a[:, None] * items[None, :] + self.b[:, None]) >> self.shift).astype(np.int64)
+
+    def add(self, items):
+        for row, buckets in zip(self.table, self._buckets(items)):
+            np.add.at(row, buckets, 1)
+
+    def estimate(self, items):
+        buckets = self._buckets(items)
+        return np.min(self.table[np.arange(len(self.table))[:, None], buckets], axis=0)
+
+
+def pair_items(a, b):
+    low, high = np.minimum(a, b), np.maximum(a, b)
+    return (low << np.uint64(32)) ^ high
+
+
+def query_access_sets(query, keys):
+    """Per-query access sets in traversal order (first touch of each key): (query ids, indptr, keys)."""
+    pairs = np.ascontiguousarray(np.column_stack((np.asarray(query, dtype=np.uint64), np.asarray(keys, dtype=np.uint64))))
+    _, first = np.unique(pairs.view(np.dtype((np.void, 16))).ravel(), return_index=True)
+    first = np.sort(first)
+    query, keys = pairs[first, 0], pairs[first, 1]
+    query_ids, starts = np.unique(query, return_index=True)
+    return query_ids, np.append(starts, len(keys)), keys
+
+
+def reuse_distances(query, items):
+    """Queries between consecutive touches of the same item; first touches are not included.
+
+    `query`/`items` are unique (query, item) touches.
+    """
+    order = np.lexsort((query, items))
+    query, items = query[order].astype(np.int64), items[order]
+    same = items[1:] == items[:-1]
+    return (query[1:] - query[:-1])[same]
+
+
+def working_set_sizes(query, items, window, query_count):
+    """Distinct items touched in every window of `window` consecutive queries.
+
+    A touch at query q whose previous touch of the same item was at p adds the
+    item to the windows starting in [max(q - window + 1, p + 1), q].
+    """
+    if query_count < window:
+        return np.empty(0, dtype=np.int64)
+    order = np.lexsort((query, items))
+    query, items = query[order].astype(np.int64), items[order]
+    previous = np.full(len(query), -1, dtype=np.int64)
+    same = np.flatnonzero(items[1:] == items[:-1]) + 1
+    previous[same] = query[same - 1]
+    low = np.maximum(np.maximum(query - window + 1, previous + 1), 0)
+    diff = np.bincount(low, minlength=query_count + 1) - np.bincount(query + 1, minlength=query_count + 1)
+    return np.cumsum(diff)[:query_count - window + 1]
+
+
+def hot_positions(hot_keys, keys):
+    """Index of every key in the sorted `hot_keys`, -1 for keys that are not hot."""
+    if len(hot_keys) == 0:
+        return np.full(len(keys), -1, dtype=np.int64)
+    position = np.minimum(np.searchsorted(hot_keys, keys), len(hot_keys) - 1)
+    return np.where(hot_keys[position] == keys, position, -1)
+
+
+def windowed_pairs(query_ids, indptr, keys, window=16, block_queries=1000):
+    """(a, b) key pairs within `window` positions of a query's traversal path, one block of queries and distance at a time."""
+    for block in range(0, len(query_ids), block_queries):
+        stop = min(block + block_queries, len(query_ids))
+        path = keys[indptr[block]:indptr[stop]]
+        owner = np.repeat(np.arange(block, stop), np.diff(indptr[block:stop + 1]))
+        for distance in range(1, min(window, len(path) - 1) + 1):
+            same = owner[:-distance] == owner[distance:]
+            yield path[:-distance][same], path[distance:][same]
+
+
+def build_coaccess_graph(query_ids, indptr, keys, hot_keys, window=16, top_k=8, block_queries=1000, sketch=None):
+    """Co-access counts for pairs within `window` positions of a query's traversal path.
+
+    Pairs of hot keys are counted exactly in a dense len(hot_keys)^2 matrix, every
+    pair also goes into the count-min sketch for the long tail (see tail_neighbours).
+    Returns the top_k neighbours per hot key (as hot-key indices, -1 when missing),
+    their weights and the fraction of each hot key's co-access weight they cover.
+    Only the pair counting runs in blocks; the access sets are held in memory.
+    """
+    hot_count = len(hot_keys)
+    matrix = np.zeros((hot_count, hot_count), dtype=np.uint32)
+    total_pairs = 0
+    for a, b in windowed_pairs(query_ids, indptr, keys, window, block_queries):
+        total_pairs += len(a)
+        if sketch is not None:
+            sketch.add(pair_items(a, b))
+        ha, hb = hot_positions(hot_keys, a), hot_positions(hot_keys, b)
+        both = (ha >= 0) & (hb >= 0)
+        flat, counts = np.unique(np.concatenate((ha[both] * hot_count + hb[both], hb[both] * hot_count + ha[both])),
+                                 return_counts=True)
+        matrix.flat[flat] += counts.astype(np.uint32)
+
+    k = min(top_k, hot_count)
+    if k == 0:
+        return (np.full((hot_count, 0), -1, dtype=np.int64), np.zeros((hot_count, 0), dtype=np.uint32),
+                np.zeros(hot_count), total_pairs)
+    neighbours = np.argpartition(-matrix.astype(np.int64), k - 1, axis=1)[:, :k]
+    weights = np.take_along_axis(matrix, neighbours, axis=1)
+    order = np.argsort(-weights.astype(np.int64), axis=1, kind="stable")
+    neighbours, weights = np.take_along_axis(neighbours, order, axis=1), np.take_along_axis(weights, order, axis=1)
+    neighbours = np.where(weights > 0, neighbours, -1)
+    row_total = matrix.sum(axis=1, dtype=np.int64)
+    coverage = np.divide(weights.sum(axis=1, dtype=np.int64), row_total, out=np.zeros(hot_count), where=row_total > 0)
+    return neighbours, weights, coverage, total_pairs
+
+
+def tail_neighbours(query_ids, indptr, keys, hot_keys, sketch, window=16, top_k=8, block_queries=1000, min_count=2):
+    """Top-k neighbours of every key that is not hot, scored with the filled count-min sketch.
+
+    A second pass over the same windowed pairs collects each tail key's
+    candidates; only the running top_k per key is kept between blocks, so the
+    table stays at most (tail keys) x top_k. Estimates can only overcount, so
+    candidates below `min_count` are dropped. Returns (tail keys, neighbour keys,
+    estimates), with -1 / 0 padding for keys with fewer than top_k neighbours.
+    """
+    kept_keys = np.empty(0, dtype=np.uint64)
+    kept_neighbours = np.empty(0, dtype=np.uint64)
+    kept_estimates = np.empty(0, dtype=np.int64)
+    for a, b in windowed_pairs(query_ids, indptr, keys, window, block_queries):
+        key, neighbour = np.concatenate((a, b)), np.concatenate((b, a))
+        tail = hot_positions(hot_keys, key) < 0
+        candidates = np.unique(np.column_stack((key[tail], neighbour[tail])).astype(np.uint64), axis=0)
+        if len(candidates) == 0:
+            continue
+        estimates = sketch.estimate(pair_items(candidates[:, 0], candidates[:, 1])).astype(np.int64)
+        keep = estimates >= min_count
+        merged = np.unique(np.concatenate((np.column_stack((kept_keys, kept_neighbours)), candidates[keep])), axis=0,
+                           return_index=True)[1]
+        all_keys = np.concatenate((kept_keys, candidates[keep, 0]))[merged]
+        all_neighbours = np.concatenate((kept_neighbours, candidates[keep, 1]))[merged]
+        all_estimates = np.concatenate((kept_estimates, estimates[keep]))[merged]
+        order = np.lexsort((-all_estimates, all_keys))
+        all_keys, all_neighbours, all_estimates = all_keys[order], all_neighbours[order], all_estimates[order]
+        starts = np.flatnonzero(np.r_[True, all_keys[1:] != all_keys[:-1]])
+        rank = np.arange(len(all_keys)) - np.repeat(starts, np.diff(np.r_[starts, len(all_keys)]))
+        top = rank < top_k
+        kept_keys, kept_neighbours, kept_estimates = all_keys[top], all_neighbours[top], all_estimates[top]
+
+    tail_keys, starts = np.unique(kept_keys, return_index=True)
+    rank = np.arange(len(kept_keys)) - np.repeat(starts, np.diff(np.r_[starts, len(kept_keys)]))
+    row = np.repeat(np.arange(len(tail_keys)), np.diff(np.r_[starts, len(kept_keys)]))
+    neighbours = np.full((len(tail_keys), top_k), -1, dtype=np.int64)
+    estimates = np.zeros((len(tail_keys), top_k), dtype=np.int64)
+    neighbours[row, rank] = kept_neighbours.astype(np.int64)
+    estimates[row, rank] = kept_estimates
+    return tail_keys, neighbours, estimates
+
+
+def print_distribution(label, values, unit=""):
+    if len(values) == 0:
+        print(f"{label}: n/a")
+        return
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    print(f"{label}: mean {np.mean(values):.1f}{unit}, P50 {p50:.0f}{unit}, P90 {p90:.0f}{unit}, "
+          f"P99 {p99:.0f}{unit}, max {np.max(values):.0f}{unit}")
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trace-dir", type=str, required=True, help="Binary trace directory from access_trace.py")
+    parser.add_argument("--query-limit", type=int, default=None, help="Only analyze the first N queries")
+    parser.add_argument("--hot-keys", type=int, default=4096, help="Keys with exact co-access counts (dense matrix, 4 B per pair)")
+    parser.add_argument("--top-k", type=int, default=8, help="Neighbours kept per key")
+    parser.add_argument("--tail-min-count", type=int, default=2, help="Minimum sketch estimate for a tail-key neighbour")
+    parser.add_argument("--window", type=int, default=16, help="Positions along a query's traversal path that count as co-accessed")
+    parser.add_argument("--block-queries", type=int, default=1000,
+                        help="Queries per block of pair counting (the trace and access sets are loaded whole)")
+    parser.add_argument("--sketch-width", type=int, default=1 << 22, help="Count-min sketch counters per row (power of two)")
+    parser.add_argument("--sketch-depth", type=int, default=4, help="Count-min sketch rows")
+    parser.add_argument("--windows", type=int, nargs="+", default=[1, 10, 100, 1000], help="Sliding window sizes in queries")
+    parser.add_argument("--vector-dim", type=int, default=VECTOR_DIM, help="Embedding dimension")
+    parser.add_argument("--element-size", type=int, default=ELEMENT_SIZE, help="Bytes per vector element")
+    parser.add_argument("--vector-size", type=int, default=None, help="Vector size in bytes (overrides --vector-dim * --element-size)")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="Page size in bytes")
+    parser.add_argument("--sets-output", type=str, default=None, help="Save the per-query access sets (CSR) as .npz")
+    parser.add_argument("--output", type=str, default="coaccess_graph.npz", help="Top-k neighbour table, sketch and locality curves")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argument_parser()
+    vector_size = args.vector_size or args.vector_dim * args.element_size
+
+    trace = load_trace(args.trace_dir, columns=("query", "key", "address"))
+    if args.query_limit is not None:
+        in_window = trace["query"] < args.query_limit
+        trace = {name: values[in_window] for name, values in trace.items()}
+    query, keys, addresses = trace["query"], trace["key"], trace["address"]
+
+    query_ids, indptr, path_keys = query_access_sets(query, keys)
+    path_lengths = np.diff(indptr)
+    query_count = int(query_ids.max()) + 1 if len(query_ids) else 0
+    print(f"Accesses: {len(keys)}, queries with accesses: {len(query_ids)}, distinct keys: {len(np.unique(path_keys))}")
+    print_distribution("Distinct keys per query", path_lengths)
+    if args.sets_output:
+        np.savez(args.sets_output, query_ids=query_ids, indptr=indptr, keys=path_keys)
+        print(f"Per-query access sets saved to {args.sets_output}")
+
+    # Hot keys: most frequent in the per-query sets, i.e. touched by the most queries
+    unique_keys, query_touches = np.unique(path_keys, return_counts=True)
+    hot_keys = np.sort(unique_keys[np.argsort(-query_touches, kind="stable")[:args.hot_keys]])
+    sketch = CountMinSketch(args.sketch_width, args.sketch_depth)
+    neighbours, weights, coverage, total_pairs = build_coaccess_graph(
+        query_ids, indptr, path_keys, hot_keys, args.window, args.top_k, args.block_queries, sketch)
+    print(f"Co-access pairs (window {args.window}): {total_pairs}, hot keys: {len(hot_keys)}, "
+          f"sketch {args.sketch_depth}x{args.sketch_width} ({sketch.table.nbytes / (1 << 20):.0f} MB)")
+    print_distribution(f"Share of co-access weight in top-{args.top_k} neighbours (%)", coverage[coverage > 0] * 100)
+    hot_by_touches = np.searchsorted(hot_keys, unique_keys[np.argsort(-query_touches, kind="stable")[:5]])
+    for index in hot_by_touches:
+        pairs = [f"{hot_keys[n]}({w})" for n, w in zip(neighbours[index], weights[index]) if n >= 0]
+        print(f"  Key {hot_keys[index]}: {', '.join(pairs)}")
+
+    # Long tail: neighbours of the remaining keys from the sketch
+    tail_keys, tail_topk, tail_estimates = tail_neighbours(
+        query_ids, indptr, path_keys, hot_keys, sketch, args.window, args.top_k, args.block_queries, args.tail_min_count)
+    print(f"Tail keys with sketch neighbours (estimate >= {args.tail_min_count}): {len(tail_keys)}")
+    if args.top_k > 0:
+        print_distribution("Estimated weight of the top tail neighbour", tail_estimates[:, 0])
+    results_tail = {"tail_keys": tail_keys, "tail_topk_keys": tail_topk, "tail_topk_estimates": tail_estimates}
+
+    # Reuse distance and working sets, at key and page granularity
+    touch_query = np.repeat(query_ids, path_lengths)
+    distances = reuse_distances(touch_query, path_keys)
+    print_distribution("Reuse distance (queries)", distances)
+    for limit in (1, 10, 100):
+        print(f"  Reused within {limit} queries: {np.mean(distances <= limit) * 100 if len(distances) else 0:.1f}% of reuses")
+
+    vector_index, pages, _ = split_vectors_over_pages(addresses, vector_size, args.page_size)
+    page_touches = np.unique(np.column_stack((np.asarray(query, dtype=np.uint64)[vector_index], pages)), axis=0)
+    results = {"hot_keys": hot_keys, "topk_keys": np.where(neighbours >= 0, hot_keys[np.maximum(neighbours, 0)], 0),
+               "topk_weights": weights, "topk_coverage": coverage, "reuse_distance": distances,
+               "sketch_table": sketch.table, "sketch_a": sketch.a, "sketch_b": sketch.b, **results_tail}
+    print(f"{'window':>7} {'keys mean':>10} {'keys max':>9} {'MB mean':>8} {'pages mean':>11} {'pages max':>10} {'MB mean':>8}")
+    for window in args.windows:
+        key_set = working_set_sizes(touch_query, path_keys, window, query_count)
+        page_set = working_set_sizes(page_touches[:, 0], page_touches[:, 1], window, query_count)
+        results[f"working_set_keys_{window}"] = key_set
+        results[f"working_set_pages_{window}"] = page_set
+        if len(key_set) == 0:
+            continue
+        print(f"{window:>7} {key_set.mean():>10.1f} {key_set.max():>9} {key_set.mean() * vector_size / (1 << 20):>8.1f} "
+              f"{page_set.mean():>11.1f} {page_set.max():>10} {page_set.mean() * args.page_size / (1 << 20):>8.1f}")
+
+    np.savez(args.output, **results)
+    print(f"Results saved to {args.output}")
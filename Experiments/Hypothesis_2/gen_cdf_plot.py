@@ -2,6 +2,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 import argparse
+from access_trace import load_access_counts
 
 def set_plot_style():
     """Plot style config"""
@@ -33,9 +34,9 @@ def plot_normalized_distributions(
 
     fig, ax = plt.subplots(figsize=(8, 4))
 
-    df = pd.read_csv(csv_file)
-    x = np.linspace(1, len(df), len(df))
-    cdf = df['Access Count'].cumsum() / df['Access Count'].sum()
+    _, _, counts = load_access_counts(csv_file)
+    x = np.linspace(1, len(counts), len(counts))
+    cdf = np.cumsum(counts) / counts.sum()
     ax.plot(x, cdf, 
             '-',
             color=color,
@@ -75,23 +76,19 @@ def plot_normalized_distributions(
     print(f"Graph saved as '{output_file}'")
 
 def print_half_access_info(csv_file):
-    df = pd.read_csv(csv_file)
+    _, _, counts = load_access_counts(csv_file)
     portion = 55
-    total_access = df['Access Count'].sum()
+    total_access = counts.sum()
     threshold = total_access * portion * 0.01
-    df = df.sort_values(by='Access Count', ascending=False)
-    cumulative = 0
-    count = 0
-    for freq in df['Access Count']:
-        cumulative += freq
-        count += 1
-        if cumulative >= threshold:
-            print(f"{csv_file}: {count} addresses for {portion}% access.")
-            break
+    cumulative = np.cumsum(np.sort(counts)[::-1])
+    count = int(np.searchsorted(cumulative, threshold)) + 1
+    if count <= len(counts):
+        print(f"{csv_file}: {count} addresses for {portion}% access.")
 
 def argument_parser():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--csv-file", type=str, required=True, help="CSV file containing address access count")
+    parser.add_argument("--csv-file", "--counts-file", dest="csv_file", type=str, required=True,
+                        help="Address access counts: CSV, binary .npz or trace directory (see access_trace.py)")
     return parser.parse_args()
 
 if __name__ == "__main__":
@@ -1,66 +1,72 @@
-import re
-from collections import defaultdict, Counter
 import argparse
-import csv
-import pandas as pd
-
-PAGE_SIZE = 4096  # 페이지 크기 (4KB)
-
-def read_address_counts_from_csv(csv_file):
-    """Read address access counts from a CSV file produced by address_count_analysis.py"""
-    address_access_count = {}
-
-    df = pd.read_csv(csv_file)
-    for index, row in df.iterrows():
-        address = row['Address']
-        count = row['Access Count']
-        address_access_count[address] = count
-    
-    return address_access_count
-
-def analyze_page_byte_usage(csv_file, access_threshold=200):
-    # Use CSV file directly
-    address_access_count = read_address_counts_from_csv(csv_file)
-    
+import numpy as np
+from access_trace import load_access_counts
+
+PAGE_SIZE = 4096  # 페이지 크기 (4KB), use 2097152 for 2MB huge pages
+VECTOR_DIM = 384  # all-MiniLM-L6-v2 (bge-base-en-v1.5: 768)
+ELEMENT_SIZE = 4  # float32
+
+
+def split_vectors_over_pages(addresses, vector_size=VECTOR_DIM * ELEMENT_SIZE, page_size=PAGE_SIZE):
+    """Split every vector [address, address + vector_size) over the pages it touches.
+
+    There can be more than two pages when vector_size > page_size. Returns
+    (vector index, page number, bytes on that page) with one row per touched page.
+    """
+    addresses = np.asarray(addresses, dtype=np.uint64)
+    size = np.uint64(vector_size)
+    page = np.uint64(page_size)
+
+    start_page = addresses // page
+    end_page = (addresses + size - np.uint64(1)) // page
+    spans = (end_page - start_page + np.uint64(1)).astype(np.int64)
+
+    vector_index = np.repeat(np.arange(len(addresses)), spans)
+    page_offset = np.arange(len(vector_index)) - np.repeat(np.cumsum(spans) - spans, spans)
+    pages = start_page[vector_index] + page_offset.astype(np.uint64)
+    page_begin = pages * page
+    vector_begin = addresses[vector_index]
+    used = np.minimum(page_begin + page, vector_begin + size) - np.maximum(page_begin, vector_begin)
+    return vector_index, pages, used.astype(np.int64)
+
+
+# Bytes of the given (unique) vectors per page: (page start addresses, bytes used)
+def page_byte_usage(addresses, vector_size=VECTOR_DIM * ELEMENT_SIZE, page_size=PAGE_SIZE):
+    _, pages, used = split_vectors_over_pages(np.unique(np.asarray(addresses, dtype=np.uint64)), vector_size, page_size)
+    unique_pages, inverse = np.unique(pages, return_inverse=True)
+    bytes_used = np.bincount(inverse.ravel(), weights=used, minlength=len(unique_pages))
+    return unique_pages * np.uint64(page_size), bytes_used.astype(np.int64)
+
+
+def analyze_page_byte_usage(csv_file, access_threshold=200, vector_size=VECTOR_DIM * ELEMENT_SIZE, page_size=PAGE_SIZE):
+    _, addresses, counts = load_access_counts(csv_file)
+
     # Filter addresses by access threshold
-    filtered_addresses = {
-        addr for addr, count in address_access_count.items() if count >= access_threshold
-    }
-    
+    filtered_addresses = np.unique(addresses[counts >= access_threshold])
+
     print(f"Number of addresses with access count >= {access_threshold}: {len(filtered_addresses)}")
 
     # Calculate page byte usage
-    page_byte_usage = defaultdict(int)
-    for address_hex in filtered_addresses:
-        try:
-            address = int(address_hex, 16)
-            size = 1536  # Address size is fixed at 1536 bytes
-            start_page = address // PAGE_SIZE * PAGE_SIZE
-            end_page = (address + size - 1) // PAGE_SIZE * PAGE_SIZE
-
-            if start_page == end_page:  # Data fits in one page
-                page_byte_usage[start_page] += size
-            else:  # Data spans multiple pages
-                # Size in the start page
-                size_in_start_page = start_page + PAGE_SIZE - address
-                page_byte_usage[start_page] += size_in_start_page
-
-                # Size in the end page
-                size_in_end_page = (address + size) - end_page
-                page_byte_usage[end_page] += size_in_end_page
-        except ValueError:
-            # Skip addresses that can't be converted to integers
-            continue
+    pages, bytes_used = page_byte_usage(filtered_addresses, vector_size, page_size)
+    if len(pages) > 0:
+        print(f"Pages touched: {len(pages)}, average fill: {bytes_used.mean() / page_size * 100:.2f}% of {page_size} bytes")
 
     # Count pages by Bytes Used
-    byte_usage_distribution = Counter(page_byte_usage.values())
+    usage, num_pages = np.unique(bytes_used, return_counts=True)
+    byte_usage_distribution = dict(zip(usage.tolist(), num_pages.tolist()))
 
     return byte_usage_distribution
 
 def argument_parser():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--csv-file", type=str, required=True, help="Path to the CSV file with address access counts")
+    parser.add_argument("--csv-file", "--counts-file", dest="csv_file", type=str, required=True,
+                        help="Address access counts: CSV, binary .npz or trace directory (see access_trace.py)")
     parser.add_argument("--access-threshold", type=int, default=200, help="Minimum number of accesses to consider an address")
+    parser.add_argument("--vector-dim", type=int, default=VECTOR_DIM, help="Embedding dimension (384 for all-MiniLM-L6-v2, 768 for bge-base)")
+    parser.add_argument("--element-size", type=int, default=ELEMENT_SIZE, help="Bytes per vector element (4 for float32)")
+    parser.add_argument("--vector-size", type=int, default=None, help="Vector size in bytes (overrides --vector-dim * --element-size)")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="Page size in bytes (4096, or 2097152 for 2MB huge pages)")
+    parser.add_argument("--output-file", type=str, default="access_count_page.log", help="Output file for the page byte usage distribution")
     args = parser.parse_args()
     return args
 
@@ -69,17 +75,20 @@ if __name__ == "__main__":
     args = argument_parser()
     csv_file = args.csv_file
     access_threshold = args.access_threshold
+    vector_size = args.vector_size or args.vector_dim * args.element_size
 
     byte_usage_distribution = analyze_page_byte_usage(
-        csv_file=csv_file, 
-        access_threshold=access_threshold
+        csv_file=csv_file,
+        access_threshold=access_threshold,
+        vector_size=vector_size,
+        page_size=args.page_size,
     )
 
     # Save the results to byte_usage_distribution.log
-    output_file = "access_count_page.log"
+    output_file = args.output_file
     with open(output_file, "w") as f:
         f.write("Bytes Used\tNumber of Pages\n")
         for bytes_used, num_pages in sorted(byte_usage_distribution.items()):
             f.write(f"{bytes_used}\t{num_pages}\n")
 
-    print(f"Results saved to {output_file}")
\ No newline at end of file
+    print(f"Results saved to {output_file}")
@@ -0,0 +1,209 @@
+import math
+import argparse
+import numpy as np
+from access_trace import load_trace, load_access_counts
+from hot_page_analysis import PAGE_SIZE, VECTOR_DIM, ELEMENT_SIZE, split_vectors_over_pages
+
+ORDERINGS = ("hot-first", "coaccess")
+
+
+# Total accesses per key (a key can show up with more than one address)
+def key_counts(keys, counts):
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    return unique_keys, np.bincount(inverse.ravel(), weights=counts, minlength=len(unique_keys)).astype(np.int64)
+
+
+def coverage_pages(addresses, counts, vector_size, page_size, percents):
+    """Fewest pages that together receive percents% of the page touches, per percent."""
+    vector_index, pages, _ = split_vectors_over_pages(addresses, vector_size, page_size)
+    _, inverse = np.unique(pages, return_inverse=True)
+    page_counts = np.sort(np.bincount(inverse.ravel(), weights=counts[vector_index]))[::-1]
+    covered = np.cumsum(page_counts)
+    if len(covered) == 0:
+        return [0 for _ in percents]
+    return [int(np.searchsorted(covered, covered[-1] * percent / 100.0)) + 1 for percent in percents]
+
+
+def coaccess_pairs(query, hot_index, window):
+    """Weighted pairs of hot keys accessed within `window` hot accesses of each other in the same query."""
+    left, right = [], []
+    for distance in range(1, window + 1):
+        same = (query[:-distance] == query[distance:]) & (hot_index[:-distance] != hot_index[distance:])
+        a, b = hot_index[:-distance][same], hot_index[distance:][same]
+        left.append(np.minimum(a, b))
+        right.append(np.maximum(a, b))
+    left, right = np.concatenate(left), np.concatenate(right)
+    pairs, weights = np.unique(np.column_stack((left, right)), axis=0, return_counts=True)
+    return pairs[:, 0], pairs[:, 1], weights
+
+
+def coaccess_order(hot_count, left, right, weights, group_size):
+    """Greedy clustering: seed a group with the hottest unplaced key, then keep adding
+    the unplaced key with the strongest co-access to any group member until the group
+    fills `group_size` slots. Hot keys are numbered by count rank, so seeds go hot-first.
+    Short groups are padded with -1 so every group starts at a multiple of group_size.
+    """
+    # Symmetric adjacency in CSR form, each neighbour list sorted by weight (descending)
+    nodes = np.concatenate((left, right))
+    neighbours = np.concatenate((right, left))
+    edge_weights = np.concatenate((weights, weights))
+    order = np.lexsort((-edge_weights, nodes))
+    nodes, neighbours, edge_weights = nodes[order], neighbours[order], edge_weights[order]
+    indptr = np.searchsorted(nodes, np.arange(hot_count + 1))
+    neighbours, edge_weights = neighbours.tolist(), edge_weights.tolist()
+
+    placed = np.zeros(hot_count, dtype=bool)
+    layout = []
+    for seed in range(hot_count):
+        if placed[seed]:
+            continue
+        group = [seed]
+        placed[seed] = True
+        # Best unplaced candidate per member; neighbour lists are scanned once from the front
+        cursor = {seed: indptr[seed]}
+        while len(group) < group_size:
+            best, best_weight = -1, 0
+            for member, position in cursor.items():
+                while position < indptr[member + 1] and placed[neighbours[position]]:
+                    position += 1
+                cursor[member] = position
+                if position < indptr[member + 1] and edge_weights[position] > best_weight:
+                    best, best_weight = neighbours[position], edge_weights[position]
+            if best < 0:
+                break
+            group.append(best)
+            placed[best] = True
+            cursor[best] = indptr[best]
+        layout.extend(group + [-1] * (group_size - len(group)))
+    return np.asarray(layout, dtype=np.int64)
+
+
+def cluster_group_size(cluster_pages, page_size, vector_size):
+    """Vectors per co-access group: the smallest whole number of vectors that also fills whole pages.
+
+    Groups are laid out back to back from a page-aligned base, so a group of
+    lcm(cluster_pages * page_size, vector_size) bytes always starts on a page
+    boundary. With 1536-byte vectors and 4 KiB pages, that is 8 vectors on 3 pages.
+    """
+    return math.lcm(cluster_pages * page_size, vector_size) // vector_size
+
+
+def key_slots(slot_to_key, key_order, keys):
+    return key_order[np.searchsorted(slot_to_key[key_order], keys)].astype(np.uint64)
+
+
+def mean_pages_per_query(query, addresses, vector_size, page_size):
+    vector_index, pages, _ = split_vectors_over_pages(addresses, vector_size, page_size)
+    pairs = np.unique(np.column_stack((query[vector_index].astype(np.uint64), pages)), axis=0)
+    return len(pairs) / max(len(np.unique(query)), 1)
+
+
+def plan_layout(keys, counts, ordering="hot-first", total_points=None, trace=None, hot_keys=65536, window=8,
+                group_size=8):
+    """Return slot_to_key: the point id to store at each slot of the new layout.
+
+    Accessed keys come first (hot-first: by access count; coaccess: the hottest
+    `hot_keys` clustered by co-access, then the rest by count), followed by
+    never-accessed ids 0..total_points-1 in their original order. Padding slots of
+    short co-access groups are filled with the next keys in that order, so the
+    layout has no holes and every group stays page-aligned.
+    """
+    keys = np.asarray(keys, dtype=np.uint64)
+    order = np.lexsort((keys, -np.asarray(counts)))
+    keys = keys[order]
+    if total_points is None:
+        total_points = int(keys.max()) + 1 if len(keys) else 0
+    cold = np.ones(total_points, dtype=bool)
+    cold[keys[keys < total_points]] = False
+    cold_keys = np.flatnonzero(cold).astype(np.uint64)
+
+    if ordering == "coaccess" and trace is None:
+        raise ValueError("coaccess ordering needs a trace")
+    if ordering == "coaccess" and len(keys):
+        hot = keys[:hot_keys]
+        rank = np.argsort(hot)
+        trace_keys = np.asarray(trace["key"], dtype=np.uint64)
+        position = np.minimum(np.searchsorted(hot[rank], trace_keys), len(hot) - 1)
+        is_hot = hot[rank][position] == trace_keys
+        hot_index = rank[position[is_hot]]
+        left, right, weights = coaccess_pairs(np.asarray(trace["query"])[is_hot], hot_index, window)
+        print(f"Co-access pairs among {len(hot)} hot keys: {len(weights)}", flush=True)
+        layout = coaccess_order(len(hot), left, right, weights, group_size)
+        slots = hot[np.maximum(layout, 0)]
+        rest = np.concatenate((keys[len(hot):], cold_keys))
+        padding = np.flatnonzero(layout < 0)
+        filled = padding[:len(rest)]
+        slots[filled] = rest[:len(filled)]
+        # Only when every key is hot can padding stay unfilled; drop it
+        slots = np.delete(slots, padding[len(rest):])
+        return np.concatenate((slots, rest[len(filled):]))
+
+    return np.concatenate((keys, cold_keys))
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts-file", type=str, required=True,
+                        help="Address access counts: CSV, binary .npz or trace directory (see access_trace.py)")
+    parser.add_argument("--trace-dir", type=str, default=None, help="Binary trace, needed for coaccess ordering and per-query page counts")
+    parser.add_argument("--ordering", type=str, choices=ORDERINGS, default="hot-first", help="How accessed vectors are packed")
+    parser.add_argument("--total-points", type=int, default=None, help="Points in the collection (default: highest accessed key + 1)")
+    parser.add_argument("--hot-keys", type=int, default=65536, help="Hottest keys clustered by co-access")
+    parser.add_argument("--window", type=int, default=8, help="Hot accesses within a query that count as co-accessed")
+    parser.add_argument("--cluster-pages", type=int, default=1,
+                        help="Pages per co-access cluster, rounded up so a cluster holds whole vectors (lcm with the vector size)")
+    parser.add_argument("--coverage", type=float, nargs="+", default=[50, 80, 90, 99], help="Access percentages to report page counts for")
+    parser.add_argument("--query-limit", type=int, default=None, help="Only use the first N queries of the trace")
+    parser.add_argument("--vector-dim", type=int, default=VECTOR_DIM, help="Embedding dimension")
+    parser.add_argument("--element-size", type=int, default=ELEMENT_SIZE, help="Bytes per vector element")
+    parser.add_argument("--vector-size", type=int, default=None, help="Vector size in bytes (overrides --vector-dim * --element-size)")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="Page size in bytes")
+    parser.add_argument("--output-prefix", type=str, default="reorder", help="Writes <prefix>_slot_to_key.npy and <prefix>_mapping.csv")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argument_parser()
+    vector_size = args.vector_size or args.vector_dim * args.element_size
+
+    trace = None
+    if args.trace_dir:
+        trace = load_trace(args.trace_dir, columns=("query", "key", "address"))
+        if args.query_limit is not None:
+            in_window = trace["query"] < args.query_limit
+            trace = {name: values[in_window] for name, values in trace.items()}
+    elif args.ordering == "coaccess":
+        raise SystemExit("--ordering coaccess needs --trace-dir")
+
+    keys, addresses, counts = load_access_counts(args.counts_file)
+    unique_keys, per_key = key_counts(keys, counts)
+    group_size = cluster_group_size(args.cluster_pages, args.page_size, vector_size)
+    if args.ordering == "coaccess":
+        print(f"Co-access groups: {group_size} vectors on {group_size * vector_size // args.page_size} page(s)")
+    slot_to_key = plan_layout(unique_keys, per_key, args.ordering, args.total_points, trace, args.hot_keys,
+                              args.window, group_size)
+
+    # Addresses in the new layout: slot * vector_size from a page-aligned base
+    key_order = np.argsort(slot_to_key)
+    new_addresses = key_slots(slot_to_key, key_order, unique_keys) * np.uint64(vector_size)
+
+    before = coverage_pages(addresses, counts, vector_size, args.page_size, args.coverage)
+    after = coverage_pages(new_addresses, per_key, vector_size, args.page_size, args.coverage)
+    print(f"Ordering: {args.ordering}, slots: {len(slot_to_key)}, accessed keys: {len(unique_keys)}")
+    print(f"{'coverage':>9} {'pages before':>13} {'MB before':>10} {'pages after':>12} {'MB after':>9} {'ratio':>7}")
+    for percent, pages_before, pages_after in zip(args.coverage, before, after):
+        print(f"{percent:>8.1f}% {pages_before:>13} {pages_before * args.page_size / (1 << 20):>10.1f} "
+              f"{pages_after:>12} {pages_after * args.page_size / (1 << 20):>9.1f} {pages_before / max(pages_after, 1):>6.2f}x")
+
+    if trace is not None:
+        query = np.asarray(trace["query"])
+        pages_before = mean_pages_per_query(query, trace["address"], vector_size, args.page_size)
+        pages_after = mean_pages_per_query(query, key_slots(slot_to_key, key_order, trace["key"]) * np.uint64(vector_size), vector_size, args.page_size)
+        print(f"Distinct pages per query: before {pages_before:.1f}, after {pages_after:.1f}")
+
+    # Slot order is insertion order: upserting points in this order places them contiguously
+    np.save(f"{args.output_prefix}_slot_to_key.npy", slot_to_key)
+    with open(f"{args.output_prefix}_mapping.csv", "w") as f:
+        f.write("Slot,Key\n")
+        f.writelines(f"{slot},{key}\n" for slot, key in enumerate(slot_to_key.tolist()))
+    print(f"Mapping saved to {args.output_prefix}_slot_to_key.npy and {args.output_prefix}_mapping.csv")
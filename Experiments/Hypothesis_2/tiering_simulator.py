@@ -0,0 +1,270 @@
+import argparse
+from collections import OrderedDict, deque
+import numpy as np
+from access_trace import load_trace, load_access_counts
+from hot_page_analysis import PAGE_SIZE, VECTOR_DIM, ELEMENT_SIZE, split_vectors_over_pages
+
+POLICIES = ("static", "lru", "lfu", "damon", "pebs")
+CACHE_LINE = 64
+
+
+def load_page_accesses(trace_dir, vector_size, page_size, query_limit=None):
+    """Replay order of page touches: (query, page number, bytes read from that page).
+
+    A vector that spills over a page boundary touches every page it overlaps.
+    """
+    trace = load_trace(trace_dir, columns=("query", "address"))
+    query, addresses = trace["query"], trace["address"]
+    if query_limit is not None:
+        in_window = query < query_limit
+        query, addresses = query[in_window], addresses[in_window]
+    vector_index, pages, used = split_vectors_over_pages(addresses, vector_size, page_size)
+    return np.asarray(query[vector_index], dtype=np.int64), pages, used
+
+
+# Fast-tier membership for every touch, given a fixed hot set (boolean mask over page ids)
+def static_hits(page_ids, hot_mask):
+    return hot_mask[page_ids], int(hot_mask.sum())
+
+
+def top_pages(scores, capacity):
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > capacity:
+        candidates = candidates[np.argpartition(-scores[candidates], capacity - 1)[:capacity]]
+    return candidates
+
+
+class LFUPolicy:
+    """Every epoch, keep the pages with the highest decayed access count in the fast tier."""
+
+    def __init__(self, page_count, capacity, decay=0.5):
+        self.scores = np.zeros(page_count)
+        self.capacity = capacity
+        self.decay = decay
+
+    def update(self, page_ids, query, used, fast):
+        self.scores *= self.decay
+        self.scores += np.bincount(page_ids, minlength=len(self.scores))
+        return top_pages(self.scores, self.capacity)
+
+
+class DamonPolicy:
+    """DAMON-like region monitoring.
+
+    The page space is cut into fixed regions of `region_pages` pages. Each epoch
+    is split into `samples` sampling intervals; in each one a random page of every
+    region is checked for access and the region's nr_accesses is bumped if it was
+    touched. Hottest regions are migrated whole, so every region costs
+    `region_pages` pages of fast-tier capacity; the last one may only partially fit.
+    """
+
+    def __init__(self, pages, capacity, region_pages=256, samples=20, decay=0.5, seed=0):
+        self.pages = pages
+        self.capacity = capacity
+        self.region_pages = region_pages
+        self.samples = samples
+        self.decay = decay
+        self.rng = np.random.default_rng(seed)
+        self.regions, self.page_region = np.unique(pages // np.uint64(region_pages), return_inverse=True)
+        self.page_region = self.page_region.ravel()
+        self.scores = np.zeros(len(self.regions))
+
+    def update(self, page_ids, query, used, fast):
+        nr_accesses = np.zeros(len(self.regions))
+        accessed = np.zeros(len(self.pages), dtype=bool)
+        for interval in np.array_split(np.arange(len(page_ids)), self.samples):
+            accessed[:] = False
+            accessed[page_ids[interval]] = True
+            probe = self.regions * np.uint64(self.region_pages) + self.rng.integers(
+                0, self.region_pages, len(self.regions)).astype(np.uint64)
+            index = np.minimum(np.searchsorted(self.pages, probe), len(self.pages) - 1)
+            nr_accesses += (self.pages[index] == probe) & accessed[index]
+        self.scores = self.scores * self.decay + nr_accesses
+
+        hot_regions = np.flatnonzero(self.scores > 0)
+        hot_regions = hot_regions[np.argsort(-self.scores[hot_regions], kind="stable")]
+        full = min(self.capacity // self.region_pages, len(hot_regions))
+        selected = np.flatnonzero(np.isin(self.page_region, hot_regions[:full]))
+        if full < len(hot_regions):
+            # The next region only partially fits
+            partial = np.flatnonzero(self.page_region == hot_regions[full])
+            selected = np.concatenate((selected, partial[:self.capacity - full * self.region_pages]))
+        return selected
+
+
+class PEBSPolicy:
+    """PEBS-sampled promotion modelled on the HMSDK.sh/Bauhaus.sh prediction knobs.
+
+    One in `sample_period` cache-line loads is sampled, so a touch of b bytes is
+    sampled with probability b / 64 / sample_period. Samples are kept for the
+    last `depth` epochs; pages with at least `psi` samples in that history are
+    promoted hottest first, followed by the trace pages within
+    `distance` pages of them, and the remaining capacity keeps current residents.
+    """
+
+    def __init__(self, pages, capacity, sample_period=15000, psi=15, distance=100, depth=100, seed=0):
+        self.pages = pages
+        self.capacity = capacity
+        self.sample_period = sample_period
+        self.psi = psi
+        self.distance = distance
+        self.rng = np.random.default_rng(seed)
+        self.window = np.zeros(len(pages), dtype=np.int64)
+        self.history = deque(maxlen=depth)
+
+    def update(self, page_ids, query, used, fast):
+        probability = np.minimum(used / CACHE_LINE / self.sample_period, 1.0)
+        sampled = page_ids[self.rng.random(len(page_ids)) < probability]
+        if len(self.history) == self.history.maxlen:
+            np.subtract.at(self.window, self.history[0], 1)
+        self.history.append(sampled)
+        np.add.at(self.window, sampled, 1)
+
+        hot = np.flatnonzero(self.window >= self.psi)
+        hot = hot[np.argsort(-self.window[hot], kind="stable")]
+        if self.distance > 0 and len(hot) > 0:
+            low = np.searchsorted(self.pages, self.pages[hot] - np.minimum(self.pages[hot], np.uint64(self.distance)))
+            high = np.searchsorted(self.pages, self.pages[hot] + np.uint64(self.distance), side="right")
+            spans = high - low
+            neighbours = np.repeat(low, spans) + (np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans))
+        else:
+            neighbours = np.empty(0, dtype=np.int64)
+
+        order = np.concatenate((hot, neighbours, fast))
+        _, first = np.unique(order, return_index=True)
+        return order[np.sort(first)][:self.capacity]
+
+
+def simulate_epochs(policy, page_ids, query, used, epoch_queries):
+    """Replay the trace epoch by epoch; the fast set chosen after an epoch serves the next one."""
+    hits = np.zeros(len(page_ids), dtype=bool)
+    fast_mask = np.zeros(int(page_ids.max()) + 1 if len(page_ids) else 0, dtype=bool)
+    fast = np.empty(0, dtype=np.int64)
+    promotions = 0
+    bounds = np.searchsorted(query, np.arange(0, int(query[-1]) + epoch_queries + 1, epoch_queries)) if len(query) else [0]
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        if lo == hi:
+            continue
+        hits[lo:hi] = fast_mask[page_ids[lo:hi]]
+        fast = np.asarray(policy.update(page_ids[lo:hi], query[lo:hi], used[lo:hi], fast), dtype=np.int64)
+        promotions += int(np.count_nonzero(~fast_mask[fast]))
+        fast_mask[:] = False
+        fast_mask[fast] = True
+    return hits, promotions
+
+
+# Exact LRU at page granularity: every miss promotes the page and evicts the least recently used one
+def simulate_lru(page_ids, capacity):
+    hits = np.zeros(len(page_ids), dtype=bool)
+    resident = OrderedDict()
+    promotions = 0
+    for i, page in enumerate(page_ids.tolist()):
+        if page in resident:
+            resident.move_to_end(page)
+            hits[i] = True
+            continue
+        promotions += 1
+        resident[page] = None
+        if len(resident) > capacity:
+            resident.popitem(last=False)
+    return hits, promotions
+
+
+def report(name, hits, promotions, query, used, args):
+    fast_ns = args.fast_latency_ns + used / args.fast_bandwidth_gbps
+    slow_ns = args.slow_latency_ns + used / args.slow_bandwidth_gbps
+    stall_ns = np.where(hits, fast_ns, slow_ns)
+    queries, query_index = np.unique(query, return_inverse=True)
+    per_query_us = np.bincount(query_index.ravel(), weights=stall_ns, minlength=len(queries)) / 1e3
+    # Promoting a page reads it from the slow tier and writes it to the fast tier
+    migration_ms = promotions * args.page_size / args.slow_bandwidth_gbps / 1e6
+
+    result = {
+        "policy": name,
+        "hit_ratio": float(hits.mean()) if len(hits) else float("nan"),
+        "byte_hit_ratio": float(used[hits].sum() / used.sum()) if len(used) else float("nan"),
+        "stall_mean_us": float(per_query_us.mean()) if len(queries) else float("nan"),
+        "stall_p99_us": float(np.percentile(per_query_us, 99)) if len(queries) else float("nan"),
+        "promotions": promotions,
+        "migrated_mb": promotions * args.page_size / (1 << 20),
+        "migration_ms": migration_ms,
+    }
+    print(f"{name:<8} {result['hit_ratio'] * 100:>8.2f}% {result['byte_hit_ratio'] * 100:>9.2f}% "
+          f"{result['stall_mean_us']:>12.2f} {result['stall_p99_us']:>12.2f} {promotions:>11} "
+          f"{result['migrated_mb']:>12.1f} {migration_ms:>11.1f}", flush=True)
+    return result
+
+
+def run_policies(args):
+    vector_size = args.vector_size or args.vector_dim * args.element_size
+    query, pages, used = load_page_accesses(args.trace_dir, vector_size, args.page_size, args.query_limit)
+    universe, page_ids = np.unique(pages, return_inverse=True)
+    page_ids = page_ids.ravel()
+    capacity = int(args.fast_capacity_mb * (1 << 20)) // args.page_size
+    print(f"Page touches: {len(page_ids)}, queries: {len(np.unique(query))}, distinct pages: {len(universe)} "
+          f"({len(universe) * args.page_size / (1 << 20):.1f} MB), fast tier: {capacity} pages", flush=True)
+
+    print(f"{'policy':<8} {'hit':>9} {'byte hit':>10} {'stall/q us':>12} {'P99 us':>12} {'promotions':>11} "
+          f"{'migrated MB':>12} {'migr. ms':>11}", flush=True)
+    results = []
+    for name in args.policy:
+        if name == "static":
+            if args.counts_file:
+                # Hot set from an earlier run (e.g. access_count_sorted.csv); pages outside this trace never hit
+                _, addresses, counts = load_access_counts(args.counts_file)
+                vector_index, count_pages, _ = split_vectors_over_pages(addresses, vector_size, args.page_size)
+                index = np.minimum(np.searchsorted(universe, count_pages), len(universe) - 1)
+                known = universe[index] == count_pages
+                page_counts = np.bincount(index[known], weights=counts[vector_index][known], minlength=len(universe))
+            else:
+                page_counts = np.bincount(page_ids, minlength=len(universe)).astype(np.float64)
+            hot_mask = np.zeros(len(universe), dtype=bool)
+            hot_mask[top_pages(page_counts, capacity)] = True
+            hits, promotions = static_hits(page_ids, hot_mask)
+        elif name == "lru":
+            hits, promotions = simulate_lru(page_ids, capacity)
+        else:
+            if name == "lfu":
+                policy = LFUPolicy(len(universe), capacity, args.decay)
+            elif name == "damon":
+                policy = DamonPolicy(universe, capacity, args.region_pages, args.damon_samples, args.decay, args.seed)
+            else:
+                policy = PEBSPolicy(universe, capacity, args.sampling_interval, args.psi, args.distance, args.depth, args.seed)
+            hits, promotions = simulate_epochs(policy, page_ids, query, used, args.epoch_queries)
+        results.append(report(name, hits, promotions, query, used, args))
+    return results
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trace-dir", type=str, required=True, help="Binary trace directory from access_trace.py")
+    parser.add_argument("--counts-file", type=str, default=None,
+                        help="Access counts (CSV/.npz) for the static hot set (default: counts of the replayed trace)")
+    parser.add_argument("--policy", type=str, nargs="+", choices=POLICIES, default=list(POLICIES), help="Policies to replay")
+    parser.add_argument("--query-limit", type=int, default=None, help="Only replay the first N queries")
+    parser.add_argument("--vector-dim", type=int, default=VECTOR_DIM, help="Embedding dimension")
+    parser.add_argument("--element-size", type=int, default=ELEMENT_SIZE, help="Bytes per vector element")
+    parser.add_argument("--vector-size", type=int, default=None, help="Vector size in bytes (overrides --vector-dim * --element-size)")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="Page size in bytes (4096, or 2097152 for 2MB huge pages)")
+    # Tiers
+    parser.add_argument("--fast-capacity-mb", type=float, required=True, help="Fast tier (local DRAM) capacity in MB")
+    parser.add_argument("--fast-latency-ns", type=float, default=100.0, help="Fast tier load latency per page touch")
+    parser.add_argument("--slow-latency-ns", type=float, default=250.0, help="Slow tier (CXL) load latency per page touch")
+    parser.add_argument("--fast-bandwidth-gbps", type=float, default=200.0, help="Fast tier bandwidth in GB/s")
+    parser.add_argument("--slow-bandwidth-gbps", type=float, default=32.0, help="Slow tier bandwidth in GB/s")
+    # Policies
+    parser.add_argument("--epoch-queries", type=int, default=100, help="Queries between placement decisions (lfu, damon, pebs)")
+    parser.add_argument("--decay", type=float, default=0.5, help="Score decay per epoch for lfu and damon")
+    parser.add_argument("--region-pages", type=int, default=256, help="DAMON region size in pages")
+    parser.add_argument("--damon-samples", type=int, default=20, help="DAMON sampling intervals per epoch")
+    parser.add_argument("--sampling-interval", type=int, default=15000, help="PEBS sample period in loads (SAMPLING_INTERVAL)")
+    parser.add_argument("--psi", type=int, default=15, help="PEBS samples within the history needed to promote a page (PSI)")
+    parser.add_argument("--distance", type=int, default=100, help="Promote trace pages within this many pages of a hot page (DISTANCE)")
+    parser.add_argument("--depth", type=int, default=100, help="Epochs of PEBS sample history (DEPTH)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for DAMON and PEBS sampling")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argument_parser()
+    run_policies(args)
@@ -0,0 +1,137 @@
+import numpy as np
+
+ARRIVAL_PROCESSES = ("poisson", "deterministic", "mmpp", "trace")
+
+
+# Poisson arrivals: exponential gaps with mean 1/rate (not np.random.poisson, which gives integer counts)
+def poisson_intervals(rate, count, rng):
+    return rng.exponential(1.0 / rate, count)
+
+
+# Fixed gaps of 1/rate
+def deterministic_intervals(rate, count):
+    return np.full(count, 1.0 / rate)
+
+
+def mmpp_intervals(rate, count, rng, burst_ratio=4.0, burst_fraction=0.2, mean_cycle=10.0):
+    """Two-state Markov-modulated Poisson process with long-run mean `rate`.
+
+    The burst state runs at rate * burst_ratio for `burst_fraction` of the time; the
+    quiet state rate is chosen to keep the overall mean. burst_ratio * burst_fraction == 1
+    gives an on/off source. `mean_cycle` is the mean burst + quiet period in seconds.
+    """
+    if not 0 < burst_fraction < 1:
+        raise ValueError("burst_fraction must be in (0, 1)")
+    quiet_rate = rate * (1 - burst_fraction * burst_ratio) / (1 - burst_fraction)
+    if quiet_rate < 0:
+        raise ValueError("burst_ratio * burst_fraction must not exceed 1")
+    if count == 0:
+        return np.empty(0)
+    state_rate = (rate * burst_ratio, quiet_rate)
+    state_dwell = (mean_cycle * burst_fraction, mean_cycle * (1 - burst_fraction))
+
+    # Draw one exponential sojourn per state visit and scatter its Poisson arrivals uniformly
+    arrivals = []
+    total = 0
+    now = 0.0
+    state = 0 if rng.random() < burst_fraction else 1
+    while total < count:
+        dwell = rng.exponential(state_dwell[state])
+        n = rng.poisson(state_rate[state] * dwell)
+        arrivals.append(now + np.sort(rng.uniform(0.0, dwell, n)))
+        total += n
+        now += dwell
+        state = 1 - state
+    arrivals = np.concatenate(arrivals)[:count]
+    return np.diff(arrivals, prepend=0.0)
+
+
+def trace_intervals(path, count, time_scale=1.0, period=None):
+    """Replay arrival timestamps (seconds, one per line or .npy); shorter traces wrap around.
+
+    The first arrival is sent at once. Between the last arrival of one replay and
+    the first of the next there is a wrap gap: `period` minus the trace span when
+    a period is given, otherwise the trace's mean gap.
+    """
+    if path.endswith(".npy"):
+        timestamps = np.load(path)
+    else:
+        timestamps = np.loadtxt(path, ndmin=1)
+    timestamps = np.sort(np.asarray(timestamps, dtype=np.float64))
+    if count == 0:
+        return np.empty(0)
+    if len(timestamps) == 0:
+        raise ValueError(f"Arrival trace {path} is empty")
+    gaps = np.diff(timestamps)
+    span = timestamps[-1] - timestamps[0]
+    if period is not None:
+        if period < span:
+            raise ValueError(f"--trace-period {period} is shorter than the trace span {span}")
+        wrap = period - span
+    elif len(gaps):
+        wrap = gaps.mean()
+    else:
+        raise ValueError("A single-timestamp trace needs --trace-period to repeat")
+    cycle = np.append(gaps, wrap)
+    return np.concatenate(([0.0], np.resize(cycle, count - 1))) * time_scale
+
+
+def generate_intervals(process, rate, count, seed=None, burst_ratio=4.0, burst_fraction=0.2,
+                       mean_cycle=10.0, trace_file=None, trace_time_scale=1.0, trace_period=None):
+    rng = np.random.default_rng(seed)
+    if process == "poisson":
+        return poisson_intervals(rate, count, rng)
+    if process == "deterministic":
+        return deterministic_intervals(rate, count)
+    if process == "mmpp":
+        return mmpp_intervals(rate, count, rng, burst_ratio, burst_fraction, mean_cycle)
+    if process == "trace":
+        if trace_file is None:
+            raise ValueError("--arrival-trace is required for the trace arrival process")
+        return trace_intervals(trace_file, count, trace_time_scale, trace_period)
+    raise ValueError(f"Unknown arrival process: {process}")
+
+
+def add_arrival_arguments(parser):
+    parser.add_argument("--arrival-process", type=str, default="poisson", choices=ARRIVAL_PROCESSES, help="Inter-arrival distribution")
+    parser.add_argument("--arrival-seed", type=int, default=None, help="Seed for the arrival process")
+    parser.add_argument("--burst-ratio", type=float, default=4.0, help="mmpp: burst state rate as a multiple of the target rate")
+    parser.add_argument("--burst-fraction", type=float, default=0.2, help="mmpp: fraction of time spent in the burst state")
+    parser.add_argument("--burst-cycle", type=float, default=10.0, help="mmpp: mean burst + quiet cycle length in seconds")
+    parser.add_argument("--arrival-trace", type=str, default=None, help="trace: file of arrival timestamps in seconds (text or .npy)")
+    parser.add_argument("--trace-time-scale", type=float, default=1.0, help="trace: multiply replayed gaps by this factor")
+    parser.add_argument("--trace-period", type=float, default=None,
+                        help="trace: seconds from one replay's start to the next (default: span + mean gap)")
+
+
+def intervals_from_args(args, rate, count):
+    return generate_intervals(
+        args.arrival_process, rate, count,
+        seed=args.arrival_seed,
+        burst_ratio=args.burst_ratio,
+        burst_fraction=args.burst_fraction,
+        mean_cycle=args.burst_cycle,
+        trace_file=args.arrival_trace,
+        trace_time_scale=args.trace_time_scale,
+        trace_period=args.trace_period,
+    )
+
+
+# Split one arrival stream round-robin into `parts` streams (one per worker process)
+def split_intervals(intervals, parts):
+    arrivals = np.cumsum(intervals)
+    return [np.diff(arrivals[i::parts], prepend=0.0) for i in range(parts)]
+
+
+# Self-check: achieved mean and coefficient of variation of the generated gaps
+def report_intervals(intervals, rate, process=""):
+    intervals = np.asarray(intervals, dtype=np.float64)
+    if len(intervals) == 0:
+        print("Arrival check: no arrivals generated", flush=True)
+        return 0.0, 0.0
+    mean = intervals.mean()
+    cv = intervals.std() / mean if mean > 0 else 0.0
+    achieved = 1.0 / mean if mean > 0 else float("inf")
+    print(f"Arrival check ({process}): mean gap {mean:.4f} s (target {1.0 / rate:.4f} s), "
+          f"CV {cv:.3f}, rate {achieved:.3f}/s over {len(intervals)} arrivals", flush=True)
+    return mean, cv
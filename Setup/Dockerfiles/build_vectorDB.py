@@ -1,10 +1,15 @@
 import os
+import json
 import time
 import sys
-from datasets import load_from_disk, concatenate_datasets
-from qdrant_client import QdrantClient, models
-from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Process, Queue
+from datasets import load_from_disk
+from qdrant_client import models
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import argparse
+from latency_histogram import LatencyHistogram
+from document_store import build_document_store
+from qdrant_transport import make_client, TRANSPORTS, DEFAULT_GRPC_PORT
 
 
 def argument_parser():
@@ -15,89 +20,400 @@ def argument_parser():
     parser.add_argument("--collection-name", type=str, default="wiki_passages")
     parser.add_argument("--host", type=str, default="163.152.48.209:6100")
     parser.add_argument("--port", type=int, default=6100)
+    parser.add_argument("--transport", type=str, choices=TRANSPORTS, default="http", help="Client protocol for the upload (http and rest are the same)")
+    parser.add_argument("--grpc-port", type=int, default=DEFAULT_GRPC_PORT, help="Qdrant gRPC port (with --transport grpc)")
+    ### Ingestion
+    parser.add_argument("--workers", type=int, default=1, help="Upload processes, each with its own client and index range")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Points per upsert request")
+    parser.add_argument("--upload-workers", type=int, default=4, help="Threads sending upsert requests (per process)")
+    parser.add_argument("--max-inflight", type=int, default=None, help="Batches read ahead of the last acknowledged one (default: 2 x workers)")
+    parser.add_argument("--retries", type=int, default=3, help="Attempts per batch before the build stops")
+    parser.add_argument("--checkpoint-file", type=str, default=None,
+                        help="JSON with the last acknowledged offset (default: <dataset-path>/ingest_checkpoint_<collection>.json)")
+    parser.add_argument("--no-resume", action="store_true", default=False, help="Ignore an existing checkpoint and start from client.count")
+    parser.add_argument("--payload-mode", type=str, choices=("full", "chunk_id"), default="full",
+                        help="chunk_id: keep only chunk_id in Qdrant payloads (text lives in --document-store)")
+    parser.add_argument("--document-store", type=str, default=None, help="Document store directory, built first if it does not exist")
+    ### Index
+    parser.add_argument("--bulk-load", action="store_true", default=False,
+                        help="Defer HNSW (m=0, indexing_threshold=0) during the upload and build the index once at the end")
+    parser.add_argument("--hnsw-m", type=int, default=16, help="HNSW m enabled after a bulk load")
+    parser.add_argument("--hnsw-ef-construct", type=int, default=100, help="HNSW ef_construct enabled after a bulk load")
+    parser.add_argument("--hnsw-on-disk", action="store_true", default=False, help="Keep the HNSW graph on disk (mmap)")
+    parser.add_argument("--shard-number", type=int, default=None, help="Shards of a newly created collection")
+    parser.add_argument("--on-disk", action="store_true", default=False, help="Keep original vectors on disk (mmap) when creating the collection")
+    parser.add_argument("--indexing-threshold", type=int, default=20000, help="indexing_threshold (KB) restored after a bulk load")
+    parser.add_argument("--index-poll-interval", type=float, default=5.0, help="Seconds between collection status polls while indexing")
+    parser.add_argument("--index-timeout", type=float, default=7200.0, help="Give up waiting for the index after this many seconds (0: no limit)")
+    parser.add_argument("--index-settle-polls", type=int, default=3,
+                        help="Consecutive idle polls after which a collection the optimizer never picked up counts as ready")
 
     args = parser.parse_args()
     return args
 
-args = argument_parser()
-
-# 데이터셋 및 Qdrant 설정
-base_dir = args.dataset_path
-if not os.path.exists(base_dir):
-    print(f"Dataset path '{base_dir}' does not exist.", flush=True)
-    sys.exit(1)  # 데이터셋 경로가 없으면 프로그램 종료
-embedding_dataset = load_from_disk(base_dir)
-# embedding_dataset = embedding_dataset["data"]
-if not embedding_dataset:
-    print("The dataset is empty.", flush=True)
-    sys.exit(1)
-# Qdrant 클라이언트 설정
-client = QdrantClient(
-    host=args.host,
-    port=args.port,
-)
-collection_name = args.collection_name
-
-# 컬렉션 확인 및 생성
-try:
-    client.get_collection(collection_name=collection_name)
-    print(f"Collection '{collection_name}' already exists.", flush=True)
-except Exception:
-    print(f"Collection '{collection_name}' does not exist. Creating now.", flush=True)
+
+# Remaining [next_offset, end_offset) ranges from the checkpoint, one per upload process
+def load_checkpoint(checkpoint_file, collection_name, document_count, points_count):
+    if not os.path.exists(checkpoint_file):
+        return None
+    with open(checkpoint_file) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("collection") != collection_name:
+        print(f"Checkpoint {checkpoint_file} belongs to collection '{checkpoint.get('collection')}', ignoring it.", flush=True)
+        return None
+    if checkpoint.get("document_count") != document_count:
+        print(f"Checkpoint {checkpoint_file} was written for --document-count {checkpoint.get('document_count')}, ignoring it.", flush=True)
+        return None
+    ranges = [list(offsets) for offsets in checkpoint["ranges"]]
+    # Point ids are dataset offsets and every id below the lowest resume offset was acknowledged
+    acknowledged = min((offsets[0] for offsets in ranges), default=0)
+    if points_count < acknowledged:
+        print(f"Checkpoint {checkpoint_file} expects at least {acknowledged} points but the collection has {points_count}, "
+              f"ignoring it.", flush=True)
+        return None
+    return ranges
+
+
+# Atomic rewrite so an interrupted build never leaves a truncated checkpoint
+def save_checkpoint(checkpoint_file, collection_name, ranges, document_count):
+    tmp_file = f"{checkpoint_file}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump({"collection": collection_name, "document_count": document_count, "ranges": ranges,
+                   "updated": time.strftime("%Y-%m-%d %H:%M:%S")}, f)
+    os.replace(tmp_file, checkpoint_file)
+
+
+# A finished build leaves nothing to resume
+def clear_checkpoint(checkpoint_file):
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+
+# Contiguous index ranges aligned to whole batches
+def split_ranges(start_idx, end_idx, parts, batch_size):
+    if end_idx <= start_idx:
+        return []
+    batches = -(-(end_idx - start_idx) // batch_size)
+    per_part = -(-batches // parts) * batch_size
+    return [[start, min(start + per_part, end_idx)] for start in range(start_idx, end_idx, per_part)]
+
+
+def create_collection(client, collection_name, dim, bulk_load=False, on_disk=False, shard_number=None):
     client.create_collection(
         collection_name=collection_name,
+        shard_number=shard_number,
         vectors_config=models.VectorParams(
-            size=len(embedding_dataset[0]["embedding"]),  # 벡터 크기를 데이터에서 가져옴
+            size=dim,  # 벡터 크기를 데이터에서 가져옴
             distance=models.Distance.COSINE,
+            on_disk=on_disk,
         ),
+        # Bulk load: no HNSW graph and no indexing while points stream in
+        hnsw_config=models.HnswConfigDiff(m=0) if bulk_load else None,
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0) if bulk_load else None,
+    )
+
+
+def defer_indexing(client, collection_name):
+    client.update_collection(
+        collection_name=collection_name,
+        hnsw_config=models.HnswConfigDiff(m=0),
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0),
     )
 
-# 기존 데이터 개수 확인
-try:
-    existing_count = client.count(collection_name=collection_name, timeout=3000).count
-except Exception as e:
-    print(f"Error while fetching existing count: {e}", flush=True)
-    sys.exit(1)  # 오류 발생 시 프로그램 종료
-
-# 멀티스레드 업로드
-batch_size = 10000
-count = args.document_count
-start_idx = existing_count
-end_idx = min(len(embedding_dataset), start_idx + count)
-
-if start_idx >= len(embedding_dataset):
-    print("No more data to add.", flush=True)
-else:
-    print(f"Adding records from {start_idx} to {end_idx}.", flush=True)
-
-    def upload_batch(start, end):
-        batch_start_time = time.time()  # 배치 시작 시간 기록
-        batch = embedding_dataset.select(range(start, end))
-        points = [
-            models.PointStruct(
-                id=start + idx,
-                vector=item["embedding"],
-                payload={
-                    "chunk_id": item["chunk_id"],
-                    "document": item["document"],
-                },
-            )
-            for idx, item in enumerate(batch)
+
+def enable_indexing(client, collection_name, m=16, ef_construct=100, hnsw_on_disk=False, indexing_threshold=20000):
+    client.update_collection(
+        collection_name=collection_name,
+        hnsw_config=models.HnswConfigDiff(m=m, ef_construct=ef_construct, on_disk=hnsw_on_disk),
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=indexing_threshold),
+    )
+
+
+def wait_for_index(client, collection_name, poll_interval=5.0, timeout=7200.0, settle_polls=3):
+    """Poll until the optimizer is done with the collection; return (optimize, index build) seconds.
+
+    The collection is ready when it is green with the optimizer idle after it was
+    seen running, or after `settle_polls` idle polls in a row. The indexed count
+    alone is not used: segments below indexing_threshold are never indexed, and a
+    collection indexed before the bulk load already counts as indexed before the
+    rebuild starts. Qdrant does not report phases, so the split is approximate:
+    "optimize" runs until the indexed count first changes (segments merged),
+    "index build" from then until the collection is ready.
+    """
+    start_time = time.time()
+    first_indexed_time = None
+    initial_indexed = None
+    busy_seen = False
+    idle_polls = 0
+    while True:
+        info = client.get_collection(collection_name=collection_name)
+        indexed = info.indexed_vectors_count or 0
+        points = info.points_count or 0
+        now = time.time()
+        if initial_indexed is None:
+            initial_indexed = indexed
+        elif indexed != initial_indexed and first_indexed_time is None:
+            first_indexed_time = now
+        print(f"[{now - start_time:.0f}s] status: {info.status}, optimizer: {info.optimizer_status}, "
+              f"indexed vectors: {indexed}/{points}", flush=True)
+        if info.optimizer_status != models.OptimizersStatusOneOf.OK:
+            print(f"Optimizer failed: {info.optimizer_status}, stop waiting.", flush=True)
+            break
+        if info.status == models.CollectionStatus.GREEN:
+            idle_polls += 1
+            if busy_seen or idle_polls >= settle_polls:
+                break
+        else:
+            busy_seen = True
+            idle_polls = 0
+        if timeout and now - start_time > timeout:
+            print(f"Index not ready after {timeout:.0f} seconds, stop waiting.", flush=True)
+            break
+        time.sleep(poll_interval)
+    first_indexed_time = first_indexed_time or now
+    return first_indexed_time - start_time, now - first_indexed_time
+
+
+def embedding_matrix(table):
+    """(rows, dim) NumPy view of the Arrow `embedding` list column, without per-row Python lists."""
+    column = table.column("embedding").combine_chunks()
+    values = column.flatten().to_numpy(zero_copy_only=False)
+    return values.reshape(len(column), -1)
+
+
+def read_batch(arrow_dataset, start, end, payload_mode="full"):
+    table = arrow_dataset[start:end]
+    if payload_mode == "chunk_id":
+        payloads = [{"chunk_id": chunk_id} for chunk_id in table.column("chunk_id").to_pylist()]
+    else:
+        payloads = [
+            {"chunk_id": chunk_id, "document": document}
+            for chunk_id, document in zip(table.column("chunk_id").to_pylist(), table.column("document").to_pylist())
         ]
-        client.upload_points(collection_name=collection_name, points=points)
-        batch_end_time = time.time()  # 배치 종료 시간 기록
-        print(
-            f"Uploaded batch from {start} to {end}. Batch upload time: {batch_end_time - batch_start_time:.2f} seconds.",
-            flush=True
-        )
-
-    total_start_time = time.time()
-    with ThreadPoolExecutor(max_workers=4) as executor:
+    # JSON and protobuf both need Python floats. One ndarray.tolist() per batch is the cheapest conversion:
+    # Batch(vectors=ndarray) converts element by element (~14x slower at 10000 x 384), and upload_collection
+    # calls tolist() on every slice itself.
+    batch = models.Batch(ids=list(range(start, end)), vectors=embedding_matrix(table).tolist(), payloads=payloads)
+    return batch, table.nbytes
+
+
+def upload_batch(client, collection_name, arrow_dataset, start, end, retries=3, payload_mode="full"):
+    batch_start_time = time.time()  # 배치 시작 시간 기록
+    batch, nbytes = read_batch(arrow_dataset, start, end, payload_mode)
+    for attempt in range(1, retries + 1):
+        try:
+            # Point ids are dataset offsets, so re-sending a batch after a failure is idempotent
+            client.upsert(collection_name=collection_name, points=batch, wait=True)
+            break
+        except Exception as e:
+            if attempt == retries:
+                raise
+            print(f"Batch {start}-{end} failed ({e}), retrying ({attempt}/{retries})", flush=True)
+            time.sleep(attempt)
+    batch_end_time = time.time()  # 배치 종료 시간 기록
+    print(
+        f"Uploaded batch from {start} to {end}. Batch upload time: {batch_end_time - batch_start_time:.2f} seconds.",
+        flush=True
+    )
+    return start, end, batch_end_time - batch_start_time, nbytes
+
+
+def ingest(client, collection_name, embedding_dataset, start_idx, end_idx, batch_size=10000, workers=4,
+           max_inflight=None, retries=3, payload_mode="full", on_ack=None):
+    """Upsert rows [start_idx, end_idx) with at most max_inflight batches outstanding.
+
+    Batches can finish out of order; on_ack(offset) is only called when the
+    contiguous prefix of acknowledged batches grows, so a checkpoint written from
+    it re-sends at most max_inflight batches on resume and never skips one.
+    Returns (acknowledged offset, stats, error or None).
+    """
+    max_inflight = max_inflight or 2 * workers
+    if payload_mode == "chunk_id":
+        # Never read the document column
+        embedding_dataset = embedding_dataset.select_columns(["embedding", "chunk_id"])
+    arrow_dataset = embedding_dataset.with_format("arrow")
+    acked = start_idx
+    finished = {}
+    pending = set()
+    failed = None
+    stats = {"points": 0, "bytes": 0, "batch_latency": LatencyHistogram()}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
         for start in range(start_idx, end_idx, batch_size):
             end = min(start + batch_size, end_idx)
-            executor.submit(upload_batch, start, end)
-    total_end_time = time.time()
-    print(f"Total upload time: {total_end_time - total_start_time:.2f} seconds.", flush=True)
+            pending.add(executor.submit(upload_batch, client, collection_name, arrow_dataset, start, end, retries,
+                                         payload_mode))
+            if len(pending) < max_inflight and end < end_idx:
+                continue
+            # Back-pressure: wait for a slot (or for everything at the end)
+            while pending and (len(pending) >= max_inflight or end == end_idx):
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        batch_start, batch_end, seconds, nbytes = future.result()
+                        finished[batch_start] = batch_end
+                        stats["points"] += batch_end - batch_start
+                        stats["bytes"] += nbytes
+                        stats["batch_latency"].record(seconds)
+                    except Exception as e:
+                        failed = failed or e
+                previous = acked
+                while acked in finished:
+                    acked = finished.pop(acked)
+                if on_ack is not None and acked != previous:
+                    on_ack(acked)
+                if failed is not None:
+                    break
+            if failed is not None:
+                for future in pending:
+                    future.cancel()
+                break
+    return acked, stats, failed
+
+
+def ingest_worker(worker, client_args, collection_name, embedding_dataset, start_idx, end_idx, ingest_args, queue):
+    client = make_client(*client_args)
+    acked, stats, failed = ingest(client, collection_name, embedding_dataset, start_idx, end_idx, *ingest_args,
+                                  on_ack=lambda offset: queue.put(("ack", worker, offset)))
+    stats["batch_latency"] = stats["batch_latency"].to_state()
+    # Exactly one "done" per worker, drained by the parent before join
+    queue.put(("done", worker, acked, stats, None if failed is None else repr(failed)))
+
+
+def ingest_ranges(client_args, collection_name, embedding_dataset, ranges, ingest_args, checkpoint_file, document_count):
+    """Upload every [next_offset, end_offset) range, one process per range (in-process for a single range).
+
+    The parent owns the checkpoint and rewrites it whenever a range advances.
+    Returns (per-range stats, errors).
+    """
+    if len(ranges) == 1:
+        def on_ack(offset):
+            ranges[0][0] = offset
+            save_checkpoint(checkpoint_file, collection_name, ranges, document_count)
+        acked, stats, failed = ingest(make_client(*client_args), collection_name, embedding_dataset, *ranges[0],
+                                      *ingest_args, on_ack=on_ack)
+        return [stats], [] if failed is None else [repr(failed)]
+
+    queue = Queue()
+    processes = [
+        Process(target=ingest_worker,
+                args=(worker, client_args, collection_name, embedding_dataset, start, end, ingest_args, queue))
+        for worker, (start, end) in enumerate(ranges)
+    ]
+    for process in processes:
+        process.start()
+
+    results = {}
+    while len(results) < len(processes):
+        message = queue.get()
+        if message[0] == "ack":
+            _, worker, offset = message
+            ranges[worker][0] = offset
+            save_checkpoint(checkpoint_file, collection_name, ranges, document_count)
+        else:
+            _, worker, acked, stats, failed = message
+            stats["batch_latency"] = LatencyHistogram.from_state(stats["batch_latency"])
+            results[worker] = (stats, failed)
+    for process in processes:
+        process.join()
+    return [results[worker][0] for worker in range(len(processes))], [failed for _, failed in results.values() if failed]
+
+
+def print_ingest_stats(stats_list, elapsed):
+    batch_latency = LatencyHistogram()
+    for worker, stats in enumerate(stats_list):
+        batch_latency.merge(stats["batch_latency"])
+        if len(stats_list) > 1:
+            print(f"Worker {worker}: {stats['points']} points, {stats['points'] / max(elapsed, 1e-9):.0f} points/s", flush=True)
+    points = sum(stats["points"] for stats in stats_list)
+    megabytes = sum(stats["bytes"] for stats in stats_list) / (1 << 20)
+    print(f"Uploaded {points} points ({megabytes:.1f} MB of Arrow data) in {elapsed:.2f} seconds: "
+          f"{points / max(elapsed, 1e-9):.0f} points/s, {megabytes / max(elapsed, 1e-9):.1f} MB/s", flush=True)
+    batch_latency.print_summary("Batch latency")
+
+
+if __name__ == "__main__":
+    args = argument_parser()
+
+    # 데이터셋 및 Qdrant 설정
+    base_dir = args.dataset_path
+    if not os.path.exists(base_dir):
+        print(f"Dataset path '{base_dir}' does not exist.", flush=True)
+        sys.exit(1)  # 데이터셋 경로가 없으면 프로그램 종료
+    embedding_dataset = load_from_disk(base_dir)
+    # embedding_dataset = embedding_dataset["data"]
+    if not embedding_dataset:
+        print("The dataset is empty.", flush=True)
+        sys.exit(1)
+    # Qdrant 클라이언트 설정
+    client_args = (args.host, args.port, args.transport, args.grpc_port)
+    client = make_client(*client_args)
+    collection_name = args.collection_name
+    checkpoint_file = args.checkpoint_file or os.path.join(base_dir, f"ingest_checkpoint_{collection_name}.json")
+
+    # 문서 본문은 Qdrant payload 대신 별도 document store에 저장
+    if args.document_store and not os.path.exists(os.path.join(args.document_store, "meta.json")):
+        build_document_store(embedding_dataset, args.document_store)
+    if args.payload_mode == "chunk_id" and not args.document_store:
+        print("Warning: --payload-mode chunk_id without --document-store drops the document text.", flush=True)
+
+    # 컬렉션 확인 및 생성
+    phase_times = {}
+    phase_start_time = time.time()
+    created = False
+    try:
+        client.get_collection(collection_name=collection_name)
+        print(f"Collection '{collection_name}' already exists.", flush=True)
+        if args.bulk_load:
+            defer_indexing(client, collection_name)
+    except Exception:
+        print(f"Collection '{collection_name}' does not exist. Creating now.", flush=True)
+        create_collection(client, collection_name, len(embedding_dataset[0]["embedding"]), args.bulk_load, args.on_disk,
+                          args.shard_number)
+        created = True
+    phase_times["create"] = time.time() - phase_start_time
+
+    try:
+        start_idx = client.count(collection_name=collection_name, timeout=3000).count
+    except Exception as e:
+        print(f"Error while fetching existing count: {e}", flush=True)
+        sys.exit(1)  # 오류 발생 시 프로그램 종료
+
+    # 재시작 위치: 체크포인트가 있으면 남은 구간부터, 없으면 기존 데이터 개수
+    # A checkpoint never applies to a collection created by this run
+    ranges = None
+    if not args.no_resume and not created:
+        ranges = load_checkpoint(checkpoint_file, collection_name, args.document_count, start_idx)
+    if ranges is not None:
+        ranges = [offsets for offsets in ranges if offsets[0] < offsets[1]]
+        print(f"Resuming from checkpoint {checkpoint_file}: {ranges}", flush=True)
+    else:
+        count = args.document_count
+        end_idx = min(len(embedding_dataset), start_idx + count)
+        ranges = split_ranges(start_idx, end_idx, args.workers, args.batch_size)
+
+    if not ranges:
+        print("No more data to add.", flush=True)
+    else:
+        print(f"Adding records in {len(ranges)} range(s): {ranges}.", flush=True)
+
+        total_start_time = time.time()
+        ingest_args = (args.batch_size, args.upload_workers, args.max_inflight, args.retries, args.payload_mode)
+        stats_list, errors = ingest_ranges(client_args, collection_name, embedding_dataset, ranges, ingest_args,
+                                           checkpoint_file, args.document_count)
+        total_end_time = time.time()
+        phase_times["upload"] = total_end_time - total_start_time
+        print(f"Total upload time: {total_end_time - total_start_time:.2f} seconds.", flush=True)
+        print_ingest_stats(stats_list, total_end_time - total_start_time)
+        if errors:
+            print(f"Upload failed: {errors}. Remaining ranges {ranges} are in {checkpoint_file}; rerun to resume.", flush=True)
+            sys.exit(1)
+    clear_checkpoint(checkpoint_file)
+
+    if args.bulk_load:
+        print(f"Enabling HNSW (m={args.hnsw_m}, ef_construct={args.hnsw_ef_construct}, on_disk={args.hnsw_on_disk}).", flush=True)
+        enable_indexing(client, collection_name, args.hnsw_m, args.hnsw_ef_construct, args.hnsw_on_disk, args.indexing_threshold)
+        phase_times["optimize"], phase_times["index build"] = wait_for_index(
+            client, collection_name, args.index_poll_interval, args.index_timeout, args.index_settle_polls)
 
     # 업로드된 포인트 개수 확인
     try:
@@ -105,3 +421,6 @@ else:
         print(f"Total points in collection '{collection_name}': {total_points}", flush=True)
     except Exception as e:
         print(f"Error while fetching total points: {e}", flush=True)
+
+    print("Phase timing: " + ", ".join(f"{phase} {seconds:.2f} s" for phase, seconds in phase_times.items())
+          + f", total {sum(phase_times.values()):.2f} s", flush=True)
@@ -0,0 +1,107 @@
+import os
+import json
+import argparse
+import numpy as np
+
+DOCUMENTS_FILE = "documents.bin"  # packed UTF-8 text, row after row
+OFFSETS_FILE = "offsets.npy"  # int64, row i is documents[offsets[i]:offsets[i + 1]]
+CHUNK_IDS_FILE = "chunk_ids.npy"  # sorted chunk ids
+ROWS_FILE = "rows.npy"  # row of each sorted chunk id
+
+
+def build_document_store(dataset, store_dir, batch_size=100000):
+    """Write the `document` column of a dataset to a packed, memory-mappable store keyed by `chunk_id`."""
+    os.makedirs(store_dir, exist_ok=True)
+    arrow_dataset = dataset.with_format("arrow")
+    offsets = np.zeros(len(dataset) + 1, dtype=np.int64)
+    chunk_ids = []
+    position = 0
+    with open(os.path.join(store_dir, DOCUMENTS_FILE), "wb") as f:
+        for start in range(0, len(dataset), batch_size):
+            end = min(start + batch_size, len(dataset))
+            table = arrow_dataset[start:end]
+            encoded = [document.encode("utf-8") for document in table.column("document").to_pylist()]
+            f.write(b"".join(encoded))
+            offsets[start + 1:end + 1] = position + np.cumsum([len(document) for document in encoded])
+            position = int(offsets[end])
+            chunk_ids.append(np.asarray(table.column("chunk_id").to_pylist()))
+            print(f"Stored documents {start} to {end} ({position / (1 << 30):.2f} GB)", flush=True)
+
+    chunk_ids = np.concatenate(chunk_ids) if chunk_ids else np.empty(0, dtype=np.int64)
+    rows = np.argsort(chunk_ids, kind="stable")
+    np.save(os.path.join(store_dir, OFFSETS_FILE), offsets)
+    np.save(os.path.join(store_dir, CHUNK_IDS_FILE), chunk_ids[rows])
+    np.save(os.path.join(store_dir, ROWS_FILE), rows.astype(np.int64))
+    with open(os.path.join(store_dir, "meta.json"), "w") as f:
+        json.dump({"documents": len(dataset), "bytes": position, "chunk_id_dtype": chunk_ids.dtype.str}, f, indent=2)
+    print(f"Document store with {len(dataset)} documents ({position / (1 << 30):.2f} GB) saved to {store_dir}", flush=True)
+
+
+class DocumentStore:
+    """Read-only view of a store written by build_document_store.
+
+    Only the pages of the requested documents are touched, so a store shared by
+    many processes costs page cache, not per-process memory. Text is read with
+    os.pread rather than from an mmap: a cold page fault inside an mmap slice
+    holds the GIL, while pread releases it, so get_many can run in an executor
+    thread without stalling an event loop.
+    """
+
+    def __init__(self, store_dir):
+        self.file = open(os.path.join(store_dir, DOCUMENTS_FILE), "rb")
+        self.offsets = np.load(os.path.join(store_dir, OFFSETS_FILE), mmap_mode="r")
+        self.chunk_ids = np.load(os.path.join(store_dir, CHUNK_IDS_FILE), mmap_mode="r")
+        self.rows = np.load(os.path.join(store_dir, ROWS_FILE), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get_many(self, chunk_ids):
+        """Documents for the given chunk ids, None for unknown ids."""
+        if len(chunk_ids) == 0 or len(self.chunk_ids) == 0:
+            return [None] * len(chunk_ids)
+        wanted = np.asarray(chunk_ids)
+        fits = np.ones(len(wanted), dtype=bool)
+        if self.chunk_ids.dtype.kind == "U" and wanted.dtype.kind in "UO":
+            # Casting truncates ids longer than the stored width, which could then match a stored prefix
+            wanted = wanted.astype(str)
+            fits = np.char.str_len(wanted) <= self.chunk_ids.dtype.itemsize // 4
+        wanted = wanted.astype(self.chunk_ids.dtype)
+        index = np.minimum(np.searchsorted(self.chunk_ids, wanted), len(self.chunk_ids) - 1)
+        found = (self.chunk_ids[index] == wanted) & fits
+        documents = []
+        for row, ok in zip(self.rows[index].tolist(), found.tolist()):
+            documents.append(self._read(row) if ok else None)
+        return documents
+
+    def _read(self, row):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return os.pread(self.file.fileno(), end - start, start).decode("utf-8")
+
+    def get(self, chunk_id):
+        return self.get_many([chunk_id])[0]
+
+    def close(self):
+        self.file.close()
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset-path", type=str, default="/app/wiki_test", help="Dataset with chunk_id and document columns")
+    parser.add_argument("--store-dir", type=str, required=True, help="Output directory of the document store")
+    parser.add_argument("--batch-size", type=int, default=100000, help="Rows read per Arrow batch")
+    parser.add_argument("--lookup", type=str, nargs="*", default=None, help="Print the documents of these chunk ids instead of building")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argument_parser()
+    if args.lookup is not None:
+        store = DocumentStore(args.store_dir)
+        for chunk_id, document in zip(args.lookup, store.get_many(args.lookup)):
+            print(f"{chunk_id}: {document}")
+        store.close()
+    else:
+        from datasets import load_from_disk
+
+        build_document_store(load_from_disk(args.dataset_path), args.store_dir, args.batch_size)
@@ -0,0 +1,194 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+import unicodedata
+import numpy as np
+
+DIGEST_SIZE = 16  # blake2b-128 of the normalized text
+VECTORS_FILE = "vectors.npy"  # float32 (capacity, dimension), memory-mapped
+KEYS_FILE = "keys.npy"  # uint8 (capacity, DIGEST_SIZE) text digest per slot
+LAST_USED_FILE = "last_used.npy"  # int64 LRU tick per slot, -1 for a free slot
+META_FILE = "meta.json"
+
+
+def normalize_text(text):
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_digests(texts):
+    return [hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=DIGEST_SIZE).digest() for text in texts]
+
+
+def model_identifier(model_dir):
+    """Stable id of a SentenceTransformer directory: name plus a hash of its config and weight sizes.
+
+    The container mounts every model at the same path, so the path alone can't tell
+    all-MiniLM-L6-v2 from bge-base-en-v1.5.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for root, _, files in sorted(os.walk(model_dir)):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, model_dir).encode("utf-8"))
+            if name.endswith(".json") or name.endswith(".txt"):
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+            else:
+                digest.update(str(os.path.getsize(path)).encode("utf-8"))
+    name = "unknown"
+    config_file = os.path.join(model_dir, "config.json")
+    if os.path.exists(config_file):
+        with open(config_file) as f:
+            name = json.load(f).get("_name_or_path") or name
+    return f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', os.path.basename(name.rstrip('/')))}-{digest.hexdigest()}"
+
+
+class EmbeddingCache:
+    """Persistent embedding cache for one model, keyed by normalized text hash.
+
+    Vectors live in a memory-mapped file with a fixed number of slots; when it is
+    full the least recently used entries are overwritten. The hash index is rebuilt
+    from the keys file on open, and save() flushes the files and statistics.
+    """
+
+    def __init__(self, cache_dir, model_id, dimension, capacity=2000000):
+        self.dir = os.path.join(cache_dir, model_id)
+        os.makedirs(self.dir, exist_ok=True)
+        self.meta = {"model_id": model_id, "dimension": dimension, "capacity": capacity, "tick": 0,
+                     "hits": 0, "misses": 0, "evictions": 0}
+        meta_file = os.path.join(self.dir, META_FILE)
+        if os.path.exists(meta_file):
+            with open(meta_file) as f:
+                self.meta.update(json.load(f))
+            if self.meta["dimension"] != dimension:
+                raise ValueError(f"Cache {self.dir} holds {self.meta['dimension']}-d vectors, model has {dimension}")
+            self._open()
+            if self.meta["capacity"] != capacity:
+                self._resize(capacity)
+        else:
+            self._create(self.dir, capacity)
+            self._open()
+        self.session = {"hits": 0, "misses": 0, "evictions": 0}
+        valid = np.flatnonzero(self.last_used >= 0)
+        self.index = {key: int(slot) for key, slot in zip(map(bytes, self.keys[valid]), valid.tolist())}
+
+    def _create(self, directory, capacity):
+        np.lib.format.open_memmap(os.path.join(directory, VECTORS_FILE), mode="w+", dtype=np.float32,
+                                  shape=(capacity, self.meta["dimension"]))
+        np.lib.format.open_memmap(os.path.join(directory, KEYS_FILE), mode="w+", dtype=np.uint8,
+                                  shape=(capacity, DIGEST_SIZE))
+        last_used = np.lib.format.open_memmap(os.path.join(directory, LAST_USED_FILE), mode="w+", dtype=np.int64,
+                                              shape=(capacity,))
+        last_used[:] = -1
+        last_used.flush()
+
+    def _open(self):
+        self.vectors = np.load(os.path.join(self.dir, VECTORS_FILE), mmap_mode="r+")
+        self.keys = np.load(os.path.join(self.dir, KEYS_FILE), mmap_mode="r+")
+        self.last_used = np.load(os.path.join(self.dir, LAST_USED_FILE), mmap_mode="r+")
+
+    def _resize(self, capacity):
+        """Copy the `capacity` most recently used entries into new files."""
+        valid = np.flatnonzero(self.last_used >= 0)
+        keep = valid[np.argsort(-self.last_used[valid], kind="stable")[:capacity]]
+        tmp_dir = self.dir + ".resize"
+        os.makedirs(tmp_dir, exist_ok=True)
+        self._create(tmp_dir, capacity)
+        for name, values in ((VECTORS_FILE, self.vectors), (KEYS_FILE, self.keys), (LAST_USED_FILE, self.last_used)):
+            resized = np.load(os.path.join(tmp_dir, name), mmap_mode="r+")
+            resized[:len(keep)] = values[keep]
+            resized.flush()
+            del resized
+        self.meta["evictions"] += len(valid) - len(keep)
+        del self.vectors, self.keys, self.last_used
+        for name in (VECTORS_FILE, KEYS_FILE, LAST_USED_FILE):
+            os.replace(os.path.join(tmp_dir, name), os.path.join(self.dir, name))
+        os.rmdir(tmp_dir)
+        print(f"Resized embedding cache {self.dir} from {self.meta['capacity']} to {capacity} entries "
+              f"({len(valid) - len(keep)} evicted)", flush=True)
+        self.meta["capacity"] = capacity
+        self._open()
+
+    def __len__(self):
+        return len(self.index)
+
+    def get_many(self, texts):
+        """(embeddings, found): cached rows are filled in, the rest are left zero."""
+        self.meta["tick"] += 1
+        slots = np.fromiter((self.index.get(key, -1) for key in text_digests(texts)), dtype=np.int64, count=len(texts))
+        found = slots >= 0
+        embeddings = np.zeros((len(texts), self.meta["dimension"]), dtype=np.float32)
+        embeddings[found] = self.vectors[slots[found]]
+        self.last_used[slots[found]] = self.meta["tick"]
+        hits = int(found.sum())
+        for counters in (self.meta, self.session):
+            counters["hits"] += hits
+            counters["misses"] += len(texts) - hits
+        return embeddings, found
+
+    def put_many(self, texts, embeddings):
+        """Insert texts not yet cached, evicting least recently used entries when full."""
+        new = {}
+        for key, row in zip(text_digests(texts), range(len(texts))):
+            if key not in self.index:
+                new[key] = row
+        capacity = self.meta["capacity"]
+        keys, rows = list(new)[-capacity:], list(new.values())[-capacity:]
+        if not keys:
+            return
+        free = np.flatnonzero(self.last_used < 0)[:len(keys)]
+        evict = len(keys) - len(free)
+        if evict > 0:
+            victims = np.argpartition(np.where(self.last_used < 0, np.iinfo(np.int64).max, self.last_used), evict - 1)[:evict]
+            for key in map(bytes, self.keys[victims]):
+                del self.index[key]
+            free = np.concatenate((free, victims))
+            for counters in (self.meta, self.session):
+                counters["evictions"] += evict
+        self.vectors[free] = np.asarray(embeddings, dtype=np.float32)[rows]
+        self.keys[free] = np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(-1, DIGEST_SIZE)
+        self.last_used[free] = self.meta["tick"]
+        self.index.update(zip(keys, free.tolist()))
+
+    def save(self):
+        for values in (self.vectors, self.keys, self.last_used):
+            values.flush()
+        meta_file = os.path.join(self.dir, META_FILE)
+        with open(meta_file + ".tmp", "w") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(meta_file + ".tmp", meta_file)
+
+    def stats(self):
+        lookups = self.session["hits"] + self.session["misses"]
+        hit_rate = self.session["hits"] / lookups * 100 if lookups else 0
+        return (f"Embedding cache {self.meta['model_id']}: {self.session['hits']} hits, {self.session['misses']} misses "
+                f"({hit_rate:.1f}% hit rate), {self.session['evictions']} evictions, "
+                f"{len(self)}/{self.meta['capacity']} entries "
+                f"(all time: {self.meta['hits']} hits, {self.meta['misses']} misses, {self.meta['evictions']} evictions)")
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cache-dir", type=str, required=True, help="Embedding cache directory")
+    parser.add_argument("--clear", type=str, default=None, help="Delete the cache of this model id")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argument_parser()
+    if args.clear is not None:
+        import shutil
+
+        shutil.rmtree(os.path.join(args.cache_dir, args.clear))
+        print(f"Removed cache {args.clear}")
+    for model_id in sorted(os.listdir(args.cache_dir)):
+        meta_file = os.path.join(args.cache_dir, model_id, META_FILE)
+        if not os.path.exists(meta_file):
+            continue
+        with open(meta_file) as f:
+            meta = json.load(f)
+        entries = int(np.sum(np.load(os.path.join(args.cache_dir, model_id, LAST_USED_FILE), mmap_mode="r") >= 0))
+        print(f"{model_id}: {entries}/{meta['capacity']} entries, {meta['dimension']}-d, "
+              f"{meta['hits']} hits, {meta['misses']} misses, {meta['evictions']} evictions")
@@ -0,0 +1,36 @@
+from multiprocessing import shared_memory
+import numpy as np
+from datasets import load_from_disk
+
+
+# Load the question embeddings as one contiguous float32 matrix
+def load_embedding_matrix(dir, seed=42):
+    dataset = load_from_disk(dir)
+    dataset = dataset.shuffle(seed=seed)
+    dataset = dataset.with_format("numpy", columns=["embedding"])
+    return np.ascontiguousarray(dataset["embedding"], dtype=np.float32)
+
+
+def create_shared_embeddings(matrix):
+    """Copy `matrix` into a new shared memory block and return (shm, spec).
+
+    `spec` is a small picklable tuple that workers pass to attach_shared_embeddings.
+    The creator owns the block and must close() and unlink() it when done.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+    shared = np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=shm.buf)
+    shared[:] = matrix
+    return shm, (shm.name, matrix.shape, matrix.dtype.str)
+
+
+def attach_shared_embeddings(spec):
+    """Attach to a block created by create_shared_embeddings and return (shm, matrix).
+
+    The matrix is a read-only view, so dataset[i] slices a row without copying or IPC.
+    Keep `shm` alive while the matrix is in use and close() it afterwards.
+    """
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    matrix = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    matrix.flags.writeable = False
+    return shm, matrix
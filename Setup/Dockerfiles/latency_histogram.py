@@ -0,0 +1,175 @@
+import numpy as np
+
+
+class LatencyHistogram:
+    """Constant-memory HDR-style histogram of latencies.
+
+    Values are recorded in integer microseconds into log-linear buckets that keep
+    `significant_digits` decimal digits of precision between 1 us and
+    `highest_seconds`. Histograms with the same settings merge by adding counts,
+    so worker processes can ship their counts array to the parent.
+    """
+
+    def __init__(self, highest_seconds=3600.0, significant_digits=3):
+        self.highest_seconds = highest_seconds
+        self.significant_digits = significant_digits
+        self.highest = int(highest_seconds * 1e6)
+
+        largest_single_unit = 2 * 10 ** significant_digits
+        self.sub_bucket_count = 1 << int(np.ceil(np.log2(largest_single_unit)))
+        self.sub_bucket_half_count = self.sub_bucket_count // 2
+        self.sub_bucket_half_count_magnitude = int(np.log2(self.sub_bucket_half_count))
+        self.sub_bucket_mask = self.sub_bucket_count - 1
+
+        bucket_count = 1
+        smallest_untrackable = self.sub_bucket_count
+        while smallest_untrackable <= self.highest:
+            smallest_untrackable <<= 1
+            bucket_count += 1
+        self.counts = np.zeros((bucket_count + 1) * self.sub_bucket_half_count, dtype=np.int64)
+        self.total_count = 0
+        self.min_value = None
+        self.max_value = None
+
+    def _indices(self, values):
+        # bucket = bit_length(v | mask) - bit_length(mask); frexp gives bit_length exactly below 2**53
+        _, bit_length = np.frexp((values | self.sub_bucket_mask).astype(np.float64))
+        bucket = bit_length.astype(np.int64) - (self.sub_bucket_half_count_magnitude + 1)
+        sub_bucket = values >> bucket
+        return ((bucket + 1) << self.sub_bucket_half_count_magnitude) + (sub_bucket - self.sub_bucket_half_count)
+
+    def _values(self, indices):
+        # Highest value that maps to each bucket index
+        bucket = (indices >> self.sub_bucket_half_count_magnitude) - 1
+        sub_bucket = (indices & (self.sub_bucket_half_count - 1)) + self.sub_bucket_half_count
+        first_half = bucket < 0
+        sub_bucket = np.where(first_half, sub_bucket - self.sub_bucket_half_count, sub_bucket)
+        bucket = np.where(first_half, 0, bucket)
+        return ((sub_bucket << bucket) + (1 << bucket) - 1).astype(np.float64)
+
+    def record(self, seconds):
+        value = min(max(int(round(seconds * 1e6)), 0), self.highest)
+        bucket = (value | self.sub_bucket_mask).bit_length() - (self.sub_bucket_half_count_magnitude + 1)
+        index = ((bucket + 1) << self.sub_bucket_half_count_magnitude) + ((value >> bucket) - self.sub_bucket_half_count)
+        self.counts[index] += 1
+        self.total_count += 1
+        self.min_value = value if self.min_value is None else min(self.min_value, value)
+        self.max_value = value if self.max_value is None else max(self.max_value, value)
+
+    def record_many(self, seconds):
+        seconds = np.asarray(seconds, dtype=np.float64)
+        seconds = seconds[~np.isnan(seconds)]
+        if len(seconds) == 0:
+            return
+        values = np.clip(np.rint(seconds * 1e6), 0, self.highest).astype(np.int64)
+        self.counts += np.bincount(self._indices(values), minlength=len(self.counts))
+        self.total_count += len(values)
+        low, high = int(values.min()), int(values.max())
+        self.min_value = low if self.min_value is None else min(self.min_value, low)
+        self.max_value = high if self.max_value is None else max(self.max_value, high)
+
+    def merge(self, other):
+        if len(other.counts) != len(self.counts):
+            raise ValueError("Cannot merge histograms with different precision or range")
+        self.counts += other.counts
+        self.total_count += other.total_count
+        for name, pick in (("min_value", min), ("max_value", max)):
+            mine, theirs = getattr(self, name), getattr(other, name)
+            if theirs is not None:
+                setattr(self, name, theirs if mine is None else pick(mine, theirs))
+        return self
+
+    def percentile(self, q):
+        if self.total_count == 0:
+            return float("nan")
+        target = max(1, int(np.ceil(q / 100.0 * self.total_count)))
+        index = int(np.searchsorted(np.cumsum(self.counts), target))
+        value = min(self._values(np.array([index]))[0], self.max_value)
+        return float(value) / 1e6
+
+    def mean(self):
+        if self.total_count == 0:
+            return float("nan")
+        nonzero = np.flatnonzero(self.counts)
+        return float(np.dot(self.counts[nonzero], self._values(nonzero))) / self.total_count / 1e6
+
+    def summary(self):
+        return {
+            "count": self.total_count,
+            "min": float("nan") if self.min_value is None else self.min_value / 1e6,
+            "mean": self.mean(),
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p99.9": self.percentile(99.9),
+            "max": float("nan") if self.max_value is None else self.max_value / 1e6,
+        }
+
+    def print_summary(self, label):
+        s = self.summary()
+        print(f"{label}: count {s['count']}, mean {s['mean']:.4f} s, P50 {s['p50']:.4f} s, P90 {s['p90']:.4f} s, "
+              f"P99 {s['p99']:.4f} s, P99.9 {s['p99.9']:.4f} s, max {s['max']:.4f} s", flush=True)
+
+    # Picklable state for shipping between processes
+    def to_state(self):
+        return (self.highest_seconds, self.significant_digits, self.counts, self.total_count, self.min_value, self.max_value)
+
+    @classmethod
+    def from_state(cls, state):
+        highest_seconds, significant_digits, counts, total_count, min_value, max_value = state
+        histogram = cls(highest_seconds, significant_digits)
+        histogram.counts = np.asarray(counts, dtype=np.int64).copy()
+        histogram.total_count = int(total_count)
+        histogram.min_value = min_value
+        histogram.max_value = max_value
+        return histogram
+
+
+# Write named histograms to one .npz per run (e.g. latency, corrected_latency, ttft)
+def save_histograms(path, histograms):
+    arrays = {}
+    for name, histogram in histograms.items():
+        highest_seconds, significant_digits, counts, total_count, min_value, max_value = histogram.to_state()
+        arrays[f"{name}.counts"] = counts
+        arrays[f"{name}.meta"] = np.array([
+            highest_seconds, significant_digits, total_count,
+            -1 if min_value is None else min_value,
+            -1 if max_value is None else max_value,
+        ], dtype=np.float64)
+    np.savez(path, **arrays)
+    print(f"Histograms saved to {path}", flush=True)
+
+
+def load_histograms(path):
+    histograms = {}
+    with np.load(path) as data:
+        for key in data.files:
+            if not key.endswith(".meta"):
+                continue
+            name = key[:-len(".meta")]
+            highest_seconds, significant_digits, total_count, min_value, max_value = data[key]
+            histograms[name] = LatencyHistogram.from_state((
+                float(highest_seconds), int(significant_digits), data[f"{name}.counts"], int(total_count),
+                None if min_value < 0 else int(min_value),
+                None if max_value < 0 else int(max_value),
+            ))
+    return histograms
+
+
+# Compare runs: python3 latency_histogram.py Baseline.npz AutoNUMA.npz HMSDK.npz Bauhaus.npz
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("histogram_files", nargs="+", help="Histogram .npz files written by the load generators or question server")
+    parser.add_argument("--name", type=str, default=None, help="Only show this histogram (e.g. corrected_latency, ttft)")
+    args = parser.parse_args()
+
+    print(f"{'run':<32} {'histogram':<20} {'count':>10} {'mean':>9} {'P50':>9} {'P90':>9} {'P99':>9} {'P99.9':>9}")
+    for path in args.histogram_files:
+        for name, histogram in sorted(load_histograms(path).items()):
+            if args.name is not None and name != args.name:
+                continue
+            s = histogram.summary()
+            print(f"{path:<32} {name:<20} {s['count']:>10} {s['mean']:>9.4f} {s['p50']:>9.4f} "
+                  f"{s['p90']:>9.4f} {s['p99']:>9.4f} {s['p99.9']:>9.4f}")
@@ -0,0 +1,185 @@
+import json
+import time
+import threading
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WINDOWS = (10, 60)  # sliding windows in seconds
+PERCENTILES = (50, 90, 99)
+
+
+class LiveMetrics:
+    """Rolling counters and latency percentiles for a running benchmark.
+
+    Completions go into a fixed-size ring of (time, latency, error) samples, so
+    recording is O(1) and memory is bounded; window statistics are computed with
+    NumPy only when a snapshot is requested. Safe to update from any thread.
+    """
+
+    def __init__(self, windows=WINDOWS, capacity=1 << 20):
+        self.windows = tuple(windows)
+        self.times = np.full(capacity, -np.inf)
+        self.latencies = np.zeros(capacity)
+        self.errors = np.zeros(capacity, dtype=bool)
+        self.position = 0
+        self.sent = 0
+        self.completed = 0
+        self.failed = 0
+        self.start_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record_sent(self, count=1):
+        with self.lock:
+            self.sent += count
+
+    def record_done(self, latency, error=False, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            slot = self.position % len(self.times)
+            self.times[slot], self.latencies[slot], self.errors[slot] = now, latency, error
+            self.position += 1
+            self.failed += bool(error)
+            self.completed += not error
+
+    def record_many(self, sent, times, latencies, errors):
+        """Merge a batch of samples, e.g. the deltas a MetricsForwarder sent from a worker process."""
+        count = len(times)
+        with self.lock:
+            self.sent += sent
+            slots = (self.position + np.arange(count)) % len(self.times)
+            self.times[slots], self.latencies[slots], self.errors[slots] = times, latencies, errors
+            self.position += count
+            failed = int(np.count_nonzero(errors))
+            self.failed += failed
+            self.completed += count - failed
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            stats = {"uptime_seconds": now - self.start_time, "sent": self.sent, "completed": self.completed,
+                     "errors": self.failed, "inflight": self.sent - self.completed - self.failed}
+            filled = min(self.position, len(self.times))
+            times, latencies, errors = self.times[:filled].copy(), self.latencies[:filled].copy(), self.errors[:filled].copy()
+        for window in self.windows:
+            recent = times >= now - window
+            ok = recent & ~errors
+            span = min(window, stats["uptime_seconds"]) or 1.0
+            window_stats = {"qps": int(ok.sum()) / span, "errors": int(np.count_nonzero(recent & errors))}
+            values = np.percentile(latencies[ok], PERCENTILES) if ok.any() else [float("nan")] * len(PERCENTILES)
+            for q, value in zip(PERCENTILES, values):
+                window_stats[f"p{q}"] = float(value)
+            stats[f"{window}s"] = window_stats
+        return stats
+
+    def prometheus(self, prefix="loadgen"):
+        stats = self.snapshot()
+        lines = []
+        for name, kind in (("sent", "counter"), ("completed", "counter"), ("errors", "counter"), ("inflight", "gauge")):
+            metric = f"{prefix}_requests_{name}" + ("_total" if kind == "counter" else "")
+            lines += [f"# TYPE {metric} {kind}", f"{metric} {stats[name]}"]
+        lines.append(f"# TYPE {prefix}_qps gauge")
+        lines += [f'{prefix}_qps{{window="{w}s"}} {stats[f"{w}s"]["qps"]:.3f}' for w in self.windows]
+        lines.append(f"# TYPE {prefix}_window_errors gauge")
+        lines += [f'{prefix}_window_errors{{window="{w}s"}} {stats[f"{w}s"]["errors"]}' for w in self.windows]
+        lines.append(f"# TYPE {prefix}_latency_seconds gauge")
+        for w in self.windows:
+            for q in PERCENTILES:
+                value = stats[f"{w}s"][f"p{q}"]
+                lines.append(f'{prefix}_latency_seconds{{window="{w}s",quantile="{q / 100}"}} {"NaN" if np.isnan(value) else f"{value:.6f}"}')
+        return "\n".join(lines) + "\n"
+
+    def summary_line(self):
+        stats = self.snapshot()
+        window = stats[f"{self.windows[0]}s"]
+        return (f"[metrics] sent {stats['sent']}, completed {stats['completed']}, errors {stats['errors']}, "
+                f"inflight {stats['inflight']}, last {self.windows[0]}s: {window['qps']:.1f} QPS, "
+                f"P50 {window['p50']:.4f} s, P99 {window['p99']:.4f} s")
+
+
+class MetricsForwarder:
+    """LiveMetrics stand-in for worker processes: buffers samples and ships deltas over a queue.
+
+    Deltas go out at most every `interval` seconds (and on flush()), so the cost
+    per request is an append, not an IPC round trip.
+    """
+
+    def __init__(self, queue, interval=1.0):
+        self.queue = queue
+        self.interval = interval
+        self.sent = 0
+        self.times, self.latencies, self.errors = [], [], []
+        self.last_flush = time.monotonic()
+
+    def record_sent(self, count=1):
+        self.sent += count
+        self._maybe_flush()
+
+    def record_done(self, latency, error=False, now=None):
+        self.times.append(time.monotonic() if now is None else now)
+        self.latencies.append(latency)
+        self.errors.append(error)
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self.sent or self.times:
+            self.queue.put((self.sent, np.asarray(self.times), np.asarray(self.latencies), np.asarray(self.errors, dtype=bool)))
+        self.sent = 0
+        self.times, self.latencies, self.errors = [], [], []
+        self.last_flush = time.monotonic()
+
+
+def drain_forwarded(queue, metrics):
+    """Apply worker deltas until a None sentinel arrives (run in a thread of the parent)."""
+    while (item := queue.get()) is not None:
+        metrics.record_many(*item)
+
+
+def start_metrics_server(metrics, port, host="0.0.0.0", prefix="loadgen"):
+    """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = metrics.prometheus(prefix).encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = json.dumps(metrics.snapshot()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Live metrics on http://{host}:{port}/metrics and /metrics.json", flush=True)
+    return server
+
+
+def start_metrics_log(metrics, interval):
+    """Print a one-line summary every `interval` seconds from a daemon thread (0 disables)."""
+    if interval <= 0:
+        return
+
+    def log():
+        while True:
+            time.sleep(interval)
+            print(metrics.summary_line(), flush=True)
+
+    threading.Thread(target=log, daemon=True).start()
+
+
+def add_metrics_arguments(parser, metrics_port=True):
+    if metrics_port:
+        parser.add_argument("--metrics-port", type=int, default=None, help="Serve live metrics (Prometheus /metrics, /metrics.json) on this port")
+    parser.add_argument("--metrics-log-interval", type=float, default=10.0, help="Seconds between one-line metrics summaries (0 disables)")
+    parser.add_argument("--verbose", action="store_true", default=False, help="Print every request")
@@ -1,9 +1,14 @@
 import argparse
-from qdrant_client import models, QdrantClient
 from datasets import load_from_disk
 import time
-import random
 import numpy as np
+from open_loop import OpenLoopScheduler, merge_run_stats, print_run_stats
+from latency_histogram import save_histograms
+from arrival_process import add_arrival_arguments, intervals_from_args, report_intervals
+from document_store import DocumentStore
+from search_options import make_search_params, search_params_from_args, describe_search, add_search_arguments, DEFAULT_TOP_K
+from live_metrics import LiveMetrics, start_metrics_server, start_metrics_log, add_metrics_arguments
+from qdrant_transport import make_client, add_transport_arguments, DEFAULT_GRPC_PORT
 
 
 # Load dataset once
@@ -14,17 +19,18 @@ def load_dataset(dir):
 
 
 # Perform query and collect chunk_id
-def generate_request(client, collection_name, embedding, i):
-    top_k = 5
+def generate_request(client, collection_name, embedding, scheduler, i, documents=None, metrics=None, verbose=False,
+                     search_params=None, top_k=DEFAULT_TOP_K):
     try:
-        start = time.time()
+        start = scheduler.sent[i]  # Actual send time recorded by the scheduler
         
         # 쿼리 요청
         hits_result = client.query_points(
             collection_name=collection_name,
             query=embedding,
-            search_params=models.SearchParams(hnsw_ef=768, exact=False),
+            search_params=search_params or make_search_params(),
             limit=top_k,
+            with_payload=["chunk_id"],  # Document text is not needed for ranking
             timeout=30000
         )
         
@@ -32,19 +38,28 @@ def generate_request(client, collection_name, embedding, i):
 
         # chunk_id 추출
         chunk_ids = [hit.payload['chunk_id'] for hit in hits if 'chunk_id' in hit.payload]
+        if documents is not None:
+            # Fetch text lazily, only for the final top-k
+            documents.get_many(chunk_ids)
         
-        end = time.time()
-        print(f"Query {i} completed in {end - start:.2f} seconds. Chunk IDs: {chunk_ids}", flush=True)
+        end = scheduler.mark_done(i)
+        if metrics is not None:
+            metrics.record_done(end - start)
+        if verbose:
+            print(f"Query {i} completed in {end - start:.2f} seconds. Chunk IDs: {chunk_ids}", flush=True)
         return chunk_ids
     
     except Exception as e:
         print(f"Query failed: {e}", flush=True)
+        if metrics is not None:
+            metrics.record_done(time.monotonic() - scheduler.sent[i], error=True)
         return []
 
 
 # 메인 실행
-def main(collection_name, dataset, rate, req_count, a=1.2):
-    client = QdrantClient(url="172.26.0.1", port=6333)
+def main(collection_name, dataset, rate, intervals, a=1.2, histogram_output=None, documents=None, metrics=None, verbose=False,
+         qdrant_host="172.26.0.1", qdrant_port=6333, search_params=None, top_k=DEFAULT_TOP_K, transport="rest", grpc_port=DEFAULT_GRPC_PORT):
+    client = make_client(qdrant_host, qdrant_port, transport, grpc_port)
 
     try:
         client.get_collection(collection_name=collection_name)
@@ -55,22 +70,39 @@ def main(collection_name, dataset, rate, req_count, a=1.2):
 
     chunk_id_log = []
 
+    req_count = len(intervals)
     print(f"Starting {req_count} queries at rate {rate} RPS...", flush=True)
 
     np.random.seed(42)
     dataset_length = len(dataset)
+    # Queries are blocking, so a slow one delays the next send; the scheduler keeps
+    # the intended arrival times and reports latency corrected against them.
+    scheduler = OpenLoopScheduler(intervals)
+    cpu_start = time.process_time()
+    scheduler.start()
     for i in range(req_count):
-        delay = random.expovariate(rate)
-        time.sleep(delay)
+        sent = scheduler.wait(i)
         index = np.random.zipf(a) % dataset_length
-        embedding = dataset[index]    
-        print(f"Sending request {i} with delay: {delay:.2f}, index: {index}", flush=True)
-        chunk_ids = generate_request(client, collection_name, embedding, i)
+        embedding = dataset[index]
+        if metrics is not None:
+            metrics.record_sent()
+        if verbose:
+            print(f"Sending request {i} at {scheduler.offsets[i]:.2f}s (lag {(sent - scheduler.intended[i]) * 1000:.1f} ms), index: {index}", flush=True)
+        chunk_ids = generate_request(client, collection_name, embedding, scheduler, i, documents, metrics, verbose,
+                                     search_params, top_k)
         chunk_id_log.append(chunk_ids)
 
-    print("\nQuery Log Results:")
-    for i, chunk_ids in enumerate(chunk_id_log):
-        print(f"Query {i}: Chunk IDs: {chunk_ids}")
+    run_stats = scheduler.run_stats()
+    run_stats["client_cpu_seconds"] = time.process_time() - cpu_start
+    stats = merge_run_stats([run_stats])
+    print_run_stats(stats)
+    if histogram_output:
+        save_histograms(histogram_output, stats["histograms"])
+
+    if verbose:
+        print("\nQuery Log Results:")
+        for i, chunk_ids in enumerate(chunk_id_log):
+            print(f"Query {i}: Chunk IDs: {chunk_ids}")
 
 
 # Argument parser
@@ -81,6 +113,14 @@ def argument_parser():
     parser.add_argument("--target-rps", type=float, required=True, help="Target requests per second (lambda)")
     parser.add_argument("--requests-count", type=int, required=True, help="Number of requests to send")
     parser.add_argument("--zipfian-alpha", type=float, default=1.2, help="Zipfian distribution parameter")
+    parser.add_argument("--qdrant-host", type=str, default="172.26.0.1", help="Qdrant host (or a qdrant_standin.py server)")
+    parser.add_argument("--qdrant-port", type=int, default=6333, help="Qdrant REST port")
+    add_transport_arguments(parser)
+    add_search_arguments(parser)
+    add_arrival_arguments(parser)
+    add_metrics_arguments(parser)
+    parser.add_argument("--histogram-output", type=str, default=None, help="Write the latency histograms of this run to this .npz file")
+    parser.add_argument("--document-store", type=str, default=None, help="Fetch top-k document text from this document store (document_store.py)")
     return parser.parse_args()
 
 
@@ -90,4 +130,15 @@ if __name__ == "__main__":
     # print("Loading dataset...", flush=True)
     dataset = load_dataset(args.dataset_dir)
 
-    main(args.collection_name, dataset, args.target_rps, args.requests_count, args.zipfian_alpha)
+    intervals = intervals_from_args(args, args.target_rps, args.requests_count)
+    report_intervals(intervals, args.target_rps, args.arrival_process)
+
+    documents = DocumentStore(args.document_store) if args.document_store else None
+    search_params = search_params_from_args(args)
+    print(f"Search: {describe_search(search_params, args.top_k)}", flush=True)
+    metrics = LiveMetrics()
+    if args.metrics_port is not None:
+        start_metrics_server(metrics, args.metrics_port)
+    start_metrics_log(metrics, args.metrics_log_interval)
+    main(args.collection_name, dataset, args.target_rps, intervals, args.zipfian_alpha, args.histogram_output, documents,
+         metrics, args.verbose, args.qdrant_host, args.qdrant_port, search_params, args.top_k, args.transport, args.grpc_port)
@@ -1,75 +1,135 @@
 import asyncio
 import argparse
-import random
 import multiprocessing
-from qdrant_client import models, AsyncQdrantClient
-from datasets import load_from_disk
+from open_loop import OpenLoopScheduler, merge_run_stats, print_run_stats
+from latency_histogram import save_histograms
+from arrival_process import add_arrival_arguments, intervals_from_args, split_intervals, report_intervals
+from embedding_pool import load_embedding_matrix, create_shared_embeddings, attach_shared_embeddings
+from document_store import DocumentStore
+from search_options import make_search_params, search_params_from_args, describe_search, add_search_arguments, DEFAULT_TOP_K
+from query_batcher import QueryBatcher, add_batch_arguments
+from qdrant_transport import make_async_client, add_transport_arguments, DEFAULT_GRPC_PORT, DEFAULT_GRPC_CHANNELS
+from live_metrics import LiveMetrics, MetricsForwarder, drain_forwarded, start_metrics_server, start_metrics_log, add_metrics_arguments
+import threading
 import time
 import os
 import numpy as np
 
-# Simulate poisson request intervals
-def poisson_delay(p_lambda):
-    return random.expovariate(p_lambda)  # Lambda값에 따른 지수 분포 간격
-
-# Load dataset once and cache in memory
-def load_dataset_once(dir, shared_list):
-    dataset = load_from_disk(dir)
-    dataset = dataset.shuffle(seed=42)
-    embeddings = dataset["embedding"]  # 원하는 열 이름을 명시적으로 지정
-    shared_list.extend(embeddings)  # Share data across processes
+# Load dataset once into a shared float32 matrix (workers attach read-only)
+def load_dataset_once(dir):
+    embeddings = load_embedding_matrix(dir)
+    shm, embedding_spec = create_shared_embeddings(embeddings)
     print(f"Dataset loaded with {len(embeddings)} embeddings", flush=True)
+    return shm, embedding_spec
 
 # Perform random insert or query
-async def generate_request(client, collection_name, embedding, request_times_queue):
-    top_k = 5
+async def generate_request(client, collection_name, embedding, scheduler, i, documents=None, metrics=None,
+                           search_params=None, top_k=DEFAULT_TOP_K, results=None, batcher=None):
     try:
-        start = time.time()
-        request_times_queue.put(start)  # Record request start time
-        hits = await client.query_points(  # 비동기 작업은 await해야 함
-            collection_name=collection_name,
-            query=embedding,
-            search_params=models.SearchParams(hnsw_ef=768, exact=False),
-            limit=top_k,
-            timeout=30000
-        )
-        end = time.time()
-        print(f"Query completed in {end - start:.2f} seconds", flush=True)
+        if batcher is not None:
+            # Coalesced with other queries into one query_batch_points call; latency includes the wait
+            hits = await batcher.query(embedding)
+        else:
+            hits = await client.query_points(  # 비동기 작업은 await해야 함
+                collection_name=collection_name,
+                query=embedding,
+                search_params=search_params or make_search_params(),
+                limit=top_k,
+                with_payload=["chunk_id"],  # Document text is not needed for ranking
+                timeout=30000
+            )
+        if results is not None:
+            results[i] = [hit.id for hit in hits.points]  # For recall against the exact top-k (param_sweep.py)
+        if documents is not None:
+            # Fetch text lazily, only for the final top-k; cold reads block, so keep them off the event loop
+            await asyncio.get_running_loop().run_in_executor(
+                None, documents.get_many, [hit.payload.get("chunk_id") for hit in hits.points])
+        done = scheduler.mark_done(i)  # Latency is aggregated into histograms at the end of the run
+        if metrics is not None:
+            metrics.record_done(done - scheduler.sent[i])
     except Exception as e:
         print(f"Query failed: {e}", flush=True)
+        if metrics is not None:
+            metrics.record_done(time.monotonic() - scheduler.sent[i], error=True)
 
-async def stress_test(client, collection_name, dataset, rate, req_count, request_times_queue, a=1.2):
+async def stress_test(client, collection_name, dataset, rate, intervals, a=1.2, documents=None, metrics=None, verbose=False,
+                      search_params=None, top_k=DEFAULT_TOP_K, results=None, batcher=None, start_time=None):
     dataset_length = len(dataset)
     tasks = []  # Keep track of all tasks
+    # Arrival times are fixed up front so slow sends do not delay later arrivals
+    req_count = len(intervals)
+    scheduler = OpenLoopScheduler(intervals)
     print(f"Starting stress test with {req_count} requests at rate {rate} RPS", flush=True)
+    scheduler.start(start_time)  # Shared by all workers so their slices line up with the global stream
     for i in range(req_count):
 
-        delay = random.expovariate(rate)
-        await asyncio.sleep(delay)
+        sent = await scheduler.async_wait(i)
         index = np.random.zipf(a) % dataset_length
 
-        embedding = dataset[index]  
-        print(f"Sending request {index} with delay {delay:.2f}", flush=True)
+        embedding = dataset[index]
+        if verbose:
+            print(f"Sending request {index} at {scheduler.offsets[i]:.2f}s (lag {(sent - scheduler.intended[i]) * 1000:.1f} ms)", flush=True)
         # embedding = dataset[i % dataset_length] # dataset[i % dataset_length]
-        tasks.append(asyncio.create_task(generate_request(client, collection_name, embedding, request_times_queue)))
+        if metrics is not None:
+            metrics.record_sent()
+        tasks.append(asyncio.create_task(generate_request(client, collection_name, embedding, scheduler, i, documents, metrics,
+                                                          search_params, top_k, results, batcher)))
     await asyncio.gather(*tasks)
     print(f"Completed stress test with {req_count} requests", flush=True)
+    return scheduler.run_stats()
 
-async def main_process(collection_name: str, dataset, rate: float, req_count: int, request_times_queue):
+async def main_process(collection_name: str, dataset, rate: float, intervals, documents=None, metrics=None, verbose=False,
+                       qdrant_host="172.26.0.1", qdrant_port=6333, search_params=None, top_k=DEFAULT_TOP_K,
+                       batch_window_ms=0.0, max_batch=64, transport="rest", grpc_port=DEFAULT_GRPC_PORT, grpc_channels=DEFAULT_GRPC_CHANNELS, start_time=None):
     print(f"Starting main process with collection: {collection_name}", flush=True)
-    client = AsyncQdrantClient(url="172.26.0.1", port=6333)
+    client = make_async_client(qdrant_host, qdrant_port, transport, grpc_port, grpc_channels)
     try:
-        await client.get_collection(collection_name=collection_name)
-        print(f"Collection '{collection_name}' checked successfully.", flush=True)
-    except Exception as e:
-        print(f"Collection check failed: {e}", flush=True)
-        return
-
-    # Start stress test
-    await stress_test(client, collection_name, dataset, rate, req_count, request_times_queue)
-
-def start_event_loop(collection_name, dataset, rate, req_count, request_times_queue):
-    asyncio.run(main_process(collection_name, dataset, rate, req_count, request_times_queue))
+        try:
+            await client.get_collection(collection_name=collection_name)
+            print(f"Collection '{collection_name}' checked successfully.", flush=True)
+        except Exception as e:
+            print(f"Collection check failed: {e}", flush=True)
+            return None
+
+        batcher = None
+        if batch_window_ms > 0:
+            batcher = QueryBatcher(client, collection_name, batch_window_ms, max_batch, search_params, top_k)
+
+        # Start stress test
+        cpu_start = time.process_time()  # Client CPU of this process, to compare transports
+        stats = await stress_test(client, collection_name, dataset, rate, intervals, documents=documents, metrics=metrics, verbose=verbose,
+                                  search_params=search_params, top_k=top_k, batcher=batcher, start_time=start_time)
+        if batcher is not None:
+            await batcher.close()
+            print(batcher.summary(), flush=True)
+        stats["client_cpu_seconds"] = time.process_time() - cpu_start
+        return stats
+    finally:
+        await client.close()  # httpx pool or gRPC channels are bound to this event loop
+
+def start_event_loop(collection_name, embedding_spec, rate, intervals, request_times_queue, document_store=None,
+                     metrics_queue=None, verbose=False, qdrant_host="172.26.0.1", qdrant_port=6333,
+                     search_params=None, top_k=DEFAULT_TOP_K, batch_window_ms=0.0, max_batch=64,
+                     transport="rest", grpc_port=DEFAULT_GRPC_PORT, grpc_channels=DEFAULT_GRPC_CHANNELS, start_time=None):
+    metrics = MetricsForwarder(metrics_queue) if metrics_queue is not None else None  # deltas to the parent's LiveMetrics
+    shm = dataset = documents = None
+    stats = None
+    try:
+        # Inside the try, so a failing attach or open still sends the one summary the parent waits for
+        shm, dataset = attach_shared_embeddings(embedding_spec)
+        documents = DocumentStore(document_store) if document_store else None  # shared through the page cache
+        stats = asyncio.run(main_process(collection_name, dataset, rate, intervals, documents, metrics, verbose,
+                                               qdrant_host, qdrant_port, search_params, top_k,
+                                               batch_window_ms, max_batch, transport, grpc_port, grpc_channels, start_time))
+    finally:
+        if metrics is not None:
+            metrics.flush()
+        dataset = None  # release the view before closing the shared block
+        if shm is not None:
+            shm.close()
+        if documents is not None:
+            documents.close()
+        request_times_queue.put(stats)  # Exactly one run summary (or None) per process
 
 def argument_parser():
     parser = argparse.ArgumentParser()
@@ -77,6 +137,17 @@ def argument_parser():
     parser.add_argument("--collection-name", type=str, required=True, help="Target collection name")
     parser.add_argument("--target-rps", type=float, required=True, help="Target requests per second (lambda)")
     parser.add_argument("--requests-count", type=int, required=True, help="Number of requests to send")
+    parser.add_argument("--qdrant-host", type=str, default="172.26.0.1", help="Qdrant host (or a qdrant_standin.py server)")
+    parser.add_argument("--qdrant-port", type=int, default=6333, help="Qdrant REST port")
+    add_transport_arguments(parser)
+    parser.add_argument("--start-delay", type=float, default=5.0,
+                        help="Seconds between launching the workers and the shared start of the arrival stream")
+    add_search_arguments(parser)
+    add_batch_arguments(parser)
+    add_arrival_arguments(parser)
+    parser.add_argument("--histogram-output", type=str, default=None, help="Write the merged latency histograms of this run to this .npz file")
+    parser.add_argument("--document-store", type=str, default=None, help="Fetch top-k document text from this document store (document_store.py)")
+    add_metrics_arguments(parser)
     return parser.parse_args()
 
 if __name__ == "__main__":
@@ -85,52 +156,91 @@ if __name__ == "__main__":
     cpu_count = os.cpu_count()
     print(f"Using {cpu_count} processes", flush=True)
 
-    manager = multiprocessing.Manager()
-    shared_embeddings = manager.list()  # Shared list for dataset
-    request_times_queue = multiprocessing.Queue()  # Shared queue for request start times
+    request_times_queue = multiprocessing.Queue()  # Shared queue for per-process run summaries
+    metrics_queue = multiprocessing.Queue()  # Periodic metric deltas from the workers
+
+    # Live metrics, merged from all workers and served while the run is going
+    metrics = LiveMetrics()
+    metrics_thread = threading.Thread(target=drain_forwarded, args=(metrics_queue, metrics), daemon=True)
+    metrics_thread.start()
+    if args.metrics_port is not None:
+        start_metrics_server(metrics, args.metrics_port)
+    start_metrics_log(metrics, args.metrics_log_interval)
+
+    # Fail before any worker starts; a worker that cannot open the store sends no stats
+    if args.document_store:
+        try:
+            DocumentStore(args.document_store).close()
+        except FileNotFoundError as e:
+            raise SystemExit(f"Cannot open document store {args.document_store}: {e}")
 
     # Load dataset once
     print("Loading dataset into shared memory...", flush=True)
-    load_dataset_once(args.dataset_dir, shared_embeddings)
+    embedding_shm, embedding_spec = load_dataset_once(args.dataset_dir)
+
+    # One arrival stream for the whole run, dealt round-robin to the worker processes
+    intervals = intervals_from_args(args, args.target_rps, args.requests_count)
+    report_intervals(intervals, args.target_rps, args.arrival_process)
+    worker_intervals = split_intervals(intervals, cpu_count)
+    search_params = search_params_from_args(args)
+    print(f"Search: {describe_search(search_params, args.top_k)}", flush=True)
+    # One start instant for every worker (CLOCK_MONOTONIC is system-wide), far enough ahead to cover process startup
+    start_time = time.monotonic() + args.start_delay
 
     processes = []
     for i in range(cpu_count):
         p = multiprocessing.Process(target=start_event_loop, args=(
             args.collection_name,
-            shared_embeddings,  # Pass shared embeddings
+            embedding_spec,  # Name and shape of the shared embedding matrix
             args.target_rps / cpu_count,  # Divide RPS across processes
-            args.requests_count // cpu_count,  # Divide request count across processes
-            request_times_queue  # Shared request times queue
+            worker_intervals[i],  # This process' share of the arrival stream
+            request_times_queue,  # Shared request times queue
+            args.document_store,  # Opened in the worker for lazy top-k text fetch
+            metrics_queue,
+            args.verbose,
+            args.qdrant_host,
+            args.qdrant_port,
+            search_params,  # hnsw_ef / exact / quantization settings of every query
+            args.top_k,
+            args.batch_window_ms,  # 0: one query_points call per request
+            args.max_batch,
+            args.transport,  # rest or grpc (prefer_grpc)
+            args.grpc_port,
+            args.grpc_channels,
+            start_time,  # Shared time.monotonic() of arrival offset 0
         ))
         print(f"Starting process {i}", flush=True)
         p.start()
         processes.append(p)
 
+    # Drain the queue before joining so no worker blocks on a full pipe
+    print("Waiting for all queue data to be processed...", flush=True)
+    process_stats = []
+    for _ in range(cpu_count):
+        data = request_times_queue.get()
+        if data is not None:
+            process_stats.append(data)
+
     for i, p in enumerate(processes):
         p.join()
         print(f"Process {i} completed", flush=True)
-        request_times_queue.put("DONE")  # 프로세스 종료 신호 추가
 
-    # Queue 비우기 및 종료 대기
-    print("Waiting for all queue data to be processed...", flush=True)
-    done_count = 0
-    request_times = []
-    
-    while done_count < cpu_count:
-        data = request_times_queue.get()
-        if data == "DONE":
-            done_count += 1
-        else:
-            request_times.append(data)
+    metrics_queue.put(None)
+    metrics_thread.join()
+    print(metrics.summary_line(), flush=True)
+
+    embedding_shm.close()
+    embedding_shm.unlink()
 
     # Analyze Actual Target RPS and Achieved RPS
-    request_times = sorted(request_times)
-    total_requests = len(request_times)
+    stats = merge_run_stats(process_stats)
+    total_requests = stats["sent"]
     if total_requests > 1:
-        total_duration = request_times[-1] - request_times[0]
         actual_target_rps = args.target_rps
-        achieved_rps = total_requests / total_duration if total_duration > 0 else 0
+        achieved_rps = print_run_stats(stats)
         print(f"Actual Target RPS: {actual_target_rps:.2f} requests/second", flush=True)
         print(f"Achieved RPS: {achieved_rps:.2f} requests/second", flush=True)
+        if args.histogram_output:
+            save_histograms(args.histogram_output, stats["histograms"])
     else:
         print("Not enough requests to calculate RPS", flush=True)
@@ -0,0 +1,108 @@
+import asyncio
+import time
+import numpy as np
+from latency_histogram import LatencyHistogram
+
+
+class OpenLoopScheduler:
+    """Open-loop request dispatcher.
+
+    Arrival times are fixed up front as absolute offsets (cumulative sum of the
+    inter-arrival intervals) and dispatched against time.monotonic(), so a slow
+    send never pushes back later arrivals. Intended, actual send and completion
+    times are kept per request so latency can be corrected for coordinated
+    omission (measured from the intended start instead of the actual send).
+    """
+
+    def __init__(self, intervals):
+        self.offsets = np.cumsum(np.asarray(intervals, dtype=np.float64))
+        self.intended = np.full(len(self.offsets), np.nan)
+        self.sent = np.full(len(self.offsets), np.nan)
+        self.done = np.full(len(self.offsets), np.nan)
+        self.start_time = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def start(self, start_time=None):
+        self.start_time = time.monotonic() if start_time is None else start_time
+        self.intended[:] = self.start_time + self.offsets
+
+    # Block until request i is due, then stamp its actual send time
+    def wait(self, i):
+        delay = self.intended[i] - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return self.mark_sent(i)
+
+    async def async_wait(self, i):
+        delay = self.intended[i] - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return self.mark_sent(i)
+
+    def mark_sent(self, i):
+        self.sent[i] = time.monotonic()
+        return self.sent[i]
+
+    def mark_done(self, i):
+        self.done[i] = time.monotonic()
+        return self.done[i]
+
+    # Latency from actual send, latency from intended start (corrected) and send lag
+    def histograms(self):
+        histograms = {name: LatencyHistogram() for name in ("latency", "corrected_latency", "send_lag")}
+        histograms["latency"].record_many(self.done - self.sent)
+        histograms["corrected_latency"].record_many(self.done - self.intended)
+        histograms["send_lag"].record_many(self.sent - self.intended)
+        return histograms
+
+    # Constant-size, picklable summary that worker processes send to the parent
+    def run_stats(self):
+        is_sent = ~np.isnan(self.sent)
+        return {
+            "scheduled": len(self),
+            "sent": int(is_sent.sum()),
+            "completed": int(np.count_nonzero(~np.isnan(self.done))),
+            "first_sent": float(self.sent[is_sent].min()) if is_sent.any() else None,
+            "last_sent": float(self.sent[is_sent].max()) if is_sent.any() else None,
+            "histograms": {name: h.to_state() for name, h in self.histograms().items()},
+        }
+
+
+def merge_run_stats(stats_list):
+    merged = {"scheduled": 0, "sent": 0, "completed": 0, "first_sent": None, "last_sent": None, "histograms": {}}
+    for stats in stats_list:
+        for key in ("scheduled", "sent", "completed"):
+            merged[key] += stats[key]
+        for key, pick in (("first_sent", min), ("last_sent", max)):
+            if stats[key] is not None:
+                merged[key] = stats[key] if merged[key] is None else pick(merged[key], stats[key])
+        if "client_cpu_seconds" in stats:
+            merged["client_cpu_seconds"] = merged.get("client_cpu_seconds", 0.0) + stats["client_cpu_seconds"]
+        for name, state in stats["histograms"].items():
+            histogram = LatencyHistogram.from_state(state)
+            if name in merged["histograms"]:
+                merged["histograms"][name].merge(histogram)
+            else:
+                merged["histograms"][name] = histogram
+    return merged
+
+
+# Print stats from merge_run_stats and return the achieved send rate
+def print_run_stats(stats):
+    achieved_rps = 0.0
+    if stats["sent"] > 1 and stats["last_sent"] > stats["first_sent"]:
+        achieved_rps = stats["sent"] / (stats["last_sent"] - stats["first_sent"])
+    print(f"Scheduled: {stats['scheduled']}, sent: {stats['sent']}, completed: {stats['completed']}", flush=True)
+    histograms = stats["histograms"]
+    histograms["send_lag"].print_summary("Send lag (actual - intended)")
+    histograms["latency"].print_summary("Latency from actual send")
+    histograms["corrected_latency"].print_summary("Latency from intended start (corrected)")
+    if "client_cpu_seconds" in stats and stats["completed"]:
+        print(f"Client CPU: {stats['client_cpu_seconds']:.2f} s, {client_cpu_per_request(stats) * 1000:.3f} ms per completed request", flush=True)
+    return achieved_rps
+
+
+def client_cpu_per_request(stats):
+    return stats["client_cpu_seconds"] / max(stats["completed"], 1)
@@ -0,0 +1,157 @@
+import csv
+import time
+import asyncio
+import argparse
+import itertools
+import numpy as np
+from datasets import load_from_disk
+from open_loop import merge_run_stats
+from arrival_process import add_arrival_arguments, intervals_from_args, report_intervals
+from embedding_pool import load_embedding_matrix
+from search_options import make_search_params, describe_search, RESCORE
+from load_generator import stress_test
+from recall_harness import load_or_compute_ground_truth, recall_at
+from qdrant_transport import make_async_client, add_transport_arguments
+
+PARETO_METRICS = ("corrected_p99", "corrected_p50", "p99", "p50")
+
+
+def sweep_grid(args):
+    """(search_params, top_k) per grid point; hnsw_ef is ignored by exact search, so exact points are not repeated per ef."""
+    points = []
+    seen = set()
+    for ef, top_k, exact, rescore, oversampling in itertools.product(args.ef, args.limit, args.exact, args.rescore, args.oversampling):
+        exact = exact == "on"
+        key = (None if exact else ef, top_k, exact, rescore, oversampling)
+        if key in seen:
+            continue
+        seen.add(key)
+        points.append((make_search_params(ef, exact, RESCORE[rescore], oversampling), top_k))
+    return points
+
+
+async def run_point(args, dataset, intervals, search_params, top_k):
+    client = make_async_client(args.qdrant_host, args.qdrant_port, args.transport, args.grpc_port, args.grpc_channels)
+    results = [None] * len(intervals)
+    try:
+        stats = await stress_test(client, args.collection_name, dataset, args.target_rps, intervals,
+                                  search_params=search_params, top_k=top_k, results=results)
+    finally:
+        await client.close()
+    return stats, results
+
+
+def point_row(name, stats, results, truth, top_k):
+    stats = merge_run_stats([stats])
+    histograms = {name: h.summary() for name, h in stats["histograms"].items()}
+    achieved_rps = 0.0
+    if stats["sent"] > 1 and stats["last_sent"] > stats["first_sent"]:
+        achieved_rps = stats["sent"] / (stats["last_sent"] - stats["first_sent"])
+    return {
+        "search": name,
+        "recall": recall_at(results, truth, top_k),
+        "achieved_rps": achieved_rps,
+        "completed": stats["completed"],
+        "errors": stats["sent"] - stats["completed"],
+        "p50": histograms["latency"]["p50"],
+        "p99": histograms["latency"]["p99"],
+        "corrected_p50": histograms["corrected_latency"]["p50"],
+        "corrected_p99": histograms["corrected_latency"]["p99"],
+    }
+
+
+def pareto_frontier(rows, metric):
+    """Rows no other row beats on both `metric` (lower) and recall (higher)."""
+    frontier = []
+    best_recall = -1.0
+    for row in sorted(rows, key=lambda row: (row[metric], -row["recall"])):
+        if row["recall"] > best_recall:
+            frontier.append(row)
+            best_recall = row["recall"]
+    return frontier
+
+
+def print_report(rows, frontier, metric, target_recall=None):
+    on_frontier = {id(row) for row in frontier}
+    print(f"\n{'':1} {'search':<36} {'recall':>7} {'RPS':>8} {'errors':>7} {'P50':>8} {'P99':>8} {'cP50':>8} {'cP99':>8}")
+    for row in sorted(rows, key=lambda row: row[metric]):
+        print(f"{'*' if id(row) in on_frontier else '':1} {row['search']:<36} {row['recall']:>7.4f} {row['achieved_rps']:>8.1f} "
+              f"{row['errors']:>7} {row['p50']:>8.4f} {row['p99']:>8.4f} {row['corrected_p50']:>8.4f} {row['corrected_p99']:>8.4f}")
+    print(f"* Pareto frontier on recall vs {metric} (cP = latency from the intended start)")
+    if target_recall is not None:
+        cheapest = next((row for row in frontier if row["recall"] >= target_recall), None)
+        if cheapest is None:
+            print(f"No setting reaches recall {target_recall}", flush=True)
+        else:
+            print(f"Cheapest setting with recall >= {target_recall}: {cheapest['search']} "
+                  f"({metric} {cheapest[metric]:.4f} s)", flush=True)
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset-dir", type=str, required=True, help="Embedded question dataset (as for load_generator.py)")
+    parser.add_argument("--collection-name", type=str, required=True, help="Target collection name")
+    parser.add_argument("--collection-dataset-path", type=str, default="/app/wiki_test", help="Dataset the collection was built from, for the ground truth")
+    parser.add_argument("--document-count", type=int, default=1000000000, help="Same --document-count as build_vectorDB.py")
+    parser.add_argument("--target-rps", type=float, required=True, help="Target requests per second of every point")
+    parser.add_argument("--requests-count", type=int, required=True, help="Requests per point")
+    parser.add_argument("--qdrant-host", type=str, default="172.26.0.1")
+    parser.add_argument("--qdrant-port", type=int, default=6333)
+    add_transport_arguments(parser)
+    ### Grid
+    parser.add_argument("--ef", type=int, nargs="+", default=[64, 128, 256, 512, 768], help="hnsw_ef values")
+    parser.add_argument("--limit", type=int, nargs="+", default=[5], help="top-k values")
+    parser.add_argument("--exact", type=str, nargs="+", choices=("off", "on"), default=["off"], help="Exact search settings")
+    parser.add_argument("--rescore", type=str, nargs="+", choices=tuple(RESCORE), default=["default"], help="Quantization rescoring settings")
+    parser.add_argument("--oversampling", type=float, nargs="+", default=[None], help="Quantization oversampling factors")
+    ### Report
+    parser.add_argument("--pareto-metric", type=str, choices=PARETO_METRICS, default="corrected_p99", help="Latency axis of the frontier")
+    parser.add_argument("--target-recall", type=float, default=None, help="Report the cheapest frontier point reaching this recall")
+    parser.add_argument("--cooldown", type=float, default=5.0, help="Seconds between points so queued work drains")
+    parser.add_argument("--ground-truth", type=str, default=None,
+                        help="Ground-truth cache (default: <dataset-dir>_groundtruth_q<count>_k<max limit>.npz)")
+    parser.add_argument("--threads", type=int, default=8, help="Ground-truth threads")
+    parser.add_argument("--output", type=str, default=None, help="Write every point to this CSV")
+    add_arrival_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argument_parser()
+
+    dataset = load_embedding_matrix(args.dataset_dir)
+    # Request i queries dataset[i % len(dataset)], as in load_generator.py
+    query_rows = np.arange(args.requests_count) % len(dataset)
+    max_limit = max(args.limit)
+    ground_truth_file = args.ground_truth or f"{args.dataset_dir.rstrip('/')}_groundtruth_q{query_rows.max() + 1}_k{max_limit}.npz"
+    truth, _ = load_or_compute_ground_truth(ground_truth_file, dataset[:query_rows.max() + 1], load_from_disk(args.collection_dataset_path),
+                                            args.collection_dataset_path, args.dataset_dir, max_limit, args.document_count,
+                                            threads=args.threads)
+    truth = truth[query_rows]
+
+    # One arrival trace, replayed for every grid point
+    intervals = intervals_from_args(args, args.target_rps, args.requests_count)
+    report_intervals(intervals, args.target_rps, args.arrival_process)
+
+    rows = []
+    points = sweep_grid(args)
+    for n, (search_params, top_k) in enumerate(points):
+        name = describe_search(search_params, top_k)
+        print(f"Point {n + 1}/{len(points)}: {name}", flush=True)
+        stats, results = asyncio.run(run_point(args, dataset, intervals, search_params, top_k))
+        row = point_row(name, stats, results, truth, top_k)
+        rows.append(row)
+        print(f"  recall@{top_k} {row['recall']:.4f}, {row['achieved_rps']:.1f} RPS, corrected P99 {row['corrected_p99']:.4f} s", flush=True)
+        if n + 1 < len(points):
+            time.sleep(args.cooldown)
+
+    frontier = pareto_frontier(rows, args.pareto_metric)
+    print_report(rows, frontier, args.pareto_metric, args.target_recall)
+
+    if args.output:
+        frontier_ids = {id(row) for row in frontier}
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) + ["pareto"])
+            writer.writeheader()
+            writer.writerows([dict(row, pareto=id(row) in frontier_ids) for row in rows])
+        print(f"Sweep results saved to {args.output}")
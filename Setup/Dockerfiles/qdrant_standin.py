@@ -0,0 +1,277 @@
+import time
+import asyncio
+import argparse
+import numpy as np
+import aiohttp
+from aiohttp import web
+
+SERVICE_TIMES = ("none", "constant", "exponential", "lognormal")
+
+
+class ServiceTime:
+    """Injected service time in seconds: none, constant, exponential or lognormal around `mean_ms`."""
+
+    def __init__(self, kind="none", mean_ms=0.0, sigma=0.5, seed=0):
+        self.kind = kind
+        self.mean = mean_ms / 1000
+        self.sigma = sigma
+        self.rng = np.random.default_rng(seed)
+
+    def sample(self):
+        if self.kind == "none" or self.mean <= 0:
+            return 0.0
+        if self.kind == "constant":
+            return self.mean
+        if self.kind == "exponential":
+            return self.rng.exponential(self.mean)
+        # lognormal with the requested mean
+        return self.rng.lognormal(np.log(self.mean) - self.sigma ** 2 / 2, self.sigma)
+
+    async def wait(self):
+        delay = self.sample()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class BruteForceIndex:
+    """Exact top-k over a float32 matrix (cosine: rows are normalized once, queries per call)."""
+
+    def __init__(self, vectors, ids=None):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        self.ids = np.arange(len(vectors)) if ids is None else np.asarray(ids)
+
+    def search(self, queries, limit):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = queries @ self.vectors.T
+        limit = min(limit, scores.shape[1])
+        top = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def load_vectors(args):
+    """(vectors, chunk ids) from --vectors-file, --dataset-path or seeded random data."""
+    if args.vectors_file:
+        vectors = np.load(args.vectors_file, mmap_mode="r")[:args.points]
+        return vectors, np.arange(len(vectors))
+    if args.dataset_path:
+        from datasets import load_from_disk
+
+        dataset = load_from_disk(args.dataset_path)
+        dataset = dataset.select(range(min(args.points, len(dataset)))).with_format("numpy", columns=["embedding", "chunk_id"])
+        return np.asarray(dataset["embedding"], dtype=np.float32), np.asarray(dataset["chunk_id"])
+    rng = np.random.default_rng(args.seed)
+    return rng.standard_normal((args.points, args.dim), dtype=np.float32), np.arange(args.points)
+
+
+def ok(result, start):
+    return web.json_response({"result": result, "status": "ok", "time": time.monotonic() - start})
+
+
+def collection_info(index):
+    # Enough of CollectionInfo for qdrant_client to parse get_collection
+    return {
+        "status": "green",
+        "optimizer_status": "ok",
+        "indexed_vectors_count": len(index.ids),
+        "points_count": len(index.ids),
+        "segments_count": 1,
+        "config": {
+            "params": {"vectors": {"size": index.vectors.shape[1], "distance": "Cosine"}, "shard_number": 1,
+                       "replication_factor": 1, "write_consistency_factor": 1, "on_disk_payload": True},
+            "hnsw_config": {"m": 16, "ef_construct": 100, "full_scan_threshold": 10000,
+                            "max_indexing_threads": 0, "on_disk": False},
+            "optimizer_config": {"deleted_threshold": 0.2, "vacuum_min_vector_number": 1000,
+                                 "default_segment_number": 0, "max_segment_size": None, "memmap_threshold": None,
+                                 "indexing_threshold": 20000, "flush_interval_sec": 5, "max_optimization_threads": None},
+            "wal_config": {"wal_capacity_mb": 32, "wal_segments_ahead": 0},
+            "quantization_config": None,
+        },
+        "payload_schema": {},
+    }
+
+
+class QdrantStandin:
+    """In-process stand-in for the Qdrant REST endpoints and the GPU server's /retrieve.
+
+    Search cost is the real brute-force matmul (in a worker thread) plus an injected
+    service time, so client overhead and the achievable request rate can be measured
+    without the testbed.
+    """
+
+    def __init__(self, collection_name, index, search_time, retrieve_time, ttft_time, callback_url=None,
+                 search_threads=4):
+        self.collection_name = collection_name
+        self.index = index
+        self.search_time = search_time
+        self.retrieve_time = retrieve_time
+        self.ttft_time = ttft_time
+        self.callback_url = callback_url
+        self.search_semaphore = asyncio.Semaphore(search_threads)
+        self.session = None
+        self.requests = 0
+
+    def routes(self):
+        return [
+            web.get("/", self.root),
+            web.get("/collections", self.collections),
+            web.get("/collections/{name}", self.get_collection),
+            web.post("/collections/{name}/points/count", self.count),
+            web.post("/collections/{name}/points/query", self.query),
+            web.post("/collections/{name}/points/query/batch", self.query_batch),
+            web.post("/collections/{name}/points/search", self.search),
+            web.post("/retrieve", self.retrieve),
+        ]
+
+    def check_collection(self, request):
+        if request.match_info["name"] != self.collection_name:
+            raise web.HTTPNotFound(text=f'{{"status": {{"error": "Collection {request.match_info["name"]} not found"}}}}',
+                                   content_type="application/json")
+
+    async def root(self, request):
+        return web.json_response({"title": "qdrant - vector search engine (stand-in)", "version": "1.12.0"})
+
+    async def collections(self, request):
+        return ok({"collections": [{"name": self.collection_name}]}, time.monotonic())
+
+    async def get_collection(self, request):
+        start = time.monotonic()
+        self.check_collection(request)
+        return ok(collection_info(self.index), start)
+
+    async def count(self, request):
+        start = time.monotonic()
+        self.check_collection(request)
+        return ok({"count": len(self.index.ids)}, start)
+
+    async def search_points(self, queries, limit, with_payload):
+        async with self.search_semaphore:
+            top, scores = await asyncio.get_running_loop().run_in_executor(None, self.index.search, queries, limit)
+        await self.search_time.wait()
+        self.requests += len(top)
+        results = []
+        for rows, row_scores in zip(top.tolist(), scores.tolist()):
+            points = []
+            for row, score in zip(rows, row_scores):
+                point = {"id": row, "version": 0, "score": score}
+                if with_payload:
+                    point["payload"] = {"chunk_id": self.index.ids[row].item()}
+                points.append(point)
+            results.append(points)
+        return results
+
+    @staticmethod
+    def query_vector(body):
+        query = body.get("query")
+        if isinstance(query, dict):  # {"nearest": [...]}
+            query = query.get("nearest", query)
+        return query if query is not None else body.get("vector")
+
+    async def query(self, request):
+        start = time.monotonic()
+        self.check_collection(request)
+        body = await request.json()
+        points = await self.search_points([self.query_vector(body)], body.get("limit", 10), body.get("with_payload"))
+        return ok({"points": points[0]}, start)
+
+    async def query_batch(self, request):
+        start = time.monotonic()
+        self.check_collection(request)
+        searches = (await request.json())["searches"]
+        # One matmul per distinct limit, like a server-side batch
+        results = [None] * len(searches)
+        by_limit = {}
+        for i, search in enumerate(searches):
+            by_limit.setdefault((search.get("limit", 10), bool(search.get("with_payload"))), []).append(i)
+        for (limit, with_payload), members in by_limit.items():
+            points = await self.search_points([self.query_vector(searches[i]) for i in members], limit, with_payload)
+            for i, result in zip(members, points):
+                results[i] = {"points": result}
+        return ok(results, start)
+
+    async def search(self, request):
+        start = time.monotonic()
+        self.check_collection(request)
+        body = await request.json()
+        points = await self.search_points([body["vector"]], body.get("limit", 10), body.get("with_payload"))
+        return ok(points[0], start)
+
+    async def callback(self, path, payload):
+        if self.callback_url is None:
+            return
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        try:
+            async with self.session.post(f"{self.callback_url}{path}", json=payload) as response:
+                await response.read()
+        except aiohttp.ClientError as e:
+            print(f"Callback {path} failed: {e!r}", flush=True)
+
+    async def retrieve(self, request):
+        """GPU server stand-in: embed + retrieve time, then /TTFT, then LLM time and /complete."""
+        data = await request.json()
+        query_id = data["query_id"]
+        await self.retrieve_time.wait()
+        await self.callback("/TTFT", {"query_id": query_id})
+        await self.ttft_time.wait()
+        await self.callback("/complete", {"query_id": query_id})
+        if data.get("message") == "end":
+            asyncio.get_running_loop().call_later(1, lambda: asyncio.ensure_future(self.callback("/notify_completion", {})))
+        return web.json_response({"status": "ok", "query_id": query_id})
+
+
+def add_service_time_arguments(parser, name, help_text, default_ms=0.0):
+    parser.add_argument(f"--{name}-time", type=str, choices=SERVICE_TIMES, default="exponential",
+                        help=f"{help_text} distribution (no delay while the mean is 0)")
+    parser.add_argument(f"--{name}-mean-ms", type=float, default=default_ms, help=f"{help_text} mean (ms)")
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=6333, help="Serve both Qdrant REST and /retrieve on this port")
+    parser.add_argument("--collection-name", type=str, default="wiki_passages")
+    parser.add_argument("--points", type=int, default=100000, help="Vectors in the in-memory index")
+    parser.add_argument("--dim", type=int, default=384, help="Dimension of the random vectors")
+    parser.add_argument("--vectors-file", type=str, default=None, help="Index these (N, dim) vectors from a .npy file")
+    parser.add_argument("--dataset-path", type=str, default=None, help="Index the embedding/chunk_id columns of this dataset")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--search-threads", type=int, default=4, help="Concurrent brute-force searches")
+    add_service_time_arguments(parser, "search", "Injected search service time")
+    add_service_time_arguments(parser, "retrieve", "/retrieve time before the TTFT callback")
+    add_service_time_arguments(parser, "generation", "/retrieve time between the TTFT and complete callbacks")
+    parser.add_argument("--service-sigma", type=float, default=0.5, help="Sigma of lognormal service times")
+    parser.add_argument("--callback-url", type=str, default="http://127.0.0.1:6000",
+                        help="Question server receiving /TTFT, /complete and /notify_completion")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argument_parser()
+    vectors, ids = load_vectors(args)
+    index = BruteForceIndex(vectors, ids)
+    print(f"Stand-in collection '{args.collection_name}': {len(ids)} x {index.vectors.shape[1]} vectors", flush=True)
+
+    async def main():
+        standin = QdrantStandin(
+            args.collection_name, index,
+            ServiceTime(args.search_time, args.search_mean_ms, args.service_sigma, args.seed),
+            ServiceTime(args.retrieve_time, args.retrieve_mean_ms, args.service_sigma, args.seed + 1),
+            ServiceTime(args.generation_time, args.generation_mean_ms, args.service_sigma, args.seed + 2),
+            args.callback_url, args.search_threads)
+        app = web.Application(client_max_size=64 << 20)
+        app.add_routes(standin.routes())
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, args.host, args.port).start()
+        print(f"Listening on http://{args.host}:{args.port}", flush=True)
+        last = 0
+        while True:
+            await asyncio.sleep(10)
+            print(f"Searches: {standin.requests} ({(standin.requests - last) / 10:.1f}/s)", flush=True)
+            last = standin.requests
+
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+from itertools import cycle
+from qdrant_client import QdrantClient, AsyncQdrantClient
+
+TRANSPORTS = ("rest", "http", "grpc")  # http is the same REST/JSON client as rest
+DEFAULT_GRPC_PORT = 6334
+DEFAULT_GRPC_CHANNELS = 4  # per process; library callers and --grpc-channels share it
+
+
+class ClientPool:
+    """Round-robin over several async clients, each with its own gRPC channel.
+
+    One channel multiplexes every call over a single HTTP/2 connection, which
+    becomes the bottleneck with thousands of in-flight queries per process.
+    Method calls go to the next client, so the pool is used like one client.
+    """
+
+    def __init__(self, clients):
+        self.clients = clients
+        self._next = cycle(clients)
+
+    def __getattr__(self, name):
+        return getattr(next(self._next), name)
+
+    async def close(self):
+        for client in self.clients:
+            await client.close()
+
+
+def make_client(host, port=6333, transport="rest", grpc_port=DEFAULT_GRPC_PORT):
+    if transport == "grpc":
+        return QdrantClient(host=host, port=port, grpc_port=grpc_port, prefer_grpc=True)
+    return QdrantClient(host=host, port=port)
+
+
+def make_async_client(host, port=6333, transport="rest", grpc_port=DEFAULT_GRPC_PORT, grpc_channels=DEFAULT_GRPC_CHANNELS):
+    if transport == "grpc":
+        clients = [AsyncQdrantClient(host=host, port=port, grpc_port=grpc_port, prefer_grpc=True) for _ in range(grpc_channels)]
+        return clients[0] if len(clients) == 1 else ClientPool(clients)
+    # httpx already keeps a pool of keep-alive connections
+    return AsyncQdrantClient(host=host, port=port)
+
+
+def add_transport_arguments(parser, transport=True):
+    if transport:
+        parser.add_argument("--transport", type=str, choices=TRANSPORTS, default="rest", help="Qdrant client protocol")
+    parser.add_argument("--grpc-port", type=int, default=DEFAULT_GRPC_PORT, help="Qdrant gRPC port (with --transport grpc)")
+    parser.add_argument("--grpc-channels", type=int, default=DEFAULT_GRPC_CHANNELS,
+                        help="gRPC channels per process, used round-robin (with --transport grpc)")
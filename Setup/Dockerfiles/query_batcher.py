@@ -0,0 +1,86 @@
+import asyncio
+from qdrant_client import models
+from search_options import make_search_params, DEFAULT_TOP_K
+
+
+class QueryBatcher:
+    """Coalesce concurrent queries into query_batch_points calls.
+
+    The first query of a batch starts a `window_ms` timer; the batch is sent when
+    the timer fires or `max_batch` queries are waiting, whichever comes first.
+    Each caller awaits its own future, so per-request latency measured around
+    query() includes the time spent waiting for the batch.
+    """
+
+    def __init__(self, client, collection_name, window_ms=2.0, max_batch=64, search_params=None, top_k=DEFAULT_TOP_K,
+                 with_payload=("chunk_id",), timeout=30000):
+        self.client = client
+        self.collection_name = collection_name
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.search_params = search_params or make_search_params()
+        self.top_k = top_k
+        self.with_payload = list(with_payload) if with_payload else False
+        self.timeout = timeout
+        self.pending = []
+        self.timer = None
+        self.in_flight = set()
+        self.batches = 0
+        self.batched = 0
+        self.full_batches = 0
+
+    async def query(self, embedding):
+        """Result of one query (a QueryResponse, like query_points)."""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((embedding, future))
+        if len(self.pending) >= self.max_batch:
+            self.full_batches += 1
+            self._flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        task = asyncio.ensure_future(self._send(batch))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+
+    async def _send(self, batch):
+        self.batches += 1
+        self.batched += len(batch)
+        requests = [models.QueryRequest(query=embedding, limit=self.top_k, params=self.search_params, with_payload=self.with_payload)
+                    for embedding, _ in batch]
+        try:
+            responses = await self.client.query_batch_points(collection_name=self.collection_name, requests=requests,
+                                                             timeout=self.timeout)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), response in zip(batch, responses):
+            if not future.done():
+                future.set_result(response)
+
+    async def close(self):
+        """Send what is still waiting and wait for every outstanding batch."""
+        self._flush()
+        if self.in_flight:
+            await asyncio.gather(*self.in_flight, return_exceptions=True)
+
+    def summary(self):
+        mean = self.batched / self.batches if self.batches else 0.0
+        return (f"Batches: {self.batches}, mean size {mean:.1f} (max {self.max_batch}, window {self.window * 1000:g} ms), "
+                f"sent full: {self.full_batches}")
+
+
+def add_batch_arguments(parser):
+    parser.add_argument("--batch-window-ms", type=float, default=0.0,
+                        help="Coalesce queries arriving within this window into one query_batch_points call (0: one call per query)")
+    parser.add_argument("--max-batch", type=int, default=64, help="Queries per batch before it is sent without waiting for the window")
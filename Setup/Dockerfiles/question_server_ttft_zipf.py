@@ -1,24 +1,31 @@
-
 ### Basic modules
 import argparse
+import asyncio
 from datasets import load_from_disk, Dataset, load_dataset
-import requests
+import aiohttp
+from aiohttp import web
 import numpy as np
-import random
 import time
-from flask import Flask, request, jsonify
 import os
-from threading import Thread
-
-request_timings = {}
-app = Flask(__name__)
+from open_loop import OpenLoopScheduler
+from arrival_process import add_arrival_arguments, intervals_from_args, report_intervals
+from timing_table import TimingTable, add_slo_arguments
+from live_metrics import LiveMetrics, start_metrics_log, add_metrics_arguments
+
+# One preallocated slot per query id, filled by the sender and the callback handlers
+timing_table = None
+histogram_output = None
+timings_output = None
+# Rolling QPS / TTFT percentiles, served next to the callbacks at /metrics and /metrics.json
+live_metrics = LiveMetrics()
+verbose = False
 
 def load_question (dir):
     question_dataset = load_from_disk(dir)
 
     return question_dataset
 
-def send_request(query_id, query, url, query_count):
+async def send_request(session, query_id, query, url, query_count, intended_time=None):
     # Communicate with the Retrieval Server
     query_id = int(query_id)
     if query_id == 0:
@@ -27,37 +34,71 @@ def send_request(query_id, query, url, query_count):
         message = 'end'
     else:
         message = 'normal'
-    if query_id not in request_timings:
-        request_timings[query_id] = {}
-
-    # start_time 설정
-    request_timings[query_id]['start_time'] = time.time()
-    response = requests.post(url, json={"message": message, "query_id": query_id, "query": query})
-    if response.status_code != 200:
-        print(f"Error retrieving data: {response.status_code}")
-        print(f"Response details: {response.json()}")
+
+    # start_time 설정 (intended_time is when the open-loop schedule wanted this query sent)
+    start_time = timing_table.mark_start(query_id, intended_time)
+    live_metrics.record_sent()
+    try:
+        async with session.post(url, json={"message": message, "query_id": query_id, "query": query}) as response:
+            if response.status != 200:
+                print(f"Error retrieving data: {response.status}")
+                print(f"Response details: {await response.text()}")
+                live_metrics.record_done(time.monotonic() - start_time, error=True)
+                return
+            await response.read()
+    except aiohttp.ClientError as e:
+        print(f"Error retrieving data for query {query_id}: {e!r}", flush=True)
+        live_metrics.record_done(time.monotonic() - start_time, error=True)
         return
 
-    print(f"response {query_id}: {response}")
+    if verbose:
+        print(f"response {query_id}: {response.status}")
 
     return response
 
-# generate quert_count # of requests following poisson distriution by randomly select question from question_dataset.
-def generate_requests(url, question_dataset, qps, query_count):
-
-    lambda_value = 1/qps
-
-    for i in range(query_count):
-        # wait 
-        wait_interval = np.random.poisson(lambda_value)
-        # wait_interval = lambda_value
-        time.sleep(wait_interval)
-        # time.sleep(0.01)
-        index = np.random.zipf(1.2) % len(question_dataset)
-        question = question_dataset[index]['question']
-
-        print(f"Sending question to vector DB {i}: {question}")
-        send_request(i, question, url, query_count)
+async def bounded_send(semaphore, session, query_id, query, url, query_count, intended_time):
+    try:
+        await send_request(session, query_id, query, url, query_count, intended_time)
+    finally:
+        semaphore.release()
+
+# generate len(intervals) requests following the chosen arrival process (see arrival_process.py).
+async def generate_requests(url, question_dataset, intervals, max_inflight=256):
+
+    query_count = len(intervals)
+
+    # Arrival times are fixed up front and dispatched on the monotonic clock. Each question
+    # is sent as its own task, so a slow retrieval does not push back the following questions;
+    # at most max_inflight requests are outstanding, any further arrival waits for a free slot
+    # (the corrected TTFT, measured from the intended time, includes that wait).
+    semaphore = asyncio.Semaphore(max_inflight)
+    connector = aiohttp.TCPConnector(limit=max_inflight, keepalive_timeout=60)
+    tasks = set()
+    saturated = 0
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None)) as session:
+        scheduler = OpenLoopScheduler(intervals)
+        scheduler.start()
+        for i in range(query_count):
+            # wait
+            await scheduler.async_wait(i)
+            if semaphore.locked():
+                saturated += 1
+            await semaphore.acquire()
+            index = np.random.zipf(1.2) % len(question_dataset)
+            question = question_dataset[index]['question']
+            if i == query_count - 1 and tasks:
+                # The 'end' message goes out after every earlier question has been answered
+                await asyncio.gather(*tasks)
+
+            if verbose:
+                print(f"Sending question to vector DB {i}: {question}")
+            task = asyncio.create_task(bounded_send(semaphore, session, i, question, url, query_count, scheduler.intended[i]))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    if saturated:
+        print(f"{saturated} questions waited for a free slot (--max-inflight {max_inflight})", flush=True)
 
 
 def argument_parser():
@@ -68,126 +109,79 @@ def argument_parser():
     parser.add_argument("--target-qps", type=float, help="target qps to generate request")
     parser.add_argument("--query-count", type=int, help="total query count to generate request")
     parser.add_argument("--gpu-server-ip", type=str, default="163.152.48.206", help="GPU server IP address")
+    parser.add_argument("--gpu-server-port", type=int, default=5003, help="GPU server port (or a qdrant_standin.py server)")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Maximum outstanding questions (pooled keep-alive connections)")
+    add_arrival_arguments(parser)
+    add_slo_arguments(parser)
+    add_metrics_arguments(parser, metrics_port=False)
+    parser.add_argument("--histogram-output", type=str, default=None, help="Write TTFT and query time histograms to this .npz file")
 
     args = parser.parse_args()
     return args
 
-def print_timings():
-    total_end_time = time.time()
-    total_query_time = 0.0
-    total_ttft_time = 0.0
-    ttft_list = []
-    print("\nTTFT Summary:")
-    for query_id, timings in request_timings.items():
-        start_time = timings.get('start_time')
-        LLM_TTFT = timings.get('TTFT_time')
-        end_time = timings.get('complete_time')
-        if start_time is not None and LLM_TTFT is not None and end_time is not None:
-            TTFT = LLM_TTFT - start_time
-            ttft_list.append(TTFT)
-            print(f"Query ID {query_id} TTFT : {TTFT:.4f} seconds")
-            query_time = end_time - start_time
-            total_query_time += query_time
-            total_ttft_time += TTFT
-            print(f"Query ID {query_id} query_time: {query_time:.4f} seconds")
-        else:
-            print(f"Query ID {query_id}: Incomplete timings")
-    # Query ID 1의 start_time 확인 (문자열로 처리 가능)
-    first_start_time = request_timings.get("1", {}).get('start_time') or request_timings.get(1, {}).get('start_time')
-
-    if first_start_time is not None:
-        total_duration = total_end_time - first_start_time
-        query_count = len(request_timings)
-        print(f"Total execution time: {total_duration:.4f} seconds")
-        print(f"\nAverage query time: {total_query_time/query_count:.4f} seconds")
-
-        # RPS 계산
-        if query_count > 0:
-            rps = query_count / total_duration
-            average_TTFT = total_ttft_time / query_count
-            print(f"RPS : {rps:.4f} requests/second\n")
-            print(f"average TTFT: {average_TTFT:.4f} seconds")
-                        # P99 TTFT 계산
-            if len(ttft_list) > 0:
-                p99_ttft = np.percentile(ttft_list, 99)
-                print(f"P99 TTFT: {p99_ttft:.4f} seconds\n")
-            else:
-                print("No TTFT data available for P99 calculation.")
-        else:
-            print("No queries processed.")
-    else:
-        print("\nQuery ID 1 start time is missing.")
-
-@app.route('/TTFT', methods=['POST'])
-def TTFT():
-    data = request.json
-    query_id = int(data['query_id'])
-    current_time = time.time()
-
-    # start_time 확인 및 TTFT_time 저장
-    if query_id in request_timings:
-        start_time = request_timings[query_id].get('start_time')
-        request_timings[query_id]['TTFT_time'] = current_time
-
-        # TTFT 계산 및 출력
-        if start_time is not None:
-            ttft = current_time - start_time
-            if ttft >= 30:
-                print(f"TTFT is higher than 30 sec, Current TTFT is {ttft:.4f} seconds", flush=True)
-                os._exit(1)
-            print(f"Query ID: {query_id}, TTFT: {ttft:.4f} seconds", flush=True)
-        else:
-            print(f"Query ID: {query_id}, Start time not found.", flush=True)
-    else:
-        # 만약 request_timings에 없는 query_id라면 새로 추가
-        request_timings[query_id] = {'TTFT_time': current_time}
-        print(f"Query ID: {query_id}, Start time missing. Added entry.", flush=True)
-
-    return jsonify({'status': 'received'}), 200
-
-@app.route('/complete', methods=['POST'])
-def complete():
-    data = request.json
-    query_id = int(data['query_id'])
-    if query_id in request_timings:
-        request_timings[query_id]['complete_time'] = time.time()
-    else:
-        request_timings[query_id] = {'complete_time': time.time()}
-    return jsonify({'status': 'received'}), 200
-
-@app.route('/notify_completion', methods=['POST'])
-def notify_completion():
-    print_timings()
-    def delayed_shutdown():
-        time.sleep(10)
-        os._exit(0)
-
-    shutdown_thread = Thread(target=delayed_shutdown)
-    shutdown_thread.start()
-    return jsonify({'status': 'received'}), 200
+# Callback handlers run on the same event loop as the request generator
+async def TTFT(request):
+    data = await request.json()
+    # TTFT 계산 (SLO violations are handled by --slo-policy)
+    ttft = timing_table.mark_ttft(data['query_id'])
+    if ttft is not None:
+        live_metrics.record_done(ttft)
+    return web.json_response({'status': 'received'})
+
+async def complete(request):
+    data = await request.json()
+    timing_table.mark_complete(data['query_id'])
+    return web.json_response({'status': 'received'})
+
+async def metrics(request):
+    return web.Response(text=live_metrics.prometheus("question"), content_type="text/plain")
+
+async def metrics_json(request):
+    return web.json_response(live_metrics.snapshot())
+
+async def notify_completion(request):
+    timing_table.report(histogram_output, timings_output)
+    # delayed shutdown
+    asyncio.get_running_loop().call_later(10, os._exit, 0)
+    return web.json_response({'status': 'received'})
+
+async def start_server(host='0.0.0.0', port=6000):
+    app = web.Application()
+    app.add_routes([web.post('/TTFT', TTFT), web.post('/complete', complete),
+                    web.post('/notify_completion', notify_completion),
+                    web.get('/metrics', metrics), web.get('/metrics.json', metrics_json)])
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+async def main(args, url, question_dataset):
+    global timing_table
+    target_qps = args.target_qps
+    query_count = args.query_count
+    intervals = intervals_from_args(args, target_qps, query_count)
+    report_intervals(intervals, target_qps, args.arrival_process)
+    timing_table = TimingTable(len(intervals), args.ttft_slo, args.slo_policy)
+
+    await start_server()
+    start_metrics_log(live_metrics, args.metrics_log_interval)
+    await generate_requests(url, question_dataset, intervals, args.max_inflight)
+
+    # Keep serving callbacks until /notify_completion shuts the process down
+    await asyncio.Event().wait()
 
 if __name__ == "__main__":
     args = argument_parser()
 
-    EMBEDDING_URL = f"http://{args.gpu_server_ip}:5003/retrieve"
+    EMBEDDING_URL = f"http://{args.gpu_server_ip}:{args.gpu_server_port}/retrieve"
+    histogram_output = args.histogram_output
+    timings_output = args.timings_output
+    verbose = args.verbose
 
     question_dir = args.question_dir
 
     ### Load question dataset
     question_dataset = load_question(question_dir)
 
-    # Define function for generate_requests
-    def run_generate_requests():
-        target_qps = args.target_qps
-        query_count = args.query_count
-        generate_requests(EMBEDDING_URL, question_dataset, target_qps, query_count)
-
-    # Start Flask server in main thread
-    app_thread = Thread(target=app.run, kwargs={'host': '0.0.0.0', 'port': 6000})
-    app_thread.start()
-
-    # Start generate_requests in another thread
-    request_thread = Thread(target=run_generate_requests)
-    request_thread.start()
-
-    
\ No newline at end of file
+    # Callback server and question stream share one event loop
+    asyncio.run(main(args, EMBEDDING_URL, question_dataset))
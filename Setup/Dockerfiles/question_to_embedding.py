@@ -1,12 +1,27 @@
 
 ### Basic modules
+import os
 import argparse
-from datasets import load_from_disk, Dataset, load_dataset, Features, Value, Sequence
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datasets import load_from_disk, Dataset
 import time
+import numpy as np
+import pyarrow as pa
 from sentence_transformers import SentenceTransformer
+from embedding_cache import EmbeddingCache, model_identifier
 
 
-def load_question(dir, split, num):
+# "input" for bioasq, "question.text" for NQ_default (nested struct field)
+def question_value(item, field):
+    value = item
+    for name in field.split("."):
+        value = value[name]
+    return value
+
+
+def load_question(dir, split, num, field="input"):
     print("Loading questions...")
     dataset = load_from_disk(dir)
 
@@ -22,10 +37,9 @@ def load_question(dir, split, num):
     for i, item in enumerate(dataset_split):
         if i >= num: break
         question_id = item['id']
-        # question = item['question']['text'] # use this when question is NQ_default
-        question = item['input'] #use this when question is bioasq
+        question = question_value(item, field)
         questions_list.append({"question_id": question_id, "question": question})
-        if (i%1000 == 0 ): 
+        if (i%1000 == 0 ):
             end = time.time()
             print(f"Loading {i}/{dataset_num}: {end-start:.2f} seconds elapsed.", flush=True)
             start = end
@@ -41,67 +55,236 @@ def store_question(questions_list, dir):
     print("Storing questions done.")
 
 
-def embedding_question(model_dir, questions_list):
+def token_length_order(model, questions):
+    """Indices that sort questions by token count (longest first), so each batch pads little."""
+    lengths = [len(ids) for ids in model.tokenizer(questions, truncation=True, max_length=model.max_seq_length)["input_ids"]]
+    return np.argsort(-np.asarray(lengths), kind="stable")
+
+
+def encode(model, questions, batch_size=256, pool=None):
+    if pool is not None:
+        return model.encode_multi_process(questions, pool, batch_size=batch_size)
+    return model.encode(questions, batch_size=batch_size, convert_to_numpy=True)
+
+
+def start_pool(model, workers):
+    # CPU process pool: each worker encodes whole batches of the sorted questions
+    return model.start_multi_process_pool(target_devices=["cpu"] * workers) if workers > 1 else None
+
+
+def open_cache(model, model_dir, cache_dir, cache_size, model_id=None):
+    if cache_dir is None:
+        return None
+    return EmbeddingCache(cache_dir, model_id or model_identifier(model_dir), model.get_sentence_embedding_dimension(), cache_size)
+
+
+def cached_lookup(cache, questions, dimension):
+    """(embeddings, missing indices); without a cache every question is missing."""
+    if cache is None:
+        return np.empty((len(questions), dimension), dtype=np.float32), np.arange(len(questions))
+    embeddings, found = cache.get_many(questions)
+    return embeddings, np.flatnonzero(~found)
+
+
+def embedding_question(model_dir, questions_list, batch_size=256, workers=0, chunk_size=100000,
+                       cache_dir=None, cache_size=2000000, model_id=None):
     print("Embedding questions...")
     model = SentenceTransformer(model_dir)
+    cache = open_cache(model, model_dir, cache_dir, cache_size, model_id)
 
-    emb_list = []
-    questions_num = len(questions_list)
+    questions = [item['question'] for item in questions_list]
+    embeddings, missing = cached_lookup(cache, questions, model.get_sentence_embedding_dimension())
+    missing_num = len(missing)
+    # Only questions missing from the cache are encoded
+    order = missing[token_length_order(model, [questions[i] for i in missing])] if missing_num else missing
 
+    pool = start_pool(model, workers) if missing_num else None
     start = time.time()
-
-    for i, item in enumerate(questions_list):
-        question_id = item['question_id']
-        question = item['question']
-        embedded_question = model.encode(question).tolist()
-        emb_list.append({"question_id": question_id, "question": question, "embedding": embedded_question})
-        if (i%1000 == 0 ): 
+    try:
+        for chunk_start in range(0, missing_num, chunk_size):
+            index = order[chunk_start:chunk_start + chunk_size]
+            chunk = [questions[i] for i in index]
+            embeddings[index] = encode(model, chunk, batch_size, pool)
+            if cache is not None:
+                cache.put_many(chunk, embeddings[index])
             end = time.time()
-            print(f"Embedding {i}/{questions_num}: {end-start:.2f} seconds elapsed.", flush=True)
-            start = end
-        
+            print(f"Embedding {chunk_start + len(index)}/{missing_num}: {end-start:.2f} seconds elapsed.", flush=True)
+    finally:
+        if pool is not None:
+            model.stop_multi_process_pool(pool)
+        if cache is not None:
+            cache.save()
+            print(cache.stats(), flush=True)
 
     print("Embedding questions done.")
-    return emb_list
+    return embeddings
 
 
-def store_embedding(emb_list, dir):
-    print("Storing embedded questions...")
-    embed_data = Dataset.from_list(emb_list)
-    embed_data.save_to_disk(f'{dir}_embedded_question_{len(questions_list)}')
-
-    print("Storing embedded questions done.")
-
-def store_embedding_test(emb_list, dir):
-    print("Storing embedded questions...")
-
-    features = Features({
-    	"question_id": Value("string"),
-	    "question": Value("string"),
-	    "embedding": Sequence(Value("float64")),
+def embedding_table(question_ids, questions, embeddings):
+    # float32 fixed-size list column built straight from the matrix (no per-element Python floats)
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    return pa.table({
+        "question_id": pa.array([str(question_id) for question_id in question_ids], type=pa.string()),
+        "question": pa.array(questions, type=pa.string()),
+        "embedding": pa.FixedSizeListArray.from_arrays(pa.array(embeddings.ravel()), embeddings.shape[1]),
     })
 
-    embed_data = Dataset.from_list(emb_list, features=features)
-    embed_data.save_to_disk(f'{dir}_embedded_question_{len(emb_list)}')
 
-    print("Storing embedded questions done.")
-    save_path = f'{dir}_embedded_question_{len(emb_list)}'
+def print_reloaded(save_path):
     reloaded = load_from_disk(save_path)
     print("Reloaded dataset:", reloaded)
     print("Features:", reloaded.features)
     print("Save path:", save_path)
 
 
+def store_embedding(questions_list, embeddings, dir):
+    print("Storing embedded questions...")
+
+    table = embedding_table([item['question_id'] for item in questions_list],
+                            [item['question'] for item in questions_list], embeddings)
+    embed_data = Dataset(table)
+    save_path = f'{dir}_embedded_question_{len(questions_list)}'
+    embed_data.save_to_disk(save_path)
+
+    print("Storing embedded questions done.")
+    print_reloaded(save_path)
+
+
+def stream_questions(dir, split, num, field="input", batch_size=10000, seed=42, stop=None):
+    """Yield (question ids, questions) Arrow batches for a seeded sample of `num` rows.
+
+    Only the id and question columns are read, and the sampled indices are
+    sorted so batches are read front to back instead of in random order.
+    """
+    dataset = load_from_disk(dir)[split]
+    count = min(num, len(dataset))
+    indices = np.sort(np.random.default_rng(seed).choice(len(dataset), count, replace=False))
+    column = field.split(".")[0]
+    arrow_dataset = dataset.select_columns(["id", column]).with_format("arrow")
+    for start in range(0, count, batch_size):
+        if stop is not None and stop.is_set():
+            return
+        table = arrow_dataset[indices[start:start + batch_size].tolist()]
+        questions = table.column(column).combine_chunks()
+        for name in field.split(".")[1:]:
+            questions = questions.field(name)
+        yield table.column("id").to_pylist(), questions.to_pylist()
+
+
+def stream_embedding(dir, split, num, model_dir, field="input", batch_size=256, workers=0, read_batch_size=10000,
+                     store_question=False, seed=42, cache_dir=None, cache_size=2000000, model_id=None):
+    """Pipelined load -> embed -> write with at most two batches queued between stages.
+
+    Batches are appended to an Arrow stream file as soon as they are embedded, then
+    saved as the usual `<dir>_embedded_question_<n>` (and `<dir>_question_<n>`) datasets
+    from that memory-mapped file, so memory stays constant in the number of questions.
+    """
+    print("Streaming questions into embeddings...")
+    model = SentenceTransformer(model_dir)
+    dimension = model.get_sentence_embedding_dimension()
+    cache = open_cache(model, model_dir, cache_dir, cache_size, model_id)
+    stream_file = f'{dir}_embedded_question.stream.arrow'
+    loaded = queue.Queue(maxsize=2)
+    encoded = queue.Queue(maxsize=2)
+    stop = threading.Event()
+
+    def read():
+        try:
+            for batch in stream_questions(dir, split, num, field, read_batch_size, seed, stop):
+                loaded.put(batch)
+        finally:
+            loaded.put(None)
+
+    def write():
+        writer = None
+        count = 0
+        try:
+            while (item := encoded.get()) is not None:
+                table = embedding_table(*item)
+                if writer is None:
+                    writer = pa.ipc.new_stream(stream_file, table.schema)
+                writer.write_table(table)
+                count += len(table)
+        except BaseException:
+            stop.set()
+            while encoded.get() is not None:
+                pass
+            raise
+        finally:
+            if writer is not None:
+                writer.close()
+        return count
+
+    pool = start_pool(model, workers)
+    start = time.time()
+    done = 0
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        reader = executor.submit(read)
+        writer = executor.submit(write)
+        try:
+            while (batch := loaded.get()) is not None:
+                question_ids, questions = batch
+                embeddings, missing = cached_lookup(cache, questions, dimension)
+                if len(missing):
+                    order = missing[token_length_order(model, [questions[i] for i in missing])]
+                    texts = [questions[i] for i in order]
+                    embeddings[order] = encode(model, texts, batch_size, pool)
+                    if cache is not None:
+                        cache.put_many(texts, embeddings[order])
+                encoded.put((question_ids, questions, embeddings))
+                done += len(questions)
+                print(f"Embedding {done}/{num}: {time.time()-start:.2f} seconds elapsed.", flush=True)
+        finally:
+            encoded.put(None)
+            if pool is not None:
+                model.stop_multi_process_pool(pool)
+            if cache is not None:
+                cache.save()
+                print(cache.stats(), flush=True)
+            # Let a blocked reader finish if embedding stopped early
+            stop.set()
+            while not reader.done():
+                try:
+                    loaded.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        reader.result()
+        count = writer.result()
+
+    if count == 0:
+        print("No questions to embed.")
+        return
+    print(f"Embedding questions done: {count} questions in {time.time()-start:.2f} seconds.")
+    embed_data = Dataset.from_file(stream_file)
+    save_path = f'{dir}_embedded_question_{count}'
+    embed_data.save_to_disk(save_path)
+    if store_question:
+        embed_data.select_columns(["question_id", "question"]).save_to_disk(f'{dir}_question_{count}')
+    del embed_data
+    os.remove(stream_file)
+    print("Storing embedded questions done.")
+    print_reloaded(save_path)
+
+
 def argument_parser():
     parser = argparse.ArgumentParser()
     ### Dataset
     parser.add_argument("--dataset-dir", type=str, help="directory of preprocessed question data")
     parser.add_argument("--split", type=str, default="validation")
     parser.add_argument("--question-num", type=int, default=None)
+    parser.add_argument("--question-field", type=str, default="input", help="Question column: 'input' (bioasq) or 'question.text' (NQ_default)")
     parser.add_argument("--store-question", action="store_true", default=False)
     parser.add_argument("--store-embedding", action="store_true", default=False)
+    parser.add_argument("--streaming", action="store_true", default=False,
+                        help="Seeded index sample read in Arrow batches, embedded and written batch by batch (implies --store-embedding)")
+    parser.add_argument("--read-batch-size", type=int, default=10000, help="Questions per Arrow batch in --streaming mode")
 
     parser.add_argument("--embedding-model-dir", type=str, help="Directory of the embedding model to use")
+    parser.add_argument("--batch-size", type=int, default=256, help="Questions per SentenceTransformer.encode batch")
+    parser.add_argument("--encode-workers", type=int, default=0, help="CPU encoder processes (start_multi_process_pool); 0/1 encodes in-process")
+    parser.add_argument("--embedding-cache-dir", type=str, default=None, help="Persistent embedding cache; only uncached questions are encoded")
+    parser.add_argument("--embedding-cache-size", type=int, default=2000000, help="Cached embeddings per model before LRU eviction")
+    parser.add_argument("--model-id", type=str, default=None, help="Cache key of the model (default: derived from the model directory)")
 
     args = parser.parse_args()
     return args
@@ -115,21 +298,25 @@ if __name__ == "__main__":
         num = args.question_num
     else:
         num = 1000000000 # max
-    # Load question dataset
-    questions_list = load_question(dataset_dir, split, num)
-
-    # store question list
-    if args.store_question:
-        store_question(questions_list, dataset_dir)
-    # print(questions_list)
 
-    # embed questions
-    emb_list = embedding_question(args.embedding_model_dir, questions_list)
-
-    # store embedding
-    if args.store_embedding:
-        store_embedding_test(emb_list, dataset_dir)
-
-    # print(emb_list)
-
-    
+    if args.streaming:
+        stream_embedding(dataset_dir, split, num, args.embedding_model_dir, args.question_field, args.batch_size,
+                         args.encode_workers, args.read_batch_size, args.store_question,
+                         cache_dir=args.embedding_cache_dir, cache_size=args.embedding_cache_size, model_id=args.model_id)
+    else:
+        # Load question dataset
+        questions_list = load_question(dataset_dir, split, num, args.question_field)
+
+        # store question list
+        if args.store_question:
+            store_question(questions_list, dataset_dir)
+        # print(questions_list)
+
+        # embed questions
+        embeddings = embedding_question(args.embedding_model_dir, questions_list, args.batch_size, args.encode_workers,
+                                        cache_dir=args.embedding_cache_dir, cache_size=args.embedding_cache_size,
+                                        model_id=args.model_id)
+
+        # store embedding
+        if args.store_embedding:
+            store_embedding(questions_list, embeddings, dataset_dir)
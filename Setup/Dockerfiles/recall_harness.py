@@ -0,0 +1,184 @@
+import os
+import csv
+import json
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datasets import load_from_disk
+from qdrant_client import models
+from build_vectorDB import embedding_matrix
+from embedding_pool import load_embedding_matrix
+from latency_histogram import LatencyHistogram
+from qdrant_transport import make_client, add_transport_arguments
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def topk(ids, scores, k):
+    """Row-wise top-k, highest score first."""
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    ids, scores = np.take_along_axis(ids, top, axis=1), np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def merge_topk(ids, scores, new_ids, new_scores, k):
+    return topk(np.concatenate((ids, new_ids), axis=1), np.concatenate((scores, new_scores), axis=1), k)
+
+
+def block_topk(queries, arrow_dataset, start, end, k, query_block):
+    """Exact cosine top-k of every query within collection rows [start, end) (point ids are row numbers)."""
+    vectors = normalize(embedding_matrix(arrow_dataset[start:end]))
+    ids = np.empty((len(queries), min(k, end - start)), dtype=np.int64)
+    scores = np.empty(ids.shape, dtype=np.float32)
+    for q in range(0, len(queries), query_block):
+        block_scores = queries[q:q + query_block] @ vectors.T
+        ids[q:q + query_block], scores[q:q + query_block] = topk(np.broadcast_to(np.arange(start, end), block_scores.shape),
+                                                                 block_scores, k)
+    return ids, scores
+
+
+def exact_topk(queries, dataset, k, block_size=100000, query_block=1024, threads=8, document_count=None):
+    """Blocked, multithreaded exact top-k over the collection vectors.
+
+    Each thread reads one block of rows and multiplies it with the queries
+    (NumPy's matmul releases the GIL); at most 2 x threads blocks are in flight,
+    so memory stays at O(threads x block_size x dim) plus the running top-k.
+    """
+    queries = normalize(queries)
+    total = min(len(dataset), document_count or len(dataset))
+    arrow_dataset = dataset.select_columns(["embedding"]).with_format("arrow")
+    ids = np.empty((len(queries), 0), dtype=np.int64)
+    scores = np.empty((len(queries), 0), dtype=np.float32)
+    blocks = iter(range(0, total, block_size))
+    pending = {}
+    start_time = time.time()
+    done_rows = 0
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        while True:
+            while len(pending) < 2 * threads:
+                start = next(blocks, None)
+                if start is None:
+                    break
+                end = min(start + block_size, total)
+                pending[executor.submit(block_topk, queries, arrow_dataset, start, end, k, query_block)] = end - start
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                block_ids, block_scores = future.result()
+                ids, scores = merge_topk(ids, scores, block_ids, block_scores, k)
+                done_rows += pending.pop(future)
+            print(f"Ground truth: {done_rows}/{total} vectors, {time.time() - start_time:.1f} s", flush=True)
+    return ids, scores
+
+
+def load_or_compute_ground_truth(path, queries, dataset, dataset_path, question_dir, k, document_count=1000000000,
+                                 block_size=100000, query_block=1024, threads=8):
+    """Exact top-k ids/scores from the .npz cache at `path` if it was computed for the same inputs, else compute and cache."""
+    meta = {"dataset_path": os.path.abspath(dataset_path), "question_dir": os.path.abspath(question_dir),
+            "documents": min(len(dataset), document_count), "queries": len(queries), "k": k}
+    if os.path.exists(path):
+        with np.load(path) as data:
+            if json.loads(str(data["meta"])) == meta:
+                print(f"Ground truth loaded from {path}", flush=True)
+                return data["ids"], data["scores"]
+        print(f"Ground truth in {path} was computed for other inputs, recomputing", flush=True)
+    ids, scores = exact_topk(queries, dataset, k, block_size, query_block, threads, document_count)
+    np.savez(path, ids=ids, scores=scores, meta=json.dumps(meta))
+    print(f"Ground truth saved to {path}", flush=True)
+    return ids, scores
+
+
+def recall_at(results, truth, k):
+    """Mean |result[:k] ∩ truth[:k]| / k over queries."""
+    hits = [len(set(result[:k] if result else []) & set(expected[:k].tolist())) for result, expected in zip(results, truth)]
+    return float(np.mean(hits)) / k if hits else float("nan")
+
+
+def run_queries(client, collection_name, queries, top_k, search_params, threads, timeout):
+    """Query every vector once; returns (per-query result ids, latency histogram, errors)."""
+    histogram = LatencyHistogram()
+    results = [[] for _ in range(len(queries))]
+    errors = 0
+
+    def query(i):
+        start = time.monotonic()
+        response = client.query_points(collection_name=collection_name, query=queries[i].tolist(), limit=top_k,
+                                       search_params=search_params, with_payload=False, timeout=timeout)
+        return i, time.monotonic() - start, [point.id for point in response.points]
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for future in [executor.submit(query, i) for i in range(len(queries))]:
+            try:
+                i, latency, ids = future.result()
+            except Exception as e:
+                errors += 1
+                print(f"Query failed: {e}", flush=True)
+                continue
+            histogram.record(latency)
+            results[i] = ids
+    return results, histogram, errors
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset-path", type=str, default="/app/wiki_test", help="Dataset the collection was built from (embedding column)")
+    parser.add_argument("--document-count", type=int, default=1000000000, help="Same --document-count as build_vectorDB.py")
+    parser.add_argument("--question-dir", type=str, required=True, help="Embedded question dataset (same order as the load generators)")
+    parser.add_argument("--query-count", type=int, default=1000, help="Questions to evaluate")
+    parser.add_argument("--collection-name", type=str, default="wiki_passages")
+    parser.add_argument("--qdrant-host", type=str, default="172.26.0.1")
+    parser.add_argument("--qdrant-port", type=int, default=6333)
+    add_transport_arguments(parser)
+    parser.add_argument("--top-k", type=int, default=5, help="Results per query (recall@k)")
+    parser.add_argument("--ef", type=int, nargs="+", default=[64, 128, 256, 512, 768], help="hnsw_ef values to sweep")
+    parser.add_argument("--with-exact", action="store_true", default=False, help="Also run the server's exact search as a check")
+    parser.add_argument("--ground-truth", type=str, default=None,
+                        help="Ground-truth cache (default: <question-dir>_groundtruth_q<count>_k<top-k>.npz)")
+    parser.add_argument("--block-size", type=int, default=100000, help="Collection vectors per ground-truth block")
+    parser.add_argument("--query-block", type=int, default=1024, help="Queries per matrix multiply")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(), help="Ground-truth threads")
+    parser.add_argument("--search-threads", type=int, default=8, help="Concurrent queries per sweep point")
+    parser.add_argument("--timeout", type=int, default=30, help="Query timeout (s)")
+    parser.add_argument("--output", type=str, default=None, help="Write the sweep results to this CSV")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argument_parser()
+
+    queries = load_embedding_matrix(args.question_dir)[:args.query_count]
+    dataset = load_from_disk(args.dataset_path)
+    ground_truth_file = args.ground_truth or f"{args.question_dir.rstrip('/')}_groundtruth_q{len(queries)}_k{args.top_k}.npz"
+    truth, _ = load_or_compute_ground_truth(ground_truth_file, queries, dataset, args.dataset_path, args.question_dir, args.top_k,
+                                            args.document_count, args.block_size, args.query_block, args.threads)
+
+    client = make_client(args.qdrant_host, args.qdrant_port, args.transport, args.grpc_port)
+    sweep = [(f"ef={ef}", models.SearchParams(hnsw_ef=ef, exact=False)) for ef in args.ef]
+    if args.with_exact:
+        sweep.append(("exact", models.SearchParams(exact=True)))
+
+    rows = []
+    print(f"{'search':>10} {'recall@1':>9} {f'recall@{args.top_k}':>9} {'mean':>8} {'P50':>8} {'P99':>8} {'errors':>7}")
+    for name, search_params in sweep:
+        results, histogram, errors = run_queries(client, args.collection_name, queries, args.top_k, search_params,
+                                                 args.search_threads, args.timeout)
+        s = histogram.summary()
+        row = {"search": name, "recall@1": recall_at(results, truth, 1), f"recall@{args.top_k}": recall_at(results, truth, args.top_k),
+               "mean": s["mean"], "p50": s["p50"], "p99": s["p99"], "errors": errors}
+        rows.append(row)
+        print(f"{name:>10} {row['recall@1']:>9.4f} {row[f'recall@{args.top_k}']:>9.4f} {s['mean']:>8.4f} "
+              f"{s['p50']:>8.4f} {s['p99']:>8.4f} {errors:>7}", flush=True)
+
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Sweep results saved to {args.output}")
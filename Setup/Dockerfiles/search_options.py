@@ -0,0 +1,39 @@
+from qdrant_client import models
+
+# Settings the load generators used to hard-code
+DEFAULT_HNSW_EF = 768
+DEFAULT_TOP_K = 5
+RESCORE = {"default": None, "on": True, "off": False}  # default: leave it to the server
+
+
+def make_search_params(hnsw_ef=DEFAULT_HNSW_EF, exact=False, rescore=None, oversampling=None):
+    """SearchParams for query_points; quantization params are only sent when rescore/oversampling is set."""
+    quantization = None
+    if rescore is not None or oversampling is not None:
+        quantization = models.QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+    return models.SearchParams(hnsw_ef=hnsw_ef, exact=exact, quantization=quantization)
+
+
+def search_params_from_args(args):
+    return make_search_params(args.hnsw_ef, args.exact, RESCORE[args.rescore], args.oversampling)
+
+
+def describe_search(search_params, top_k):
+    quantization = search_params.quantization
+    text = "exact" if search_params.exact else f"ef={search_params.hnsw_ef}"
+    text += f" k={top_k}"
+    if quantization is not None:
+        if quantization.rescore is not None:
+            text += f" rescore={'on' if quantization.rescore else 'off'}"
+        if quantization.oversampling is not None:
+            text += f" oversampling={quantization.oversampling:g}"
+    return text
+
+
+def add_search_arguments(parser):
+    parser.add_argument("--hnsw-ef", type=int, default=DEFAULT_HNSW_EF, help="hnsw_ef of every query")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K, help="Results per query (limit)")
+    parser.add_argument("--exact", action="store_true", default=False, help="Exact (full scan) search instead of HNSW")
+    parser.add_argument("--rescore", type=str, choices=tuple(RESCORE), default="default",
+                        help="Rescore quantized results with the original vectors (default: server setting)")
+    parser.add_argument("--oversampling", type=float, default=None, help="Quantization oversampling factor (default: server setting)")
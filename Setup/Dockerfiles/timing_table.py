@@ -0,0 +1,127 @@
+import os
+import time
+import threading
+import numpy as np
+from latency_histogram import LatencyHistogram, save_histograms
+
+SLO_POLICIES = ("abort", "count", "drop")
+
+
+class TimingTable:
+    """Per-query timestamps in preallocated float64 arrays, indexed by query id.
+
+    Slots hold the intended send, actual send, first-token and completion times
+    (time.monotonic(), NaN until set). Every update takes one lock, so callbacks
+    from any thread can't race the sender, and the cost per query stays constant.
+    A TTFT at or above `ttft_slo` seconds is handled by `slo_policy`:
+    abort exits the process (the old behaviour), count keeps it in the results,
+    drop leaves it out of the latency results. Violations are counted either way.
+    """
+
+    def __init__(self, query_count, ttft_slo=30.0, slo_policy="abort"):
+        if slo_policy not in SLO_POLICIES:
+            raise ValueError(f"Unknown SLO policy {slo_policy}, expected one of {SLO_POLICIES}")
+        self.query_count = query_count
+        self.ttft_slo = ttft_slo
+        self.slo_policy = slo_policy
+        self.intended = np.full(query_count, np.nan)
+        self.start = np.full(query_count, np.nan)
+        self.first_token = np.full(query_count, np.nan)
+        self.complete = np.full(query_count, np.nan)
+        self.violated = np.zeros(query_count, dtype=bool)
+        self.unknown = 0  # callbacks for ids outside the table
+        self.lock = threading.Lock()
+
+    def _slot(self, query_id):
+        query_id = int(query_id)
+        if 0 <= query_id < self.query_count:
+            return query_id
+        self.unknown += 1
+        return None
+
+    def mark_start(self, query_id, intended_time=None):
+        now = time.monotonic()
+        with self.lock:
+            slot = self._slot(query_id)
+            if slot is not None:
+                self.start[slot] = now
+                self.intended[slot] = np.nan if intended_time is None else intended_time
+        return now
+
+    def mark_ttft(self, query_id):
+        """Record the first token of a query and return its TTFT (None when unknown or not started)."""
+        now = time.monotonic()
+        with self.lock:
+            slot = self._slot(query_id)
+            if slot is None or not np.isnan(self.first_token[slot]):
+                return None
+            self.first_token[slot] = now
+            ttft = now - self.start[slot]
+            if np.isnan(ttft):
+                return None
+            if ttft >= self.ttft_slo:
+                self.violated[slot] = True
+        if ttft >= self.ttft_slo:
+            print(f"TTFT is higher than {self.ttft_slo:g} sec, Current TTFT is {ttft:.4f} seconds", flush=True)
+            if self.slo_policy == "abort":
+                os._exit(1)
+        return ttft
+
+    def mark_complete(self, query_id):
+        now = time.monotonic()
+        with self.lock:
+            slot = self._slot(query_id)
+            if slot is not None and np.isnan(self.complete[slot]):
+                self.complete[slot] = now
+        return now
+
+    def snapshot(self):
+        with self.lock:
+            return {"intended": self.intended.copy(), "start": self.start.copy(), "first_token": self.first_token.copy(),
+                    "complete": self.complete.copy(), "violated": self.violated.copy()}
+
+    def histograms(self):
+        """TTFT, corrected TTFT (from the intended send) and query time, without dropped queries."""
+        timings = self.snapshot()
+        keep = ~timings["violated"] if self.slo_policy == "drop" else np.ones(self.query_count, dtype=bool)
+        histograms = {name: LatencyHistogram() for name in ("ttft", "corrected_ttft", "query_time")}
+        histograms["ttft"].record_many((timings["first_token"] - timings["start"])[keep])
+        histograms["corrected_ttft"].record_many((timings["first_token"] - timings["intended"])[keep])
+        histograms["query_time"].record_many((timings["complete"] - timings["start"])[keep])
+        return histograms
+
+    def report(self, histogram_output=None, timings_output=None):
+        end_time = time.monotonic()
+        timings = self.snapshot()
+        sent = ~np.isnan(timings["start"])
+        print("\nTTFT Summary:")
+        if not sent.any():
+            print("No queries processed.")
+            return
+        total_duration = end_time - np.nanmin(timings["start"])
+        sent_count = int(sent.sum())
+        answered = int(np.count_nonzero(~np.isnan(timings["first_token"])))
+        completed = int(np.count_nonzero(~np.isnan(timings["complete"])))
+        violations = int(timings["violated"].sum())
+        print(f"Total execution time: {total_duration:.4f} seconds")
+        print(f"RPS : {sent_count / total_duration:.4f} requests/second\n")
+        print(f"Sent: {sent_count}/{self.query_count}, TTFT received: {answered}, completed: {completed}, "
+              f"unknown query ids: {self.unknown}")
+        print(f"TTFT SLO {self.ttft_slo:g} s violations: {violations} ({violations / sent_count * 100:.2f}% of sent, "
+              f"policy {self.slo_policy})")
+        histograms = self.histograms()
+        histograms["query_time"].print_summary("Query time")
+        histograms["ttft"].print_summary("TTFT")
+        histograms["corrected_ttft"].print_summary("TTFT from intended start (corrected)")
+        if histogram_output:
+            save_histograms(histogram_output, histograms)
+        if timings_output:
+            np.savez(timings_output, ttft_slo=self.ttft_slo, **timings)
+            print(f"Per-query timings saved to {timings_output}", flush=True)
+
+
+def add_slo_arguments(parser):
+    parser.add_argument("--ttft-slo", type=float, default=30.0, help="TTFT service level objective in seconds")
+    parser.add_argument("--slo-policy", type=str, default="abort", choices=SLO_POLICIES,
+                        help="On a TTFT SLO violation: abort the run, count it, or drop it from the latency results")
+    parser.add_argument("--timings-output", type=str, default=None, help="Write the per-query timing table to this .npz file")
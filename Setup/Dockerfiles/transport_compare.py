@@ -0,0 +1,95 @@
+import csv
+import time
+import asyncio
+import argparse
+from open_loop import merge_run_stats, client_cpu_per_request
+from arrival_process import add_arrival_arguments, intervals_from_args, report_intervals
+from embedding_pool import load_embedding_matrix
+from search_options import search_params_from_args, describe_search, add_search_arguments
+from query_batcher import add_batch_arguments
+from load_generator import main_process
+from qdrant_transport import add_transport_arguments
+
+
+def transport_row(transport, stats):
+    stats = merge_run_stats([stats])
+    histograms = {name: h.summary() for name, h in stats["histograms"].items()}
+    achieved_rps = 0.0
+    if stats["sent"] > 1 and stats["last_sent"] > stats["first_sent"]:
+        achieved_rps = stats["sent"] / (stats["last_sent"] - stats["first_sent"])
+    return {
+        "transport": transport,
+        "achieved_rps": achieved_rps,
+        "completed": stats["completed"],
+        "errors": stats["sent"] - stats["completed"],
+        "client_cpu_ms": client_cpu_per_request(stats) * 1000,
+        "p50": histograms["latency"]["p50"],
+        "p99": histograms["latency"]["p99"],
+        "corrected_p50": histograms["corrected_latency"]["p50"],
+        "corrected_p99": histograms["corrected_latency"]["p99"],
+    }
+
+
+def print_report(rows):
+    print(f"\n{'transport':<10} {'RPS':>8} {'errors':>7} {'CPU ms/req':>10} {'P50':>8} {'P99':>8} {'cP50':>8} {'cP99':>8}")
+    for row in rows:
+        print(f"{row['transport']:<10} {row['achieved_rps']:>8.1f} {row['errors']:>7} {row['client_cpu_ms']:>10.3f} "
+              f"{row['p50']:>8.4f} {row['p99']:>8.4f} {row['corrected_p50']:>8.4f} {row['corrected_p99']:>8.4f}")
+    print("CPU ms/req = client process CPU per completed request (cP = latency from the intended start)", flush=True)
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset-dir", type=str, required=True, help="Embedded question dataset (as for load_generator.py)")
+    parser.add_argument("--collection-name", type=str, required=True, help="Target collection name")
+    parser.add_argument("--target-rps", type=float, required=True, help="Target requests per second of every run")
+    parser.add_argument("--requests-count", type=int, required=True, help="Requests per run")
+    parser.add_argument("--qdrant-host", type=str, default="172.26.0.1")
+    parser.add_argument("--qdrant-port", type=int, default=6333, help="Qdrant REST port")
+    add_transport_arguments(parser, transport=False)
+    parser.add_argument("--transports", type=str, nargs="+", choices=("rest", "grpc"), default=["rest", "grpc"], help="Transports to run, in order")
+    parser.add_argument("--cooldown", type=float, default=5.0, help="Seconds between runs so queued work drains")
+    parser.add_argument("--output", type=str, default=None, help="Write every run to this CSV")
+    add_search_arguments(parser)
+    add_batch_arguments(parser)
+    add_arrival_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argument_parser()
+
+    dataset = load_embedding_matrix(args.dataset_dir)
+    search_params = search_params_from_args(args)
+    print(f"Search: {describe_search(search_params, args.top_k)}", flush=True)
+
+    # One arrival trace and one process, replayed for every transport
+    intervals = intervals_from_args(args, args.target_rps, args.requests_count)
+    report_intervals(intervals, args.target_rps, args.arrival_process)
+
+    rows = []
+    for n, transport in enumerate(args.transports):
+        print(f"Run {n + 1}/{len(args.transports)}: {transport}", flush=True)
+        stats = asyncio.run(main_process(args.collection_name, dataset, args.target_rps, intervals,
+                                         qdrant_host=args.qdrant_host, qdrant_port=args.qdrant_port,
+                                         search_params=search_params, top_k=args.top_k,
+                                         batch_window_ms=args.batch_window_ms, max_batch=args.max_batch,
+                                         transport=transport, grpc_port=args.grpc_port, grpc_channels=args.grpc_channels))
+        if stats is None:
+            print(f"  {transport}: collection check failed, skipped", flush=True)
+            continue
+        row = transport_row(transport, stats)
+        rows.append(row)
+        print(f"  {row['achieved_rps']:.1f} RPS, {row['client_cpu_ms']:.3f} ms CPU per request, "
+              f"corrected P99 {row['corrected_p99']:.4f} s", flush=True)
+        if n + 1 < len(args.transports):
+            time.sleep(args.cooldown)
+
+    if rows:
+        print_report(rows)
+    if args.output and rows:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Transport comparison saved to {args.output}")
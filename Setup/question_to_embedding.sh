@@ -27,4 +27,5 @@ docker run -it --rm \
                             --dataset-dir=$DATASET_PATH \
                             --embedding-model-dir=/app/embedding_model \
                             --split='train' \
+                            --embedding-cache-dir=/app/Data/embedding_cache \
                             --store-question --store-embedding
\ No newline at end of file